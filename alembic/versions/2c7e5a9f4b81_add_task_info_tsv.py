@@ -0,0 +1,46 @@
+"""add task info_tsv search vector
+
+Revision ID: 2c7e5a9f4b81
+Revises: b6e3f9a1d204
+Create Date: 2026-10-19 18:42:31.207654
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2c7e5a9f4b81'
+down_revision = 'b6e3f9a1d204'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+def execute_autocommit(statements):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so the
+    # one of the migration is committed and they run on a connection of
+    # their own
+    op.execute('COMMIT')
+    conn = op.get_bind().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+    try:
+        for statement in statements:
+            conn.execute(statement)
+    finally:
+        conn.close()
+
+
+def upgrade():
+    # Built for the existing tasks by the index_task_info_tsv job
+    op.add_column('task', sa.Column('info_tsv', TSVECTOR))
+    execute_autocommit([
+        '''CREATE INDEX CONCURRENTLY IF NOT EXISTS task_info_tsv_idx
+           ON task USING gin (info_tsv)''',
+        '''CREATE INDEX CONCURRENTLY IF NOT EXISTS task_info_tsv_missing_idx
+           ON task (project_id) WHERE info_tsv IS NULL'''])
+
+
+def downgrade():
+    execute_autocommit([
+        'DROP INDEX CONCURRENTLY IF EXISTS task_info_tsv_missing_idx',
+        'DROP INDEX CONCURRENTLY IF EXISTS task_info_tsv_idx'])
+    op.drop_column('task', 'info_tsv')
@@ -0,0 +1,22 @@
+"""add pg_trgm extension
+
+Revision ID: 3c5e2b7a9d41
+Revises: 2edf951cc6ae
+Create Date: 2026-10-19 10:12:31.204118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c5e2b7a9d41'
+down_revision = '2edf951cc6ae'
+
+from alembic import op
+
+
+def upgrade():
+    # trigram operator classes used by the per project task.info indexes
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def downgrade():
+    op.execute('DROP EXTENSION IF EXISTS pg_trgm')
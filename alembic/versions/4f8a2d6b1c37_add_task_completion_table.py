@@ -0,0 +1,41 @@
+"""add task completion table
+
+Revision ID: 4f8a2d6b1c37
+Revises: 9e4b1c7d2a58
+Create Date: 2026-10-19 16:02:44.118570
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2d6b1c37'
+down_revision = '9e4b1c7d2a58'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('task_completion',
+                    sa.Column('id', sa.BigInteger, primary_key=True),
+                    sa.Column('created', sa.Text),
+                    sa.Column('task_id', sa.Integer,
+                              sa.ForeignKey('task.id', ondelete='CASCADE'),
+                              nullable=False),
+                    sa.Column('project_id', sa.Integer,
+                              sa.ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                              nullable=False),
+                    )
+    op.create_index('task_completion_project_id_idx', 'task_completion',
+                    ['project_id', 'id'])
+    # Log the tasks completed so far, so that tailing from 0 returns them
+    op.execute('''
+        INSERT INTO task_completion (created, task_id, project_id)
+        SELECT to_char(now() at time zone 'utc',
+                       'YYYY-MM-DD"T"HH24:MI:SS.US'), id, project_id
+        FROM task WHERE state='completed' ORDER BY id;
+        ''')
+
+
+def downgrade():
+    op.drop_table('task_completion')
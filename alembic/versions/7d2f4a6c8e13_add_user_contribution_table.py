@@ -0,0 +1,50 @@
+"""add user contribution table
+
+Revision ID: 7d2f4a6c8e13
+Revises: 3c5e2b7a9d41
+Create Date: 2026-10-19 14:05:47.512309
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7d2f4a6c8e13'
+down_revision = '3c5e2b7a9d41'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('user_contribution',
+                    sa.Column('user_id', sa.Integer,
+                              sa.ForeignKey('user.id', ondelete='CASCADE'),
+                              primary_key=True),
+                    sa.Column('project_id', sa.Integer,
+                              sa.ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True),
+                    sa.Column('n_task_runs', sa.Integer, default=0,
+                              nullable=False),
+                    sa.Column('first_submission_date', sa.Text),
+                    sa.Column('last_submission_date', sa.Text),
+                    sa.Column('total_time', sa.Interval),
+                    sa.Column('timed_runs', sa.Integer, default=0,
+                              nullable=False),
+                    )
+    op.create_index('user_contribution_project_id_idx', 'user_contribution',
+                    ['project_id'])
+    op.execute('''
+        INSERT INTO user_contribution (user_id, project_id, n_task_runs,
+            first_submission_date, last_submission_date, total_time,
+            timed_runs)
+        SELECT user_id, project_id, COUNT(*), MIN(finish_time),
+               MAX(finish_time), SUM({0}), COUNT({0})
+        FROM task_run WHERE user_id IS NOT NULL
+        GROUP BY user_id, project_id;
+        '''.format('''(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
+                   to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US'))'''))
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS users_report_stats')
+
+
+def downgrade():
+    op.drop_table('user_contribution')
@@ -0,0 +1,37 @@
+"""add gin index on task fav_user_ids
+
+Revision ID: 9e4b1c7d2a58
+Revises: 7d2f4a6c8e13
+Create Date: 2026-10-19 15:21:09.803412
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e4b1c7d2a58'
+down_revision = '7d2f4a6c8e13'
+
+from alembic import op
+
+
+def execute_autocommit(statement):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so the
+    # one of the migration is committed and it runs on a connection of its
+    # own
+    op.execute('COMMIT')
+    conn = op.get_bind().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+    try:
+        conn.execute(statement)
+    finally:
+        conn.close()
+
+
+def upgrade():
+    execute_autocommit('''CREATE INDEX CONCURRENTLY IF NOT EXISTS
+                          task_fav_user_ids_idx ON task
+                          USING gin (fav_user_ids)''')
+
+
+def downgrade():
+    execute_autocommit('DROP INDEX CONCURRENTLY IF EXISTS '
+                       'task_fav_user_ids_idx')
@@ -0,0 +1,41 @@
+"""add change feed tables
+
+Revision ID: b6e3f9a1d204
+Revises: 4f8a2d6b1c37
+Create Date: 2026-10-19 16:48:12.640291
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3f9a1d204'
+down_revision = '4f8a2d6b1c37'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('change_sequence',
+                    sa.Column('project_id', sa.Integer,
+                              sa.ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True),
+                    sa.Column('seq', sa.BigInteger, nullable=False,
+                              default=0),
+                    )
+    op.create_table('change_event',
+                    sa.Column('project_id', sa.Integer,
+                              sa.ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                              primary_key=True),
+                    sa.Column('seq', sa.BigInteger, primary_key=True),
+                    sa.Column('created', sa.Text),
+                    sa.Column('object_type', sa.Text, nullable=False),
+                    sa.Column('object_id', sa.Integer, nullable=False),
+                    sa.Column('action', sa.Text, nullable=False),
+                    )
+
+
+def downgrade():
+    op.drop_table('change_event')
+    op.drop_table('change_sequence')
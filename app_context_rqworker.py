@@ -23,14 +23,15 @@ import sys
 import time
 from traceback import print_exc
 
-from rq import Queue, Connection, Worker
+from rq import Queue, Connection
 from rq.worker import logger
 
 logger.setLevel(logging.DEBUG)
 
 from pybossa.core import create_app, sentinel
+from pybossa.worker_pool import run_pool, InstrumentedWorker
 
-app = create_app(run_as_server=False)
+app = create_app(run_as_server=False, web=False)
 
 def retry(max_count):
     def decorator(func):
@@ -50,7 +51,7 @@ def retry(max_count):
 
 @contextmanager
 def get_worker(queues):
-    worker = Worker(queues)
+    worker = InstrumentedWorker(queues)
     try:
         yield worker
     finally:
@@ -65,8 +66,11 @@ def run_worker(queues):
 
 # Provide queue names to listen to as arguments to this script,
 # similar to rqworker
-with app.app_context():
-    with Connection(sentinel.master):
-        qs = map(Queue, sys.argv[1:]) or [Queue()]
+if app.config.get('RQ_WORKER_CONCURRENCY'):
+    run_pool(app, sys.argv[1:] or ['default'])
+else:
+    with app.app_context():
+        with Connection(sentinel.master):
+            qs = map(Queue, sys.argv[1:]) or [Queue()]
 
-        run_worker(qs)
+            run_worker(qs)
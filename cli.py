@@ -667,6 +667,63 @@ def anonymize_ips():
         tr.user_ip = anonymizer.ip(tr.user_ip)
         task_repo.update(tr)
 
+def partition_task_runs(step, *args):
+    """Partition task_run by project: prepare, backfill [start_id] or swap."""
+    from pybossa import partitioning
+
+    with app.app_context():
+        conn = db.engine.connect()
+        if step == 'prepare':
+            partitioning.prepare(conn)
+            print "Writes to task_run are mirrored, run the backfill"
+        elif step == 'backfill':
+            def progress(done, total):
+                print "Copied task runs up to id %s of %s" % (done, total)
+            start_id = int(args[0]) if args else 0
+            partitioning.backfill(conn, start_id, progress=progress)
+        elif step == 'swap':
+            views = partitioning.swap(conn)
+            print "task_run is partitioned, dropped views: %s" % views
+            print "Drop %s when no longer needed" % partitioning.OLD_TABLE
+        else:
+            print "Unknown step %s" % step
+        conn.close()
+
+def add_project_partition(project_id):
+    """Move the task runs of a project to a task_run partition of its own."""
+    from pybossa import partitioning
+
+    with app.app_context():
+        conn = db.engine.connect()
+        print "Created %s" % partitioning.add_project_partition(conn,
+                                                                 project_id)
+        conn.close()
+
+def detach_project_partition(project_id):
+    """Detach the task_run partition of a project, keeping its table."""
+    from pybossa import partitioning
+
+    with app.app_context():
+        conn = db.engine.connect()
+        with conn.begin():
+            name = partitioning.drop_project_partition(conn, project_id,
+                                                       detach_only=True)
+        print "Detached %s" % name
+        conn.close()
+
+def drop_project_partition(project_id):
+    """Detach and drop the task_run partition of a project, e.g. one left
+    empty when the project was deleted. It locks task_run, so run it off
+    peak."""
+    from pybossa import partitioning
+
+    with app.app_context():
+        conn = db.engine.connect()
+        with conn.begin():
+            name = partitioning.drop_project_partition(conn, project_id)
+        print "Dropped %s" % name
+        conn.close()
+
 ## ==================================================
 ## Misc stuff for setting up a command line interface
 
@@ -28,6 +28,7 @@ This package adds GET, POST, PUT and DELETE methods for:
     * vmcp
     * completedtasks
     * completedtaskruns
+    * changes
 
 """
 
@@ -57,6 +58,7 @@ from blogpost import BlogpostAPI
 from category import CategoryAPI
 from vmcp import VmcpAPI
 from favorites import FavoritesAPI
+from changes import ChangesAPI
 from user import UserAPI
 from token import TokenAPI
 from result import ResultAPI
@@ -132,8 +134,22 @@ register_api(FavoritesAPI, 'api_favorites', '/favorites',
 register_api(TokenAPI, 'api_token', '/token', pk='token', pk_type='string')
 register_api(CompletedTaskAPI, 'api_completedtask', '/completedtask', pk='oid', pk_type='int')
 register_api(CompletedTaskRunAPI, 'api_completedtaskrun', '/completedtaskrun', pk='oid', pk_type='int')
+register_api(ChangesAPI, 'api_changes', '/changes', pk='oid', pk_type='int')
 register_api(ProjectByNameAPI, 'api_projectbyname', '/projectbyname', pk='key', pk_type='string')
 
+stream_apis = {'task': TaskAPI, 'taskrun': TaskRunAPI, 'result': ResultAPI}
+
+
+@blueprint.route('/<any(task, taskrun, result):api_name>/stream')
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def stream_api(api_name):
+    """Stream all the items of an API as newline delimited JSON.
+
+    The whole stream counts as a single request for the rate limit.
+
+    """
+    return stream_apis[api_name]().stream()
+
 
 def add_task_signature(tasks):
     if current_app.config.get('ENABLE_ENCRYPTION'):
@@ -157,15 +173,9 @@ def new_task(project_id):
         # If there is a task for the user, return it
         if tasks is not None:
             guard = ContributionsGuard(sentinel.master, timeout=timeout)
-            for task in tasks:
-                guard.stamp(task, user_id_or_ip)
-                if not guard.check_task_presented_timestamp(task, user_id_or_ip):
-                    guard.stamp_presented_time(task, user_id_or_ip)
-                else:
-                    # user returning back for the same task
-                    # original presented time has not expired yet
-                    # to continue original presented time, extend expiry
-                    guard.extend_task_presented_timestamp_expiry(task, user_id_or_ip)
+            # A user returning back for the same task keeps the original
+            # presented time, with its expiry extended
+            guard.stamp_many(tasks, user_id_or_ip)
 
             data = [task.dictize() for task in tasks]
             add_task_signature(data)
@@ -339,6 +349,14 @@ def get_disqus_sso_api():
         return error.format_exception(e, target='DISQUS_SSO', action='GET')
 
 
+@csrf.exempt
+@blueprint.route('/taskrun/bulk', methods=['POST'])
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def bulk_taskrun():
+    """Post a list of task runs in a single request."""
+    return TaskRunAPI().post_bulk()
+
+
 @jsonpify
 @csrf.exempt
 @blueprint.route('/task/<int:task_id>/canceltask', methods=['POST'])
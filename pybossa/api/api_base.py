@@ -27,7 +27,9 @@ This package adds GET, POST, PUT and DELETE methods for any class:
 
 """
 import json
+from collections import defaultdict
 from flask import request, abort, Response, current_app
+from flask import stream_with_context
 from flask.ext.login import current_user
 from flask.views import MethodView
 from werkzeug.exceptions import NotFound, Unauthorized, Forbidden, BadRequest
@@ -94,6 +96,10 @@ class APIBase(MethodView):
 
     immutable_keys = set([])
 
+    # Whether reading an item only depends on the project it belongs to,
+    # so that listings can authorize once per project
+    auth_per_project = False
+
     def refresh_cache(self, cls_name, oid):
         """Refresh the cache."""
         if caching.get(cls_name):
@@ -136,32 +142,38 @@ class APIBase(MethodView):
     def _create_json_response(self, query_result, oid):
         if len(query_result) == 1 and query_result[0] is None:
             raise abort(404)
-        items = []
+        rows = []
         for result in query_result:
             # This is for n_favs orderby case
             if not isinstance(result, DomainObject):
                 if 'n_favs' in result.keys():
                     result = result[0]
+            if (result.__class__ != self.__class__):
+                rows.append(result)
+            else:
+                rows.append((result, None, None))
+        related = None
+        if request.args.get('related'):
+            related = self._load_related([item for item, _, _ in rows])
+        if self.auth_per_project:
+            # The identity map of the session is weak, so they are kept for
+            # the request and the auth classes find them there
+            self._listed_projects = project_repo.get_projects(
+                set(item.project_id for item, _, _ in rows))
+        auth_cache = {}
+        items = []
+        for item, headline, rank in rows:
             try:
-                if (result.__class__ != self.__class__):
-                    (item, headline, rank) = result
-                else:
-                    item = result
-                    headline = None
-                    rank = None
-                if not self._verify_auth(item):
+                if not self._is_authorized_item(item, auth_cache):
                     continue
-                datum = self._create_dict_from_model(item)
+                datum = self._create_dict_from_model(item, related)
                 if headline:
                     datum['headline'] = headline
                 if rank:
                     datum['rank'] = rank
-                ensure_authorized_to('read', item)
                 items.append(datum)
             except (Forbidden, Unauthorized):
-                # Remove last added item, as it is 401 or 403
-                if len(items) > 0:
-                    items.pop()
+                pass
             except Exception:  # pragma: no cover
                 raise
         if oid is not None:
@@ -172,41 +184,73 @@ class APIBase(MethodView):
             items = items[0]
         return json.dumps(items)
 
-    def _create_dict_from_model(self, model):
-        return self._select_attributes(self._add_hateoas_links(model))
-
-    def _add_hateoas_links(self, item):
+    def _is_authorized_item(self, item, auth_cache):
+        """Return whether the item can be listed, raising as
+        ensure_authorized_to does. When the decision only depends on the
+        project of the item, it is computed once per project."""
+        key = item.project_id if self.auth_per_project else None
+        if key is None or key not in auth_cache:
+            try:
+                decision = self._verify_auth(item) and \
+                    ensure_authorized_to('read', item)
+            except (Forbidden, Unauthorized) as e:
+                decision = e
+            if key is not None:
+                auth_cache[key] = decision
+        else:
+            decision = auth_cache[key]
+        if isinstance(decision, Exception):
+            raise decision
+        return decision
+
+    def _create_dict_from_model(self, model, related=None):
+        return self._select_attributes(self._add_hateoas_links(model, related))
+
+    def _load_related(self, items):
+        """Load the task runs, results and tasks related to a list of items
+        with one query per kind of object."""
+        cls_name = self.__class__.__name__
+        related = dict(task_runs=defaultdict(list), results={}, tasks={})
+        if cls_name == 'Task':
+            task_ids = set(item.id for item in items)
+        elif cls_name in ('TaskRun', 'Result'):
+            task_ids = set(item.task_id for item in items)
+        else:
+            return related
+        if cls_name in ('Task', 'Result'):
+            for tr in task_repo.get_task_runs_by_task_ids(task_ids):
+                related['task_runs'][tr.task_id].append(tr)
+        if cls_name in ('Task', 'TaskRun'):
+            for r in result_repo.get_last_versions_by_task_ids(task_ids):
+                related['results'][r.task_id] = r
+        if cls_name in ('TaskRun', 'Result'):
+            for t in task_repo.get_tasks_by_ids(task_ids):
+                related['tasks'][t.id] = t
+        return related
+
+    def _add_hateoas_links(self, item, related=None):
         obj = item.dictize()
-        related = request.args.get('related')
-        if related:
+        if request.args.get('related'):
+            if related is None:
+                related = self._load_related([item])
             if item.__class__.__name__ == 'Task':
-                obj['task_runs'] = []
-                obj['result'] = None
-                task_runs = task_repo.filter_task_runs_by(task_id=item.id)
-                results = result_repo.filter_by(task_id=item.id, last_version=True)
-                for tr in task_runs:
-                    obj['task_runs'].append(tr.dictize())
-                for r in results:
-                    obj['result'] = r.dictize()
+                obj['task_runs'] = [tr.dictize() for tr in
+                                    related['task_runs'][item.id]]
+                result = related['results'].get(item.id)
+                obj['result'] = result.dictize() if result else None
 
             if item.__class__.__name__ == 'TaskRun':
-                tasks = task_repo.filter_tasks_by(id=item.task_id)
-                results = result_repo.filter_by(task_id=item.task_id, last_version=True)
-                obj['task'] = None
-                obj['result'] = None
-                for t in tasks:
-                    obj['task'] = t.dictize()
-                for r in results:
-                    obj['result'] = r.dictize()
+                task = related['tasks'].get(item.task_id)
+                result = related['results'].get(item.task_id)
+                obj['task'] = task.dictize() if task else None
+                obj['result'] = result.dictize() if result else None
 
             if item.__class__.__name__ == 'Result':
-                tasks = task_repo.filter_tasks_by(id=item.task_id)
-                task_runs = task_repo.filter_task_runs_by(task_id=item.task_id)
-                obj['task_runs'] = []
-                for t in tasks:
-                    obj['task'] = t.dictize()
-                for tr in task_runs:
-                    obj['task_runs'].append(tr.dictize())
+                task = related['tasks'].get(item.task_id)
+                if task:
+                    obj['task'] = task.dictize()
+                obj['task_runs'] = [tr.dictize() for tr in
+                                    related['task_runs'][item.task_id]]
 
         links, link = self.hateoas.create_links(item)
         if links:
@@ -234,7 +278,7 @@ class APIBase(MethodView):
             del filters['owner_id']
         return filters
 
-    def _filter_query(self, repo_info, limit, offset, orderby):
+    def _get_filters(self):
         filters = {}
         for k in request.args.keys():
             if k not in ['limit', 'offset', 'api_key', 'last_id', 'all',
@@ -246,13 +290,17 @@ class APIBase(MethodView):
                 else:
                     getattr(self.__class__, k)
                 filters[k] = request.args[k]
-        repo = repo_info['repo']
         filters = self.api_context(all_arg=request.args.get('all'), **filters)
-        query_func = repo_info['filter']
         filters = self._custom_filter(filters)
-        last_id = request.args.get('last_id')
         if request.args.get('participated'):
             filters['participated'] = get_user_id_or_ip()
+        return filters
+
+    def _filter_query(self, repo_info, limit, offset, orderby):
+        repo = repo_info['repo']
+        query_func = repo_info['filter']
+        filters = self._get_filters()
+        last_id = request.args.get('last_id')
         fulltextsearch = request.args.get('fulltextsearch')
         desc = request.args.get('desc') if request.args.get('desc') else False
         desc = fuzzyboolean(desc)
@@ -270,6 +318,57 @@ class APIBase(MethodView):
                                                 **filters)
         return results
 
+    def stream(self):
+        """Stream every item matching the filters as newline delimited JSON.
+
+        It accepts the same filters as GET, except fulltextsearch, orderby
+        and desc. Items are read in batches ordered by id, so memory is
+        bounded and an interrupted stream can be resumed passing the id of
+        the last received item as last_id.
+
+        """
+        try:
+            if current_user.is_anonymous():
+                raise abort(401)
+            ensure_authorized_to('read', self.__class__)
+            repo_info = repos[self.__class__.__name__]
+            repo = repo_info['repo']
+            query_func = repo_info['filter']
+            filters = self._get_filters()
+            batch_size = current_app.config.get('API_STREAM_BATCH_SIZE', 1000)
+            last_id = int(request.args.get('last_id') or 0)
+        except Exception as e:
+            return error.format_exception(
+                e,
+                target=self.__class__.__name__.lower(),
+                action='GET')
+
+        def generate(last_id):
+            auth_cache = {}
+            while True:
+                # the repository pops some of the filters, hence the copy
+                items = getattr(repo, query_func)(limit=batch_size,
+                                                  last_id=last_id,
+                                                  **dict(filters))
+                if not items:
+                    break
+                related = None
+                if request.args.get('related'):
+                    related = self._load_related(items)
+                for item in items:
+                    try:
+                        if not self._is_authorized_item(item, auth_cache):
+                            continue
+                    except (Forbidden, Unauthorized):
+                        continue
+                    yield json.dumps(self._create_dict_from_model(item,
+                                                                  related))
+                    yield '\n'
+                last_id = items[-1].id
+
+        return Response(stream_with_context(generate(last_id)),
+                        mimetype='application/x-ndjson')
+
     def _set_limit_and_offset(self):
         try:
             limit = min(100, int(request.args.get('limit')))
@@ -0,0 +1,96 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SciFabric LTD.
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA api module for exposing the change feed of a project via an API.
+
+This package adds GET method for:
+    * changes
+
+"""
+import json
+import time
+from flask import current_app, request, Response
+from flask.ext.login import current_user
+from werkzeug.exceptions import MethodNotAllowed, NotFound, Unauthorized
+from api_base import APIBase
+from pybossa.core import change_repo, db, project_repo, ratelimits
+from pybossa.error import ErrorStatus
+from pybossa.model.change_event import ChangeEvent
+from pybossa.ratelimit import ratelimit
+from pybossa.util import jsonpify
+
+error = ErrorStatus()
+
+
+class ChangesAPI(APIBase):
+
+    """
+    Class for the change feed of a project.
+
+    It returns the inserts, updates and deletes of the tasks, task runs and
+    results of project_id after the sequence number after. With wait=N it
+    waits up to N seconds for new changes when there are none.
+
+    """
+
+    __class__ = ChangeEvent
+
+    @jsonpify
+    @ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+    def get(self, oid=None):
+        """Return the changes of a project after a cursor."""
+        try:
+            if current_user.is_anonymous():
+                raise Unauthorized("Insufficient privilege to the request")
+            project_id = request.args.get('project_id', type=int)
+            project = project_repo.get(project_id) if project_id else None
+            if project is None:
+                raise NotFound
+            if not (current_user.admin or current_user.subadmin or
+                    current_user.id in project.owners_ids):
+                raise Unauthorized("Insufficient privilege to the request")
+            after = request.args.get('after', 0, type=int)
+            limit, _, _ = self._set_limit_and_offset()
+            max_wait = current_app.config.get('CHANGES_MAX_WAIT', 20)
+            wait = min(request.args.get('wait', 0, type=float), max_wait)
+            interval = current_app.config.get('CHANGES_POLL_INTERVAL', 1)
+            deadline = time.time() + wait
+            changes = change_repo.get_changes(project_id, after, limit)
+            while not changes and time.time() < deadline:
+                # Do not keep a transaction open while waiting
+                db.session.rollback()
+                time.sleep(interval)
+                changes = change_repo.get_changes(project_id, after, limit)
+            cursor = changes[-1].seq if changes else after
+            data = dict(changes=[change.dictize() for change in changes],
+                        cursor=cursor)
+            return Response(json.dumps(data), mimetype='application/json')
+        except Exception as e:
+            return error.format_exception(
+                e,
+                target=self.__class__.__name__.lower(),
+                action='GET')
+
+    def post(self):
+        raise MethodNotAllowed(valid_methods=['GET'])
+
+    def put(self, oid=None):
+        raise MethodNotAllowed(valid_methods=['GET'])
+
+    def delete(self, oid=None):
+        raise MethodNotAllowed(valid_methods=['GET'])
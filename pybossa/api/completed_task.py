@@ -28,7 +28,7 @@ from api_base import APIBase
 from pybossa.model.task import Task
 from pybossa.error import ErrorStatus
 from pybossa.core import task_repo
-from werkzeug.exceptions import MethodNotAllowed, Unauthorized
+from werkzeug.exceptions import BadRequest, MethodNotAllowed, Unauthorized
 from pybossa.util import jsonpify, crossdomain
 from pybossa.core import ratelimits
 from pybossa.ratelimit import ratelimit
@@ -54,6 +54,9 @@ class CompletedTaskAPI(APIBase):
             if not (current_user.is_authenticated() and current_user.admin):
                 raise Unauthorized("Insufficient privilege to the request")
 
+            if 'since' in request.args:
+                return self._get_since()
+
             # set filter from args
             # add 'state'='completed' if missing
             filters = {}
@@ -81,6 +84,31 @@ class CompletedTaskAPI(APIBase):
                 target=self.__class__.__name__.lower(),
             action='GET')
 
+    def _get_since(self):
+        """Return the tasks completed after the since cursor, in the order
+        they were completed. The cursor to use for the next call is sent
+        in the X-Completion-Cursor header."""
+        for k in request.args.keys():
+            if k not in ['since', 'limit', 'project_id', 'api_key']:
+                raise ValueError('since only supports the project_id filter')
+        since = request.args.get('since', type=int)
+        if since is None:
+            raise BadRequest('since must be an integer completion cursor')
+        project_id = None
+        if 'project_id' in request.args:
+            project_id = request.args.get('project_id', type=int)
+            if project_id is None:
+                raise BadRequest('project_id must be an integer')
+        limit, _, _ = self._set_limit_and_offset()
+        completions = task_repo.get_completions_since(since, limit=limit,
+                                                      project_id=project_id)
+        json_response = self._create_json_response(
+            [task for cid, task in completions], None)
+        response = Response(json_response, mimetype='application/json')
+        cursor = completions[-1][0] if completions else since
+        response.headers['X-Completion-Cursor'] = str(cursor)
+        return response
+
     def post(self):
         raise MethodNotAllowed(valid_methods=['GET','PUT'])
 
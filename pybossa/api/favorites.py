@@ -52,8 +52,7 @@ class FavoritesAPI(APIBase):
                 raise abort(401)
             uid = current_user.id
             limit, offset, orderby = self._set_limit_and_offset()
-            last_id = request.args.get('last_id')
-            print last_id
+            last_id = request.args.get('last_id', type=int)
             desc = request.args.get('desc') if request.args.get('desc') else False
             desc = fuzzyboolean(desc)
 
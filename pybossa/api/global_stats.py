@@ -25,9 +25,7 @@ import json
 from api_base import APIBase
 from flask import Response
 import pybossa.cache.site_stats as stats
-import pybossa.cache.projects as cached_projects
-import pybossa.cache.categories as cached_categories
-from pybossa.util import jsonpify
+from pybossa.util import jsonpify, make_conditional
 from pybossa.ratelimit import ratelimit
 from werkzeug.exceptions import MethodNotAllowed
 
@@ -45,30 +43,27 @@ class GlobalStatsAPI(APIBase):
     @ratelimit(limit=300, per=15 * 60)
     def get(self, oid=None):
         """Return global stats."""
-        n_pending_tasks = stats.n_total_tasks_site() - stats.n_task_runs_site()
-        n_users = stats.n_auth_users() + stats.n_anon_users()
-        n_projects = cached_projects.n_published() + cached_projects.n_count('draft')
+        snapshot = stats.get_snapshot()
+        site = snapshot['stats']
+        n_pending_tasks = site['n_total_tasks'] - site['n_task_runs']
+        n_users = site['n_auth_users'] + site['n_anon_users']
+        n_projects = site['n_published'] + site['n_draft']
         data = dict(n_projects=n_projects,
                     n_users=n_users,
-                    n_task_runs=stats.n_task_runs_site(),
+                    n_task_runs=site['n_task_runs'],
                     n_pending_tasks=n_pending_tasks,
-                    n_results=stats.n_results_site(),
+                    n_results=site['n_results'],
                     categories=[])
         # Add Categories
-        categories = cached_categories.get_used()
-        for c in categories:
-            datum = dict()
-            datum[c['short_name']] = cached_projects.n_count(c['short_name'])
-            data['categories'].append(datum)
+        for short_name, n_projects in site['categories']:
+            data['categories'].append({short_name: n_projects})
         # Add Featured
-        datum = dict()
-        datum['featured'] = cached_projects.n_count('featured')
-        data['categories'].append(datum)
+        data['categories'].append(dict(featured=site['n_featured']))
         # Add Draft
-        datum = dict()
-        datum['draft'] = cached_projects.n_count('draft')
-        data['categories'].append(datum)
-        return Response(json.dumps(data), 200, mimetype='application/json')
+        data['categories'].append(dict(draft=site['n_draft']))
+        response = Response(json.dumps(data), 200,
+                            mimetype='application/json')
+        return make_conditional(response, snapshot['etag'])
 
     def post(self):
         raise MethodNotAllowed
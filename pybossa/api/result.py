@@ -40,6 +40,8 @@ class ResultAPI(APIBase):
 
     immutable_keys = set(['project_id', 'task_id'])
 
+    auth_per_project = True
+
     def _forbidden_attributes(self, data):
         for key in data.keys():
             if key in self.reserved_keys:
@@ -46,6 +46,8 @@ class TaskAPI(APIBase):
 
     immutable_keys = set(['project_id'])
 
+    auth_per_project = True
+
     def _forbidden_attributes(self, data):
         for key in data.keys():
             if key in self.reserved_keys:
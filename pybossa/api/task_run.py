@@ -23,23 +23,27 @@ This package adds GET, POST, PUT and DELETE methods for:
 
 """
 import json
+from collections import defaultdict
 from flask import request, Response
 from flask import current_app as app
 from flask.ext.login import current_user
 from pybossa.model.task_run import TaskRun
-from werkzeug.exceptions import Forbidden, BadRequest
+from pybossa.exc import DBIntegrityError
+from werkzeug.exceptions import Forbidden, BadRequest, Conflict
 
-from api_base import APIBase
+from api_base import APIBase, error
 from pybossa.util import get_user_id_or_ip
 from pybossa.core import task_repo, sentinel, anonymizer
 from pybossa.cloud_store_api.s3 import s3_upload_from_string
 from pybossa.cloud_store_api.s3 import s3_upload_file_storage
 from pybossa.contributions_guard import ContributionsGuard
-from pybossa.auth import jwt_authorize_project
+from pybossa.auth import jwt_authorize_project, ensure_authorized_to
 from datetime import datetime
 from pybossa.sched import can_post, after_save
+from pybossa.sched import can_post_tasks, after_save_tasks
 
 from pybossa.model.completion_event import mark_if_complete
+from pybossa.model.completion_event import mark_tasks_if_complete
 
 
 class TaskRunAPI(APIBase):
@@ -54,6 +58,8 @@ class TaskRunAPI(APIBase):
 
     immutable_keys = set(['project_id', 'task_id'])
 
+    auth_per_project = True
+
     def _preprocess_post_data(self, data):
         if current_user.is_anonymous():
             raise Forbidden('')
@@ -61,13 +67,17 @@ class TaskRunAPI(APIBase):
         project_id = data['project_id']
         user_id = current_user.id
         self.check_can_post(project_id, task_id, user_id)
+        self._upload_info(data, request.files)
+
+    def _upload_info(self, data, files):
         info = data.get('info')
         with_encryption = app.config.get('ENABLE_ENCRYPTION')
         if info is None:
             return
-        path = "{0}/{1}/{2}".format(project_id, task_id, user_id)
+        path = "{0}/{1}/{2}".format(data['project_id'], data['task_id'],
+                                    current_user.id)
         _upload_files_from_json(info, path, with_encryption)
-        _upload_files_from_request(info, request.files, path, with_encryption)
+        _upload_files_from_request(info, files, path, with_encryption)
         if with_encryption:
             data['info'] = {
                 'pyb_answer_url': _upload_task_run(info, path)
@@ -83,9 +93,11 @@ class TaskRunAPI(APIBase):
         guard = ContributionsGuard(sentinel.master)
 
         self._validate_project_and_task(taskrun, task)
-        self._ensure_task_was_requested(task, guard)
+        requested, presented = guard.retrieve_stamps(task,
+                                                     get_user_id_or_ip())
+        self._ensure_task_was_requested(requested)
         self._add_user_info(taskrun)
-        self._add_timestamps(taskrun, task, guard)
+        self._set_timestamps(taskrun, presented)
 
     def _forbidden_attributes(self, data):
         for key in data.keys():
@@ -104,8 +116,8 @@ class TaskRunAPI(APIBase):
                 msg = json.loads(resp.data)['description']
                 raise Forbidden(msg)
 
-    def _ensure_task_was_requested(self, task, guard):
-        if not guard.check_task_stamped(task, get_user_id_or_ip()):
+    def _ensure_task_was_requested(self, requested):
+        if requested is None:
             raise Forbidden('You must request a task first!')
 
     def _add_user_info(self, taskrun):
@@ -119,21 +131,17 @@ class TaskRunAPI(APIBase):
             taskrun.user_ip = None
             taskrun.user_id = None
 
-    def _add_created_timestamp(self, taskrun, task, guard):
-        taskrun.created = guard.retrieve_timestamp(task, get_user_id_or_ip())
-        guard._remove_task_stamped(task, get_user_id_or_ip())
-
     def _after_save(self, instance):
         after_save(instance.project_id, instance.task_id, instance.user_id)
         mark_if_complete(instance.task_id, instance.project_id)
 
-    def _add_timestamps(self, taskrun, task, guard):
+    def _set_timestamps(self, taskrun, presented):
         finish_time = datetime.utcnow().isoformat()
 
         # /cachePresentedTime API only caches when there is a user_id
         # otherwise it returns an arbitrary valid timestamp so that answer can be submitted
-        if guard.retrieve_presented_timestamp(task, get_user_id_or_ip()):
-            created = self._validate_datetime(guard.retrieve_presented_timestamp(task, get_user_id_or_ip()))
+        if presented:
+            created = self._validate_datetime(presented)
         else:
             created = datetime.strptime(self.DEFAULT_DATETIME, self.DATETIME_FORMAT).isoformat()
 
@@ -147,6 +155,146 @@ class TaskRunAPI(APIBase):
             taskrun.created = created.isoformat()
             taskrun.finish_time = finish_time
 
+    def post_bulk(self):
+        """Post a list of task runs.
+
+        Locks and contribution guards are checked for all the items with
+        pipelined Redis calls, the valid task runs are stored in a single
+        transaction, or one by one when it breaks a constraint, and the
+        caches of each project are refreshed once. The response has a
+        status for every item, in the same order.
+
+        """
+        try:
+            if current_user.is_anonymous():
+                raise Forbidden('')
+            data = self._parse_request_data()
+            if not isinstance(data, list):
+                raise BadRequest('A list of task runs is required')
+            max_items = app.config.get('TASKRUN_BULK_MAX_ITEMS', 100)
+            if len(data) > max_items:
+                raise BadRequest('At most {} task runs can be posted at once'
+                                 .format(max_items))
+            statuses, taskruns = self._create_bulk_instances(data)
+            if taskruns:
+                self._save_bulk(statuses, taskruns)
+        except Exception as e:
+            return error.format_exception(e, target='taskrun', action='POST')
+        self._after_save_bulk(taskruns.values())
+        for index, taskrun in taskruns.iteritems():
+            statuses[index] = dict(status='ok', id=taskrun.id)
+        return Response(json.dumps(statuses), mimetype='application/json')
+
+    def _create_bulk_instances(self, data):
+        """Return the status of the invalid items and the task runs to be
+        stored, both indexed by their position in data."""
+        statuses = [None] * len(data)
+        taskruns = {}
+        items = {}
+        for index, item in enumerate(data):
+            try:
+                if not isinstance(item, dict):
+                    raise BadRequest('Invalid task run')
+                self._forbidden_attributes(item)
+                self._restricted_attributes(item)
+                if item.get('task_id') is None or \
+                        item.get('project_id') is None:
+                    raise BadRequest('task_id and project_id are required')
+                if not (_is_integer(item['task_id']) and
+                        _is_integer(item['project_id'])):
+                    raise BadRequest('task_id and project_id must be integers')
+                items[index] = item
+            except Exception as e:
+                statuses[index] = self._bulk_error(e)
+
+        tasks = task_repo.get_tasks_by_ids(
+            [item['task_id'] for item in items.values()])
+        tasks = dict((task.id, task) for task in tasks)
+        allowed = self._check_can_post_bulk(items)
+        user = get_user_id_or_ip()
+        indexes = sorted(index for index, item in items.iteritems()
+                         if item['task_id'] in tasks)
+        guard = ContributionsGuard(sentinel.master)
+        stamps = guard.retrieve_timestamps(
+            [tasks[items[index]['task_id']] for index in indexes], user)
+        stamps = dict(zip(indexes, stamps))
+
+        task_ids = set()
+        for index in sorted(items):
+            item = items[index]
+            try:
+                task = tasks.get(item['task_id'])
+                if task is None:
+                    raise Forbidden('Invalid task_id')
+                if isinstance(allowed[index], Exception):
+                    raise allowed[index]
+                if not allowed[index]:
+                    raise Forbidden('You must request a task first!')
+                if task.id in task_ids:
+                    raise Conflict('Duplicated task_id')
+                requested, presented = stamps[index]
+                if requested is None:
+                    raise Forbidden('You must request a task first!')
+                self._upload_info(item, {})
+                taskrun = self.__class__(**self.hateoas.remove_links(item))
+                self._validate_project_and_task(taskrun, task)
+                self._add_user_info(taskrun)
+                self._set_timestamps(taskrun, presented)
+                ensure_authorized_to('create', taskrun)
+                self._validate_instance(taskrun)
+                task_ids.add(task.id)
+                taskruns[index] = taskrun
+            except Exception as e:
+                statuses[index] = self._bulk_error(e)
+        return statuses, taskruns
+
+    def _save_bulk(self, statuses, taskruns):
+        """Store the task runs in a single transaction. When it breaks a
+        constraint, e.g. with a task run posted concurrently, they are
+        stored one by one and only the offending ones fail."""
+        try:
+            task_repo.save_all(taskruns.values())
+            return
+        except DBIntegrityError:
+            pass
+        for index in sorted(taskruns):
+            taskrun = taskruns[index]
+            # The id drawn by the rolled back transaction
+            taskrun.id = None
+            try:
+                task_repo.save(taskrun)
+            except DBIntegrityError as e:
+                statuses[index] = self._bulk_error(e)
+                del taskruns[index]
+
+    def _check_can_post_bulk(self, items):
+        """Return, indexed as items, whether the user holds the locks. The
+        locks of each project are checked with a single round trip."""
+        by_project = defaultdict(list)
+        for index, item in items.iteritems():
+            by_project[item['project_id']].append(index)
+        allowed = {}
+        for project_id, indexes in by_project.iteritems():
+            task_ids = [items[index]['task_id'] for index in indexes]
+            try:
+                results = can_post_tasks(project_id, task_ids,
+                                         current_user.id)
+            except Forbidden as e:
+                results = [e] * len(indexes)
+            allowed.update(zip(indexes, results))
+        return allowed
+
+    def _after_save_bulk(self, taskruns):
+        by_project = defaultdict(list)
+        for taskrun in taskruns:
+            by_project[taskrun.project_id].append(taskrun.task_id)
+        for project_id, task_ids in by_project.iteritems():
+            after_save_tasks(project_id, task_ids, current_user.id)
+            mark_tasks_if_complete(task_ids, project_id)
+
+    def _bulk_error(self, e):
+        return error.exception_to_dict(e, target='taskrun', action='POST')
+
     def _validate_datetime(self, timestamp):
         try:
             timestamp = datetime.strptime(timestamp, self.DATETIME_FORMAT)
@@ -156,6 +304,10 @@ class TaskRunAPI(APIBase):
         return timestamp.isoformat()
 
 
+def _is_integer(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
 def _upload_files_from_json(task_run_info, upload_path, with_encryption):
     if not isinstance(task_run_info, dict):
         return
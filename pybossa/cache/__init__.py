@@ -31,6 +31,7 @@ import hashlib
 from functools import wraps
 from pybossa.core import sentinel
 from pybossa.sentinel import keys, scan_iter
+from pybossa.request_metrics import count_cache
 
 try:
     import cPickle as pickle
@@ -111,6 +112,7 @@ def cache(key_prefix, timeout=300, cache_group_keys=None):
             key = "%s::%s" % (settings.REDIS_KEYPREFIX, key_prefix)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
                 output = sentinel.slave.get(key)
+                count_cache(f.__name__, bool(output))
                 if output:
                     return pickle.loads(output)
                 output = f(*args, **kwargs)
@@ -142,6 +144,7 @@ def memoize(timeout=300, cache_group_keys=None):
             key = get_hash_key(key, key_to_hash)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
                 output = sentinel.slave.get(key)
+                count_cache(f.__name__, bool(output))
                 if output:
                     return pickle.loads(output)
                 output = f(*args, **kwargs)
@@ -179,6 +182,7 @@ def memoize_essentials(timeout=300, essentials=None, cache_group_keys=None):
             key = get_hash_key(key, key_to_hash)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
                 output = sentinel.slave.get(key)
+                count_cache(f.__name__, bool(output))
                 if output:
                     return pickle.loads(output)
                 output = f(*args, **kwargs)
@@ -18,7 +18,7 @@
 """Cache module for project stats."""
 from flask import current_app
 from sqlalchemy.sql import text
-from pybossa.core import db
+from pybossa.core import db, sentinel
 from pybossa.cache import memoize, ONE_DAY, FIVE_MINUTES, ONE_HOUR
 import pybossa.cache.projects as cached_projects
 from pybossa.model.project_stats import ProjectStats
@@ -33,6 +33,9 @@ import app_settings
 
 session = db.slave_session
 
+DIRTY_PROJECTS_KEY = 'pybossa:project_stats:dirty'
+REFRESHED_KEY_PREFIX = 'pybossa:project_stats:refreshed:{0}'
+
 
 @memoize(timeout=ONE_HOUR)
 def n_tasks(project_id):
@@ -592,6 +595,52 @@ def update_stats(project_id, period='2 week'):
     return dates_stats, hours_stats, users_stats
 
 
+def mark_dirty(project_id):
+    """Flag the stats of a project as outdated."""
+    sentinel.master.sadd(DIRTY_PROJECTS_KEY, project_id)
+
+
+def discard_dirty(project_id):
+    """Remove a project from the dirty set. Return True if it was there."""
+    return sentinel.master.srem(DIRTY_PROJECTS_KEY, project_id) == 1
+
+
+def pop_dirty(count):
+    """Remove up to count projects from the dirty set and return their ids.
+
+    Projects whose stats were refreshed less than
+    PROJECT_STATS_MIN_INTERVAL seconds ago stay in the set, so a busy
+    project is recomputed at most once per interval.
+    """
+    conn = sentinel.master
+    interval = app_settings.config.get('PROJECT_STATS_MIN_INTERVAL',
+                                       FIVE_MINUTES)
+    candidates = conn.srandmember(DIRTY_PROJECTS_KEY, count) or []
+    pipeline = conn.pipeline(transaction=False)
+    for project_id in candidates:
+        pipeline.set(REFRESHED_KEY_PREFIX.format(project_id), 1,
+                     ex=interval, nx=True)
+    claimed = [project_id for project_id, ok
+               in zip(candidates, pipeline.execute()) if ok]
+    for project_id in claimed:
+        pipeline.srem(DIRTY_PROJECTS_KEY, project_id)
+    removed = pipeline.execute() if claimed else []
+    return [int(project_id) for project_id, n
+            in zip(claimed, removed) if n]
+
+
+def restore_dirty(project_ids):
+    """Put back in the dirty set projects popped by pop_dirty whose stats
+    were not refreshed after all."""
+    if not project_ids:
+        return
+    pipeline = sentinel.master.pipeline(transaction=False)
+    for project_id in project_ids:
+        pipeline.delete(REFRESHED_KEY_PREFIX.format(project_id))
+    pipeline.sadd(DIRTY_PROJECTS_KEY, *project_ids)
+    pipeline.execute()
+
+
 def get_stats(project_id, period='2 week', full=False):
     """Get project's stats."""
     ps = session.query(ProjectStats).filter_by(project_id=project_id).first()
@@ -17,13 +17,18 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for projects."""
 from sqlalchemy.sql import text
-from pybossa.core import db, timeouts
+from pybossa.core import db, timeouts, sentinel
 from pybossa.model.project import Project
 from pybossa.util import pretty_date, static_vars, convert_utc_to_est
 from pybossa.cache import memoize, cache, delete_memoized, delete_cached, \
-    memoize_essentials, delete_memoized_essential, delete_cache_group
-from pybossa.cache.task_browse_helpers import get_task_filters, allowed_fields
+    memoize_essentials, delete_memoized_essential, delete_cache_group, \
+    add_key_to_cache_groups
+from pybossa.cache.task_browse_helpers import get_task_filters, \
+    allowed_fields, get_browse_filters_key, get_keyset_order, \
+    get_keyset_order_clause, get_keyset_filter, encode_cursor, \
+    task_run_keyset_expressions
 import app_settings
+import json
 
 
 session = db.slave_session
@@ -58,32 +63,76 @@ def get_top(n=4):
                     cache_group_keys=[[0]])
 @static_vars(allowed_fields=allowed_fields)
 def browse_tasks(project_id, args):
-    """Cache browse tasks view for a project."""
+    """Cache browse tasks view for a project.
+
+    Pages are fetched with keyset pagination when args contains a decoded
+    cursor, and with OFFSET otherwise. Every task carries the opaque cursor
+    that points right after it, so the last one can be used to ask for the
+    next page. Pages asked for by offset remember the cursor of the page
+    after them, so browsing page by page never scans the skipped tasks.
+    The task runs are only counted for the tasks of the page, unless the
+    filters or the order need them. The total count is cached apart, see
+    n_browse_tasks.
+    """
     filters, filter_params = get_task_filters(args)
-    sql = text('''
-               SELECT COUNT(*) OVER() as total_count, task.id,
-               coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-               priority_0, task.created
-               FROM task LEFT OUTER JOIN
-               (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-               MAX(finish_time) as ft FROM task_run
-               WHERE project_id=:project_id GROUP BY task_id) AS log_counts
-               ON task.id=log_counts.task_id
-               WHERE task.project_id=:project_id''' + filters +
-               " ORDER BY %s" % (args.get('order_by') or 'id ASC') +
-               " LIMIT :limit OFFSET :offset"
-               )
-
+    order = get_keyset_order(args.get('order_by_fields'))
+    keyset_columns = ', '.join('{} AS keyset_{}'.format(expression, ix)
+                               for ix, (expression, _) in enumerate(order))
     limit = args.get('records_per_page') or 10
+    params = dict(project_id=project_id, limit=limit, **filter_params)
     offset = args.get('offset') or 0
-
-    results = session.execute(sql, dict(project_id=project_id,
-                                        limit=limit,
-                                        offset=offset,
-                                        **filter_params))
+    cursor = args.get('cursor')
+    if cursor is None and offset:
+        cursor = get_page_cursor(project_id, args, offset)
+
+    if cursor is not None:
+        keyset_filter, keyset_params = get_keyset_filter(order, cursor)
+        filters += keyset_filter
+        params.update(keyset_params)
+        paging = " LIMIT :limit"
+    else:
+        params['offset'] = offset
+        paging = " LIMIT :limit OFFSET :offset"
+
+    if _uses_task_run_counts(args, order):
+        sql = text('''
+                   SELECT task.id,
+                   coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
+                   priority_0, task.created, ''' + keyset_columns + '''
+                   FROM task LEFT OUTER JOIN
+                   (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+                   MAX(finish_time) as ft FROM task_run
+                   WHERE project_id=:project_id GROUP BY task_id) AS log_counts
+                   ON task.id=log_counts.task_id
+                   WHERE task.project_id=:project_id''' + filters +
+                   " ORDER BY %s" % get_keyset_order_clause(order) + paging
+                   )
+    else:
+        # The page is picked from the tasks alone, so only the task runs of
+        # its tasks are counted, instead of the ones of the whole project
+        page_order = [('page.keyset_{}'.format(ix), direction)
+                      for ix, (_, direction) in enumerate(order)]
+        sql = text('''
+                   WITH page AS (
+                   SELECT task.id, task.n_answers, priority_0, task.created,
+                   ''' + keyset_columns + '''
+                   FROM task
+                   WHERE task.project_id=:project_id''' + filters +
+                   " ORDER BY %s" % get_keyset_order_clause(order) + paging +
+                   ''')
+                   SELECT page.*, coalesce(ct, 0) as n_task_runs, ft
+                   FROM page LEFT OUTER JOIN
+                   (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+                   MAX(finish_time) as ft FROM task_run
+                   WHERE project_id=:project_id
+                   AND task_id IN (SELECT id FROM page)
+                   GROUP BY task_id) AS log_counts
+                   ON page.id=log_counts.task_id
+                   ORDER BY ''' + get_keyset_order_clause(page_order))
+
+    results = session.execute(sql, params)
 
     tasks = []
-    total_count = 0
     for row in results:
         # TODO: use Jinja filters to format date
         def format_date(date):
@@ -94,13 +143,100 @@ def browse_tasks(project_id, args):
         task = dict(id=row.id, n_task_runs=row.n_task_runs,
                     n_answers=row.n_answers, priority_0=row.priority_0,
                     finish_time=finish_time, created=created)
-        if total_count == 0:
-            total_count = row.total_count
         task['pct_status'] = _pct_status(row.n_task_runs, row.n_answers)
+        last_values = [row['keyset_{}'.format(ix)]
+                       for ix in range(len(order))]
+        task['cursor'] = encode_cursor(last_values)
         tasks.append(task)
+    if args.get('cursor') is None and len(tasks) == limit:
+        store_page_cursor(project_id, args, offset + limit, last_values)
+    total_count = n_browse_tasks(project_id, get_browse_filters_key(args))
     return total_count, tasks
 
 
+def _uses_task_run_counts(args, order):
+    """Return whether the browse tasks filters or order need the task run
+    counts of every task of the project."""
+    return (args.get('pcomplete_from') is not None or
+            args.get('pcomplete_to') is not None or
+            bool(args.get('ftime_from') or args.get('ftime_to')) or
+            any(expression in task_run_keyset_expressions
+                for expression, _ in order))
+
+
+def _page_cursors_key(project_id):
+    return 'pybossa:browse_tasks:page_cursors:{0}'.format(project_id)
+
+
+def _page_cursor_field(args, offset):
+    return json.dumps([get_browse_filters_key(args),
+                       args.get('order_by_fields') or [],
+                       args.get('records_per_page') or 10, offset])
+
+
+def get_page_cursor(project_id, args, offset):
+    """Return the cursor of the browse tasks page at offset, or None when
+    it is not known."""
+    cursor = sentinel.slave.hget(_page_cursors_key(project_id),
+                                 _page_cursor_field(args, offset))
+    return json.loads(cursor) if cursor else None
+
+
+def store_page_cursor(project_id, args, offset, cursor):
+    """Remember the cursor of the browse tasks page at offset, until the
+    browse tasks cache of the project is cleaned."""
+    key = _page_cursors_key(project_id)
+    pipeline = sentinel.master.pipeline(transaction=False)
+    pipeline.hset(key, _page_cursor_field(args, offset), json.dumps(cursor))
+    pipeline.expire(key, timeouts.get('BROWSE_TASKS_TIMEOUT') or 300)
+    pipeline.execute()
+    add_key_to_cache_groups(key, [[0]], project_id)
+
+
+@memoize_essentials(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'), essentials=[0],
+                    cache_group_keys=[[0]])
+def n_browse_tasks(project_id, filters_key):
+    """Return the number of tasks of the browse tasks view for a project.
+
+    filters_key is the canonical JSON of the filters, see
+    get_browse_filters_key, so the count is computed once per filter
+    combination instead of once per page. For projects bigger than
+    BROWSE_TASKS_EXACT_COUNT_LIMIT the planner estimate is returned
+    for filtered counts, as an exact one would scan the whole project.
+    """
+    filters = json.loads(filters_key)
+    if not filters:
+        return n_tasks(project_id)
+    conditions, filter_params = get_task_filters(filters)
+    sql = '''
+          SELECT COUNT(task.id) FROM task LEFT OUTER JOIN
+          (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+          MAX(finish_time) as ft FROM task_run
+          WHERE project_id=:project_id GROUP BY task_id) AS log_counts
+          ON task.id=log_counts.task_id
+          WHERE task.project_id=:project_id {}'''.format(conditions)
+    params = dict(project_id=project_id, **filter_params)
+
+    exact_count_limit = app_settings.config.get(
+        'BROWSE_TASKS_EXACT_COUNT_LIMIT', 100000)
+    if n_tasks(project_id) > exact_count_limit:
+        return _estimate_count(sql, params)
+    return session.execute(text(sql), params).scalar() or 0
+
+
+def _estimate_count(sql, params):
+    """Return the number of rows the planner expects a COUNT query
+    to aggregate."""
+    plan = session.execute(text('EXPLAIN (FORMAT JSON) ' + sql),
+                           params).scalar()
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    plan = plan[0]['Plan']
+    if plan.get('Plans'):
+        plan = plan['Plans'][0]
+    return int(plan['Plan Rows'])
+
+
 def task_count(project_id, filters):
     """Return the count of tasks in a project matching the given filters."""
     conditions, filter_params = get_task_filters(filters)
@@ -612,6 +748,8 @@ def reset():
 def delete_browse_tasks(project_id):
     """Reset browse_tasks value in cache"""
     delete_memoized_essential(browse_tasks, project_id)
+    delete_memoized_essential(n_browse_tasks, project_id)
+    sentinel.master.delete(_page_cursors_key(project_id))
 
 
 def delete_n_tasks(project_id):
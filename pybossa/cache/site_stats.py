@@ -16,16 +16,21 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Cache module for site statistics."""
+import hashlib
+import json
+import time
 from functools import wraps
 from sqlalchemy.sql import text
 from flask import current_app
 
-from pybossa.core import db
+from pybossa.core import db, sentinel
 from pybossa.cache import cache, memoize, ONE_DAY, ONE_WEEK
 import app_settings
 
 session = db.slave_session
 
+SNAPSHOT_KEY = 'pybossa:site_stats:snapshot'
+
 
 @cache(timeout=ONE_DAY, key_prefix="site_n_auth_users")
 def n_auth_users():
@@ -98,6 +103,10 @@ def n_results_site():
 @cache(timeout=ONE_DAY, key_prefix="site_top5_apps_24_hours")
 def get_top5_projects_24_hours():
     """Return the top 5 projects more active in the last 24 hours."""
+    return _top5_projects_24_hours()
+
+
+def _top5_projects_24_hours():
     # Top 5 Most active projects in last 24 hours
     sql = text('''SELECT project.id, project.name, project.short_name, project.info,
                COUNT(task_run.project_id) AS n_answers FROM project, task_run
@@ -118,6 +127,10 @@ def get_top5_projects_24_hours():
 @cache(timeout=ONE_DAY, key_prefix="site_top5_users_24_hours")
 def get_top5_users_24_hours():
     """Return top 5 users in last 24 hours."""
+    return _top5_users_24_hours()
+
+
+def _top5_users_24_hours():
     # Top 5 Most active users in last 24 hours
     sql = text('''SELECT "user".id, "user".fullname, "user".name,
                "user".restrict,
@@ -137,6 +150,62 @@ def get_top5_users_24_hours():
     return top5_users_24_hours
 
 
+def compute_snapshot():
+    """Return the global stats of the site, counted in a single pass."""
+    sql = text('''
+        SELECT (SELECT COUNT(*) FROM "user") AS n_auth_users,
+               (SELECT COUNT(DISTINCT user_ip) FROM task_run)
+               AS n_anon_users,
+               (SELECT COUNT(*) FROM task_run) AS n_task_runs,
+               (SELECT COUNT(*) FROM result WHERE info IS NOT NULL)
+               AS n_results,
+               t.n_tasks, t.n_total_tasks, p.n_published, p.n_draft,
+               p.n_featured
+        FROM (SELECT COUNT(*) AS n_tasks,
+                     COALESCE(SUM(n_answers), 0) AS n_total_tasks
+              FROM task) AS t,
+             (SELECT COUNT(*) FILTER (WHERE published) AS n_published,
+                     COUNT(*) FILTER (WHERE NOT published) AS n_draft,
+                     COUNT(*) FILTER (WHERE featured) AS n_featured
+              FROM project) AS p;
+        ''')
+    snapshot = dict(session.execute(sql).first())
+    if app_settings.config.get('DISABLE_ANONYMOUS_ACCESS'):
+        snapshot['n_anon_users'] = 0
+    # Published projects of every used category, as n_count does
+    sql = text('''
+        SELECT category.short_name,
+               COUNT(project.id) FILTER (WHERE project.published
+               AND coalesce(project.hidden, false)=false) AS n_projects
+        FROM category JOIN project ON project.category_id=category.id
+        GROUP BY category.id ORDER BY category.id;
+        ''')
+    snapshot['categories'] = [[row.short_name, row.n_projects]
+                              for row in session.execute(sql)]
+    snapshot['top5_projects_24_hours'] = _top5_projects_24_hours()
+    snapshot['top5_users_24_hours'] = _top5_users_24_hours()
+    return snapshot
+
+
+def update_snapshot():
+    """Compute the global stats and store them in Redis with an ETag."""
+    stats = compute_snapshot()
+    data = json.dumps(stats, sort_keys=True)
+    snapshot = dict(etag=hashlib.md5(data).hexdigest(), updated=time.time(),
+                    stats=stats)
+    sentinel.master.setex(SNAPSHOT_KEY, ONE_DAY, json.dumps(snapshot))
+    return snapshot
+
+
+def get_snapshot():
+    """Return the last snapshot of the global stats, a dict with the etag
+    and the stats. It is computed when missing."""
+    data = sentinel.slave.get(SNAPSHOT_KEY)
+    if data is None:
+        return update_snapshot()
+    return json.loads(data)
+
+
 def allow_all_time(func):
     @wraps(func)
     def wrapper(days=30):
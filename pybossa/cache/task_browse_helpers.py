@@ -4,6 +4,7 @@ from pybossa.util import (convert_est_to_utc,
     get_user_pref_db_clause)
 import re
 import json
+import base64
 import app_settings
 
 def get_task_filters(args):
@@ -71,6 +72,10 @@ def _escape_like_param(string):
     return string
 
 
+# All operators are expressed as ILIKE over the same expression,
+# COALESCE(task.info->>'field', ''), so that they can be served by the
+# per project trigram indexes created for the indexed fields of a project,
+# see TaskRepository.create_info_field_index.
 op_to_query = {
     'starts with': dict(
         query="COALESCE(task.info->>'{}', '') ilike :{} escape '\\'",
@@ -81,9 +86,9 @@ op_to_query = {
         value="%{}%",
         escape=_escape_like_param),
     'equals': dict(
-        query="lower(COALESCE(task.info->>'{}', '')) = lower(:{})",
+        query="COALESCE(task.info->>'{}', '') ilike :{} escape '\\'",
         value="{}",
-        escape=lambda x: x)
+        escape=_escape_like_param)
 }
 
 
@@ -129,6 +134,13 @@ def is_valid_searchable_column(column_name):
     return is_valid
 
 
+def get_indexed_columns(project):
+    """Return the task.info fields the owners of a project asked to index."""
+    info = project.info if isinstance(project.info, dict) else {}
+    return [column for column in info.get('indexed_fields') or []
+            if is_valid_searchable_column(column)]
+
+
 def get_searchable_columns(project_id):
     from pybossa.core import task_repo
     tasks = task_repo.filter_tasks_by(project_id=project_id,
@@ -145,6 +157,22 @@ def get_searchable_columns(project_id):
     return sorted(columns)
 
 
+browse_filter_keys = ('task_id', 'hide_completed', 'pcomplete_from',
+                      'pcomplete_to', 'priority_from', 'priority_to',
+                      'created_from', 'created_to', 'ftime_from', 'ftime_to',
+                      'state', 'filter_by_field', 'filter_by_upref')
+
+
+def get_browse_filters_key(args):
+    """Return a canonical string for the filtering part of the browse
+    arguments, ignoring ordering and paging, so that it can be used as
+    a cache key for the total count."""
+    filters = {key: args[key] for key in browse_filter_keys
+               if args.get(key) is not None and args.get(key) is not False
+               and args.get(key) != '' and args.get(key) != []}
+    return json.dumps(filters, sort_keys=True)
+
+
 allowed_fields = {
     'task_id': 'id',
     'priority': 'priority_0',
@@ -155,6 +183,96 @@ allowed_fields = {
 }
 
 
+# Sort expressions used by keyset pagination.
+keyset_fields = {
+    'task_id': 'task.id',
+    'priority': 'priority_0',
+    'finish_time': 'ft',
+    'pcomplete': '(coalesce(ct, 0)/task.n_answers)',
+    'created': 'task.created'
+}
+
+# Sort expressions that are NULL for some tasks, e.g. ft for the tasks
+# without task runs. They keep their NULLs last in ascending order and first
+# in descending order, and are preceded in the order by their IS NULL test,
+# so that the seek predicate never has to compare a NULL.
+nullable_keyset_expressions = set(['ft'])
+
+# Sort expressions computed from the task runs of the task
+task_run_keyset_expressions = set([keyset_fields['finish_time'],
+                                   keyset_fields['pcomplete']])
+
+
+def get_keyset_order(order_by_fields):
+    """Return the list of (expression, direction) pairs to sort the browse
+    tasks query by, always ending with task.id to make the order total."""
+    order = []
+    for field, direction in (order_by_fields or []):
+        if field not in keyset_fields:
+            continue
+        expression = keyset_fields[field]
+        if expression in nullable_keyset_expressions:
+            order.append(('({} IS NULL)'.format(expression), direction))
+        order.append((expression, direction))
+    if not any(expression == 'task.id' for expression, _ in order):
+        order.append(('task.id', 'asc'))
+    return order
+
+
+def get_keyset_order_clause(order):
+    clauses = []
+    for expression, direction in order:
+        clause = '{} {}'.format(expression, direction.upper())
+        if expression in nullable_keyset_expressions:
+            clause += ' NULLS LAST' if direction == 'asc' else ' NULLS FIRST'
+        clauses.append(clause)
+    return ', '.join(clauses)
+
+
+def get_keyset_filter(order, cursor):
+    """
+    Build the seek predicate that returns the rows after the cursor
+    for the given order.
+
+    For an order (a ASC, b DESC) and cursor (x, y) this is
+    (a > x) OR (a = x AND b < y). The nullable expressions are compared
+    for equality with IS NOT DISTINCT FROM.
+    """
+    if len(order) != len(cursor):
+        raise BadRequest('Invalid cursor')
+    params = {}
+    or_pieces = []
+    for ix, (expression, direction) in enumerate(order):
+        and_pieces = []
+        for prev in range(ix):
+            prev_expression = order[prev][0]
+            equals = ('IS NOT DISTINCT FROM'
+                      if prev_expression in nullable_keyset_expressions
+                      else '=')
+            and_pieces.append('{} {} :keyset_{}'.format(prev_expression,
+                                                       equals, prev))
+        operator = '>' if direction == 'asc' else '<'
+        and_pieces.append('{} {} :keyset_{}'.format(expression, operator, ix))
+        or_pieces.append('({})'.format(' AND '.join(and_pieces)))
+        params['keyset_{}'.format(ix)] = cursor[ix]
+    return ' AND ({})'.format(' OR '.join(or_pieces)), params
+
+
+def encode_cursor(values):
+    """Return an opaque cursor for the sort values of a row."""
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor: {}'.format(cursor))
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor: {}'.format(cursor))
+    return values
+
+
 def parse_tasks_browse_args(args):
     """
     Parse querystring arguments
@@ -215,6 +333,7 @@ def parse_tasks_browse_args(args):
     parsed_args['order_by_dict'] = dict()
     if args.get('order_by'):
         parsed_args['order_by'] = args['order_by'].strip().lower()
+        parsed_args['order_by_fields'] = []
         for clause in parsed_args['order_by'].split(','):
             order_by_field = clause.split(' ')
             if len(order_by_field) != 2 or order_by_field[0] not in allowed_fields:
@@ -222,7 +341,11 @@ def parse_tasks_browse_args(args):
             if order_by_field[0] in parsed_args["order_by_dict"]:
                 raise ValueError('order_by field is duplicated: %s'
                                  .format(args['order_by']))
+            if order_by_field[1] not in ('asc', 'desc'):
+                raise ValueError('order_by direction is invalid: {}'
+                                 .format(args['order_by']))
             parsed_args["order_by_dict"][order_by_field[0]] = order_by_field[1]
+            parsed_args['order_by_fields'].append(tuple(order_by_field))
 
         for key, value in allowed_fields.iteritems():
             parsed_args["order_by"] = parsed_args["order_by"].replace(key, value)
@@ -240,6 +363,13 @@ def parse_tasks_browse_args(args):
             raise ValueError('invalid task state: %s'.format(args['state']))
         parsed_args['state'] = args['state']
 
+    if args.get('cursor'):
+        parsed_args['cursor'] = decode_cursor(args['cursor'])
+        order = get_keyset_order(parsed_args.get('order_by_fields'))
+        if len(parsed_args['cursor']) != len(order):
+            raise ValueError('cursor does not match order_by: {}'
+                             .format(args['cursor']))
+
     return parsed_args
 
 def validate_user_preferences(user_pref):
@@ -49,11 +49,9 @@ def get_leaderboard(n, user_id=None, window=0, info=None):
 def n_projects_contributed(user_id):
     """Return number of projects user has contributed to."""
     sql = text('''
-                WITH projects_contributed AS
-                    (SELECT DISTINCT project_id FROM task_run
-                    WHERE user_id =:user_id)
                 SELECT COUNT(*) AS total_projects_contributed
-                FROM projects_contributed;
+                FROM user_contribution
+                WHERE user_id=:user_id AND n_task_runs > 0;
                 ''')
     results = session.execute(sql, dict(user_id=user_id))
     total_projects_contributed = 0
@@ -70,11 +68,12 @@ def get_user_summary(name):
                "user".api_key, "user".twitter_user_id, "user".facebook_user_id,
                "user".google_user_id, "user".info, "user".admin,
                "user".locale,
-               "user".email_addr, COUNT(task_run.user_id) AS n_answers,
+               "user".email_addr,
+               CAST(COALESCE(SUM(uc.n_task_runs), 0) AS INTEGER) AS n_answers,
                "user".valid_email, "user".confirmation_email_sent,
-               max(task_run.finish_time) AS last_task_submission_on
+               max(uc.last_submission_date) AS last_task_submission_on
                FROM "user"
-               LEFT OUTER JOIN task_run ON "user".id=task_run.user_id
+               LEFT OUTER JOIN user_contribution uc ON "user".id=uc.user_id
                WHERE "user".name=:name
                GROUP BY "user".id;
                ''')
@@ -132,8 +131,9 @@ def projects_contributed(user_id, order_by='name'):
     """Return projects that user_id has contributed to."""
     sql = text('''
                WITH projects_contributed as
-                    (SELECT project_id, MAX(finish_time) as last_contribution  FROM task_run
-                     WHERE user_id=:user_id GROUP BY project_id)
+                    (SELECT project_id, last_submission_date as last_contribution
+                     FROM user_contribution
+                     WHERE user_id=:user_id AND n_task_runs > 0)
                SELECT project.id, project.name as name, project.short_name, project.owner_id,
                project.description, project.info, project.owners_ids
                FROM project, projects_contributed
@@ -294,9 +294,11 @@ def get_users_page(page, per_page=24):
     offset = (page - 1) * per_page
     sql = text('''SELECT "user".id, "user".name,
                "user".fullname, "user".email_addr,
-               "user".created, "user".info, COUNT(task_run.id) AS task_runs
-               FROM task_run, "user"
-               WHERE "user".id=task_run.user_id GROUP BY "user".id
+               "user".created, "user".info,
+               CAST(SUM(uc.n_task_runs) AS INTEGER) AS task_runs
+               FROM user_contribution uc, "user"
+               WHERE "user".id=uc.user_id AND uc.n_task_runs > 0
+               GROUP BY "user".id
                ORDER BY "user".created DESC LIMIT :limit OFFSET :offset''')
     results = session.execute(sql, dict(limit=per_page, offset=offset))
     accounts = []
@@ -349,40 +351,55 @@ def get_user_preferences(user_id):
     return get_user_pref_db_clause(user_pref)
 
 
-@memoize(timeout=timeouts.get('USER_TIMEOUT'))
 def get_users_for_report():
-    """Return information for all users to generate report."""
+    """Yield the information of every user to generate the report.
+
+    The contributions are read from the user_contribution table, kept up to
+    date as task runs are submitted. The rows are streamed with a server side
+    cursor.
+
+    """
     sql = text("""
+                WITH stats AS (
+                    SELECT user_id,
+                    CAST(SUM(n_task_runs) AS BIGINT) AS completed_tasks,
+                    COUNT(DISTINCT project_id) AS total_projects_contributed,
+                    MIN(first_submission_date) AS first_submission_date,
+                    MAX(last_submission_date) AS last_submission_date,
+                    SUM(total_time) / NULLIF(CAST(SUM(timed_runs) AS FLOAT), 0)
+                    AS avg_time_per_task
+                    FROM user_contribution WHERE n_task_runs > 0
+                    GROUP BY user_id
+                )
                 SELECT u.id AS u_id, name, fullname, email_addr, u.created, admin, enabled, locale,
                 subadmin, user_pref->'languages' AS languages, user_pref->'locations' AS locations,
                 u.info->'metadata'->'work_hours_from' AS work_hours_from, u.info->'metadata'->'work_hours_to' AS work_hours_to,
                 u.info->'metadata'->'timezone' AS timezone, u.info->'metadata'->'user_type' AS type_of_user,
                 u.info->'metadata'->'review' AS additional_comments,
-                MIN(finish_time) AS first_submission_date,
-                MAX(finish_time) AS last_submission_date,
-                (SELECT COUNT(id) FROM task_run WHERE user_id = u.id)AS completed_tasks,
-                (SELECT coalesce(AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-                to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')), interval '0s')
-                FROM task_run WHERE user_id = u.id) AS avg_time_per_task, u.consent, u.restrict
-                FROM task_run t RIGHT JOIN "user" u ON t.user_id = u.id
+                s.first_submission_date, s.last_submission_date,
+                COALESCE(s.completed_tasks, 0) AS completed_tasks,
+                COALESCE(s.total_projects_contributed, 0) AS total_projects_contributed,
+                COALESCE(s.avg_time_per_task, interval '0s') AS avg_time_per_task,
+                u.consent, u.restrict
+                FROM "user" u LEFT JOIN stats s ON s.user_id = u.id
                 WHERE u.restrict=False and u.email_addr not like 'del-%@del.com'
-                GROUP BY user_id, u.id;
+                ORDER BY u.id;
                """)
-    results = session.execute(sql)
-    users_report = [ dict(id=row.u_id, name=row.name, fullname=row.fullname,
-                    email_addr=row.email_addr, created=row.created, locale=row.locale,
-                    admin=row.admin, subadmin=row.subadmin, enabled=row.enabled, languages=row.languages,
-                    locations=row.locations, work_hours_from=row.work_hours_from,
-                    work_hours_to=row.work_hours_to, timezone=row.timezone,
-                    additional_comments=row.additional_comments,
-                    type_of_user=row.type_of_user, first_submission_date=row.first_submission_date,
-                    last_submission_date=row.last_submission_date,
-                    completed_tasks=row.completed_tasks, avg_time_per_task=str(round(row.avg_time_per_task.total_seconds() / 60, 2)),
-                    total_projects_contributed=n_projects_contributed(row.u_id),
-                    percentage_tasks_completed=round(float(row.completed_tasks) * 100 / n_total_tasks(), 2) if n_total_tasks() else 0,
-                    consent=row.consent, restrict=row.restrict)
-                    for row in results]
-    return users_report
+    total_tasks = n_total_tasks()
+    results = session.execute(sql.execution_options(stream_results=True))
+    for row in results:
+        yield dict(id=row.u_id, name=row.name, fullname=row.fullname,
+                   email_addr=row.email_addr, created=row.created, locale=row.locale,
+                   admin=row.admin, subadmin=row.subadmin, enabled=row.enabled, languages=row.languages,
+                   locations=row.locations, work_hours_from=row.work_hours_from,
+                   work_hours_to=row.work_hours_to, timezone=row.timezone,
+                   additional_comments=row.additional_comments,
+                   type_of_user=row.type_of_user, first_submission_date=row.first_submission_date,
+                   last_submission_date=row.last_submission_date,
+                   completed_tasks=row.completed_tasks, avg_time_per_task=str(round(row.avg_time_per_task.total_seconds() / 60, 2)),
+                   total_projects_contributed=row.total_projects_contributed,
+                   percentage_tasks_completed=round(float(row.completed_tasks) * 100 / total_tasks, 2) if total_tasks else 0,
+                   consent=row.consent, restrict=row.restrict)
 
 
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
@@ -399,15 +416,12 @@ def get_project_report_userdata(project_id):
             info->'metadata'->'work_hours_from' AS work_hours_from, info->'metadata'->'work_hours_to' AS work_hours_to,
             info->'metadata'->'timezone' AS timezone, info->'metadata'->'user_type' AS type_of_user,
             info->'metadata'->'review' AS additional_comments,
-            (SELECT count(id) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS completed_tasks,
-            ((SELECT count(id) FROM task_run WHERE user_id = u.id AND project_id =:project_id) * 100 / :total_tasks) AS percent_completed_tasks,
-            (SELECT min(finish_time) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS first_submission_date,
-            (SELECT max(finish_time) FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS last_submission_date,
-            (SELECT coalesce(AVG(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
-            to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US')), interval '0s')
-            FROM task_run WHERE user_id = u.id AND project_id=:project_id) AS avg_time_per_task
-            FROM "user" u WHERE id IN
-            (SELECT DISTINCT user_id FROM task_run tr GROUP BY project_id, user_id HAVING project_id=:project_id);
+            uc.n_task_runs AS completed_tasks,
+            (uc.n_task_runs * 100 / :total_tasks) AS percent_completed_tasks,
+            uc.first_submission_date, uc.last_submission_date,
+            coalesce(uc.total_time / NULLIF(uc.timed_runs, 0), interval '0s') AS avg_time_per_task
+            FROM "user" u JOIN user_contribution uc ON uc.user_id = u.id
+            WHERE uc.project_id=:project_id AND uc.n_task_runs > 0;
             ''')
     results = session.execute(sql, dict(project_id=project_id, total_tasks=total_tasks))
     users_report = [
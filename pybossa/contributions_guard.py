@@ -49,6 +49,39 @@ class ContributionsGuard(object):
         key = self._create_key(task, user)
         return self.conn.get(key)
 
+    def retrieve_timestamps(self, tasks, user):
+        """Get the requested and presented timestamps of several tasks for
+        a user with a single round trip. Returns a list of
+        (requested, presented) tuples, with None for missing stamps.
+        """
+        pipeline = self.conn.pipeline(transaction=False)
+        for task in tasks:
+            pipeline.get(self._create_key(task, user))
+            pipeline.get(self._create_presented_time_key(task, user))
+        stamps = pipeline.execute()
+        return zip(stamps[::2], stamps[1::2])
+
+    def retrieve_stamps(self, task, user):
+        """Get the requested and presented timestamps of a task for a user
+        with a single round trip."""
+        return self.retrieve_timestamps([task], user)[0]
+
+    def stamp_many(self, tasks, user, extend_presented=True):
+        """Stamp the tasks as requested by a user and, with the same round
+        trip, cache the time they were presented. For tasks the user already
+        had been presented the original presented time is kept, and its
+        expiry extended when extend_presented.
+        """
+        now = make_timestamp()
+        pipeline = self.conn.pipeline(transaction=False)
+        for task in tasks:
+            pipeline.setex(self._create_key(task, user), self.STAMP_TTL, now)
+            presented_key = self._create_presented_time_key(task, user)
+            pipeline.set(presented_key, now, ex=self.STAMP_TTL, nx=True)
+            if extend_presented:
+                pipeline.expire(presented_key, self.STAMP_TTL)
+        pipeline.execute()
+
     def _create_key(self, task, user):
         """Create a Redis key for a given task and a user."""
         user_id = user['user_id'] or user['user_ip']
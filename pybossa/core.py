@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Core module for PYBOSSA."""
+import time
+_import_started = time.time()
 import os
 import logging
 import humanize
@@ -36,62 +38,114 @@ from pybossa.news import FEED_KEY as NEWS_FEED_KEY
 from pybossa.news import get_news
 from pybossa.messages import *
 import app_settings
+_import_finished = time.time()
 
 
-def create_app(run_as_server=True):
-    """Create web app."""
+class StartupProfile(object):
+
+    """Run the setup steps of an app, logging how long each one takes when
+    the PYBOSSA_STARTUP_PROFILE environment variable is set."""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = bool(os.environ.get('PYBOSSA_STARTUP_PROFILE'))
+        self.timings = [('import pybossa.core',
+                         _import_finished - _import_started)]
+
+    def __call__(self, step, *args):
+        started = time.time()
+        step(self.app, *args)
+        self.timings.append((step.__name__, time.time() - started))
+
+    def log(self):
+        if not self.enabled:
+            return
+        total = sum(duration for _, duration in self.timings)
+        lines = ['{0:>8.1f} ms  {1}'.format(duration * 1000, name)
+                 for name, duration in sorted(self.timings,
+                                              key=lambda t: t[1],
+                                              reverse=True)]
+        self.app.logger.warning('Startup profile, {0:.1f} ms in total\n{1}'
+                                .format(total * 1000, '\n'.join(lines)))
+
+
+def create_app(run_as_server=True, web=True):
+    """Create web app.
+
+    With web=False, e.g. for background workers, the setup only needed to
+    serve HTTP requests is skipped and the importers are set up on first use.
+
+    """
     app = Flask(__name__.split('.')[0])
-    configure_app(app)
+    setup = StartupProfile(app)
+    setup(configure_app)
+    setup(setup_talisman)
+    setup(setup_logging, run_as_server)
+    if web:
+        setup(setup_assets)
+    setup(setup_cache_timeouts)
+    setup(setup_ratelimits)
+    setup(setup_theme)
+    setup(setup_uploader)
+    setup(setup_error_email)
+    setup(setup_login_manager)
+    setup(setup_babel)
+    setup(setup_markdown)
+    setup(setup_db)
+    setup(setup_repositories)
+    setup(setup_cache)
+    setup(setup_strong_password)
+    setup(mail.init_app)
+    setup(sentinel.init_app)
+    setup(setup_exporter)
+    setup(setup_http_signer)
+    setup(signer.init_app)
+    if app.config.get('SENTRY_DSN'):  # pragma: no cover
+        setup(Sentry)
+    if run_as_server:  # pragma: no cover
+        setup(setup_scheduled_jobs)
+    setup(setup_blueprints)
+    setup(setup_hooks)
+    if web:
+        setup(setup_error_handlers)
+        setup(setup_ldap)
+        setup(setup_external_services)
+        setup(setup_importers)
+    else:
+        importer.defer_setup(lambda: setup_importers(app, web=False))
+    setup(setup_jinja)
+    if web:
+        setup(setup_csrf_protection)
+        setup(setup_debug_toolbar)
+    setup(setup_jinja2_filters)
+    if web:
+        setup(setup_newsletter)
+        setup(setup_sse)
+    setup(setup_json_serializer)
+    if web:
+        setup(setup_cors)
+        setup(setup_profiler)
+        setup(setup_request_metrics)
+    setup(plugin_manager.init_app)
+    plugin_manager.install_plugins()
+    setup(setup_event_listeners)
+    setup(anonymizer.init_app)
+    setup(setup_task_presenter_editor)
+    setup(setup_schedulers)
+    setup.log()
+    return app
+
+
+def setup_talisman(app):
     global talisman
     talisman = Talisman(app, content_security_policy={
         'default-src': ['*', '\'unsafe-inline\'', '\'unsafe-eval\'', 'data:',
                         'blob:']
     }, force_https=app.config.get('FORCE_HTTPS', True))
-    setup_logging(app, run_as_server)
-    setup_assets(app)
-    setup_cache_timeouts(app)
-    setup_ratelimits(app)
-    setup_theme(app)
-    setup_uploader(app)
-    setup_error_email(app)
-    setup_login_manager(app)
-    setup_babel(app)
-    setup_markdown(app)
-    setup_db(app)
-    setup_repositories(app)
-    setup_cache(app)
-    setup_strong_password(app)
-    mail.init_app(app)
-    sentinel.init_app(app)
-    setup_exporter(app)
-    setup_http_signer(app)
-    signer.init_app(app)
-    if app.config.get('SENTRY_DSN'):  # pragma: no cover
-        Sentry(app)
-    if run_as_server:  # pragma: no cover
-        setup_scheduled_jobs(app)
-    setup_blueprints(app)
-    setup_hooks(app)
-    setup_error_handlers(app)
-    setup_ldap(app)
-    setup_external_services(app)
-    setup_importers(app)
-    setup_jinja(app)
-    setup_csrf_protection(app)
-    setup_debug_toolbar(app)
-    setup_jinja2_filters(app)
-    setup_newsletter(app)
-    setup_sse(app)
-    setup_json_serializer(app)
-    setup_cors(app)
-    setup_profiler(app)
-    plugin_manager.init_app(app)
-    plugin_manager.install_plugins()
+
+
+def setup_event_listeners(app):
     import pybossa.model.event_listeners
-    anonymizer.init_app(app)
-    setup_task_presenter_editor(app)
-    setup_schedulers(app)
-    return app
 
 
 def configure_app(app):
@@ -190,7 +244,9 @@ def setup_db(app):
                 app.config.get('SQLALCHEMY_DATABASE_URI')):
             return db.session
         engine = db.get_engine(db.app, bind=bind)
-        options = dict(bind=engine, scopefunc=_app_ctx_stack.__ident_func__)
+        # It is a replica for the repositories too, see pybossa.replicas
+        options = dict(bind=engine, autoflush=False,
+                       scopefunc=_app_ctx_stack.__ident_func__)
         slave_session = db.create_scoped_session(options=options)
         return slave_session
 
@@ -206,6 +262,8 @@ def setup_db(app):
     db.init_app(app)
     db.slave_session = create_slave_session(db, bind='slave')
     db.bulkdel_session = create_bulkdel_session(db, bind='bulkdel')
+    from pybossa.replicas import ReplicaRouter
+    db.replicas = ReplicaRouter(app, db)
 
     if db.slave_session is not db.session:
         # flask-sqlalchemy does it already for default session db.session
@@ -238,6 +296,7 @@ def setup_repositories(app):
     from pybossa.repositories import WebhookRepository
     from pybossa.repositories import ResultRepository
     from pybossa.repositories import HelpingMaterialRepository
+    from pybossa.repositories import ChangeRepository
     global user_repo
     global project_repo
     global project_stats_repo
@@ -248,6 +307,7 @@ def setup_repositories(app):
     global webhook_repo
     global result_repo
     global helping_repo
+    global change_repo
     language = app.config.get('FULLTEXTSEARCH_LANGUAGE')
     rdancy_upd_exp = app.config.get('REDUNDANCY_UPDATE_EXPIRATION', 30)
     user_repo = UserRepository(db)
@@ -260,6 +320,7 @@ def setup_repositories(app):
     webhook_repo = WebhookRepository(db)
     result_repo = ResultRepository(db)
     helping_repo = HelpingMaterialRepository(db)
+    change_repo = ChangeRepository(db)
 
 
 def setup_cache(app):
@@ -371,10 +432,6 @@ def setup_external_services(app):
     setup_twitter_login(app)
     setup_facebook_login(app)
     setup_google_login(app)
-    setup_flickr_importer(app)
-    setup_dropbox_importer(app)
-    setup_twitter_importer(app)
-    setup_youtube_importer(app)
 
 
 def setup_twitter_login(app):
@@ -427,13 +484,14 @@ def setup_google_login(app):
         app.logger.info(log_message)
 
 
-def setup_flickr_importer(app):
+def setup_flickr_importer(app, web=True):
     try:  # pragma: no cover
         if (app.config['FLICKR_API_KEY']
                 and app.config['FLICKR_SHARED_SECRET']):
-            flickr.init_app(app)
-            from pybossa.view.flickr import blueprint as flickr_bp
-            app.register_blueprint(flickr_bp, url_prefix='/flickr')
+            if web:
+                flickr.init_app(app)
+                from pybossa.view.flickr import blueprint as flickr_bp
+                app.register_blueprint(flickr_bp, url_prefix='/flickr')
             importer_params = {'api_key': app.config['FLICKR_API_KEY']}
             importer.register_flickr_importer(importer_params)
     except Exception as inst:  # pragma: no cover
@@ -490,7 +548,11 @@ def setup_youtube_importer(app):
         log_message = 'Youtube importer not available: %s' % str(inst)
         app.logger.info(log_message)
 
-def setup_importers(app):
+def setup_importers(app, web=True):
+    setup_flickr_importer(app, web)
+    setup_dropbox_importer(app)
+    setup_twitter_importer(app)
+    setup_youtube_importer(app)
     importers = app.config.get('AVAILABLE_IMPORTERS')
     if importers:
         importer.set_importers(importers)
@@ -760,6 +822,11 @@ def setup_profiler(app):
         flask_profiler.init_app(app)
 
 
+def setup_request_metrics(app):
+    from pybossa import request_metrics
+    request_metrics.init_app(app)
+
+
 def setup_task_presenter_editor(app):
     if app.config.get('DISABLE_TASK_PRESENTER_EDITOR'):
         from pybossa.api.project import ProjectAPI
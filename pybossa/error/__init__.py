@@ -36,6 +36,7 @@ class ErrorStatus(object):
 
     This class has the following methods:
         * format_exception: returns a Flask Response with the error.
+        * exception_to_dict: returns the error as a dict.
 
     """
 
@@ -60,6 +61,12 @@ class ErrorStatus(object):
 
         """
         self.log_exception()
+        error = self.exception_to_dict(e, target, action)
+        return Response(json.dumps(error), status=error['status_code'],
+                        mimetype='application/json')
+
+    def exception_to_dict(self, e, target, action):
+        """Return the JSON object describing the exception."""
         exception_cls = e.__class__.__name__
         if self.error_status.get(exception_cls):
             status = self.error_status.get(exception_cls)
@@ -68,14 +75,12 @@ class ErrorStatus(object):
         if exception_cls in ('BadRequest', 'Forbidden', 'Unauthorized',
                              'Conflict'):
             e.message = e.description
-        error = dict(action=action.upper(),
-                     status="failed",
-                     status_code=status,
-                     target=target,
-                     exception_cls=exception_cls,
-                     exception_msg=str(e.message))
-        return Response(json.dumps(error), status=status,
-                        mimetype='application/json')
+        return dict(action=action.upper(),
+                    status="failed",
+                    status_code=status,
+                    target=target,
+                    exception_cls=exception_cls,
+                    exception_msg=str(e.message))
 
     def log_exception(self):
         current_app.logger.exception(u'Exception on {} [{}]'.format(
@@ -22,7 +22,7 @@ from flask import url_for, safe_join, send_file, redirect
 from pybossa.core import uploader, task_repo
 from pybossa.uploader import local
 from pybossa.exporter.json_export import JsonExporter
-from export_helpers import browse_tasks_export, browse_tasks_export_count
+from export_helpers import browse_tasks_export
 
 
 class TaskJsonExporter(JsonExporter):
@@ -105,19 +105,14 @@ class TaskJsonExporter(JsonExporter):
 
     def gen_json_with_filters(self, obj, project_id, expanded, filters):
         objs = browse_tasks_export(obj, project_id, expanded, filters)
-        n = browse_tasks_export_count(obj, project_id, expanded, filters)
 
-        sep = ", "
+        sep = ""
         yield "["
 
-        count = 0
         for obj in objs:
             item = json.dumps(self.process_filtered_row(dict(obj)))
-            count += 1
-
-            if count == n:
-                sep = ""
-            yield item + sep
+            yield sep + item
+            sep = ", "
         yield "]"
 
     def _respond_json(self, ty, project_id, expanded=False, filters=None):
@@ -102,6 +102,16 @@ class Importer(object):
                                localCSV=BulkTaskLocalCSVImport,
                                iiif=BulkTaskIIIFImporter)
         self._importer_constructor_params = dict()
+        self._deferred_setup = None
+
+    def defer_setup(self, setup):
+        """Run setup the first time the importers are used."""
+        self._deferred_setup = setup
+
+    def _run_deferred_setup(self):
+        setup, self._deferred_setup = self._deferred_setup, None
+        if setup is not None:
+            setup()
 
     def register_flickr_importer(self, flickr_params):
         """Register Flickr importer."""
@@ -189,6 +199,7 @@ class Importer(object):
 
     def _create_importer_for(self, **form_data):
         """Create importer."""
+        self._run_deferred_setup()
         importer_id = form_data.get('type')
         params = self._importer_constructor_params.get(importer_id) or {}
         params.update(form_data)
@@ -197,10 +208,12 @@ class Importer(object):
 
     def get_all_importer_names(self):
         """Get all importer names."""
+        self._run_deferred_setup()
         return self._importers.keys()
 
     def get_autoimporter_names(self):
         """Get autoimporter names."""
+        self._run_deferred_setup()
         no_autoimporters = ('dropbox', 's3')
         return [name for name in self._importers.keys() if name not in no_autoimporters]
 
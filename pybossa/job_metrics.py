@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA instrumentation of background jobs.
+
+For every job it records the queue wait time, the run time, the number and
+time of SQL statements, the number of Redis calls and the peak RSS of the
+worker. The metrics are kept per job type as rolling stats.
+
+"""
+import resource
+import threading
+import time
+from datetime import datetime
+
+from redis.client import StrictRedis, BasePipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from pybossa import rolling_stats
+from pybossa.sentinel import RetryingStrictRedis
+
+
+KEY_PREFIX = 'pybossa:job_metrics'
+PERIODIC_KEY_PREFIX = 'pybossa:periodic_jobs'
+PERIODIC_FIELDS = ('enqueued', 'coalesced', 'deferred')
+N_BUCKETS = rolling_stats.N_BUCKETS
+SUM_FIELDS = ('count', 'failed', 'wait_time', 'run_time', 'sql_count',
+              'sql_time', 'redis_calls')
+
+_local = threading.local()
+_installed = []
+
+
+class JobMetrics(object):
+
+    """Metrics collected while a job runs."""
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.redis_calls = 0
+
+
+def install():
+    """Install the SQLAlchemy and Redis hooks used to count the calls of
+    the running job. They do nothing outside of a job."""
+    if _installed:
+        return
+    _installed.append(True)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    # RetryingStrictRedis runs its commands without calling the method of
+    # StrictRedis, so it is wrapped too
+    for cls in (StrictRedis, RetryingStrictRedis):
+        cls.execute_command = _count_redis_calls(
+            cls.__dict__['execute_command'])
+    BasePipeline.execute = _count_redis_calls(BasePipeline.execute)
+
+
+# The start times are kept by cursor, and the one of a failed statement is
+# dropped, so that they never pile up on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('job_metrics_start', {})[cursor] = time.time()
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        context.connection.info.get('job_metrics_start', {}).pop(context.cursor, None)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = conn.info['job_metrics_start'].pop(cursor)
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is not None:
+        metrics.sql_count += 1
+        metrics.sql_time += time.time() - start
+
+
+def _count_redis_calls(func):
+    def wrapper(*args, **kwargs):
+        metrics = getattr(_local, 'metrics', None)
+        if metrics is not None:
+            metrics.redis_calls += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def start(job):
+    """Start collecting the metrics of a job in the current thread."""
+    _local.metrics = JobMetrics(job)
+    return _local.metrics
+
+
+def finish(metrics, failed=False, conn=None):
+    """Stop collecting and add the metrics of the job to its bucket."""
+    _local.metrics = None
+    job = metrics.job
+    run_time = time.time() - metrics.started
+    wait_time = 0.0
+    if job.enqueued_at:
+        wait_time = max((datetime.utcnow() - job.enqueued_at)
+                        .total_seconds() - run_time, 0.0)
+    # ru_maxrss is in kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    record(job.func_name, dict(count=1, failed=int(failed),
+                               wait_time=wait_time, run_time=run_time,
+                               sql_count=metrics.sql_count,
+                               sql_time=metrics.sql_time,
+                               redis_calls=metrics.redis_calls),
+           max_rss, conn)
+
+
+def record(name, values, max_rss, conn=None):
+    rolling_stats.record(KEY_PREFIX, name, values, dict(max_rss=max_rss),
+                         conn)
+
+
+def get_summary(conn=None):
+    """Return the metrics of each job type over the last N_BUCKETS hours,
+    with the averages per run."""
+    summary = rolling_stats.get_summary(KEY_PREFIX, SUM_FIELDS, ['max_rss'],
+                                        conn)
+    for job in summary.itervalues():
+        count = job['count'] or 1
+        job['avg_wait_time'] = job['wait_time'] / count
+        job['avg_run_time'] = job['run_time'] / count
+        job['avg_sql_count'] = job['sql_count'] / count
+    return summary
+
+
+def record_periodic(queue_name, enqueued, coalesced, deferred, conn=None):
+    """Record a run of enqueue_periodic_jobs for a queue."""
+    values = dict(enqueued=enqueued, coalesced=coalesced,
+                  deferred=int(deferred))
+    rolling_stats.record(PERIODIC_KEY_PREFIX, queue_name, values, conn=conn)
+
+
+def get_periodic_summary(conn=None):
+    return rolling_stats.get_summary(PERIODIC_KEY_PREFIX, PERIODIC_FIELDS,
+                                     conn=conn)
+
+
+PROMETHEUS_METRICS = [
+    ('pybossa_job_runs', 'count', 'Jobs run'),
+    ('pybossa_job_failures', 'failed', 'Jobs failed'),
+    ('pybossa_job_wait_seconds', 'wait_time', 'Time spent in the queue'),
+    ('pybossa_job_run_seconds', 'run_time', 'Time spent running'),
+    ('pybossa_job_sql_statements', 'sql_count', 'SQL statements executed'),
+    ('pybossa_job_sql_seconds', 'sql_time', 'Time spent in SQL statements'),
+    ('pybossa_job_redis_calls', 'redis_calls', 'Redis round trips'),
+    ('pybossa_job_max_rss_kilobytes', 'max_rss', 'Peak RSS of the worker')]
+
+
+PROMETHEUS_PERIODIC_METRICS = [
+    ('pybossa_periodic_jobs_enqueued', 'enqueued', 'Periodic jobs enqueued'),
+    ('pybossa_periodic_jobs_coalesced', 'coalesced',
+     'Periodic jobs skipped as already pending'),
+    ('pybossa_periodic_jobs_deferred', 'deferred',
+     'Periodic runs cut short by a full queue')]
+
+
+def format_prometheus(summary, periodic_summary=None):
+    """Format the summaries in the Prometheus text exposition format."""
+    lines = []
+    metrics = [(PROMETHEUS_METRICS, 'job', summary),
+               (PROMETHEUS_PERIODIC_METRICS, 'queue', periodic_summary or {})]
+    for definitions, label, values in metrics:
+        for metric, field, description in definitions:
+            lines.append('# HELP {0} {1} in the last {2} hours'
+                         .format(metric, description, N_BUCKETS))
+            lines.append('# TYPE {0} gauge'.format(metric))
+            for name in sorted(values):
+                lines.append('{0}{{{1}="{2}"}} {3}'
+                             .format(metric, label, name,
+                                     values[name][field]))
+    return '\n'.join(lines) + '\n'
@@ -17,8 +17,11 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Jobs module for running background tasks in PYBOSSA server."""
 from datetime import datetime
+import hashlib
+import json
 import math
 import requests
+import time
 from flask import current_app, render_template
 from flask.ext.mail import Message, Attachment
 from pybossa.core import mail, task_repo, importer, create_app
@@ -28,15 +31,18 @@ import pybossa.dashboard.jobs as dashboard
 from pybossa.leaderboard.jobs import leaderboard
 from pbsonesignal import PybossaOneSignal
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from pybossa.core import user_repo
 from rq.timeouts import JobTimeoutException
-import app_settings
 
 MINUTE = 60
 IMPORT_TASKS_TIMEOUT = (20 * MINUTE)
 TASK_DELETE_TIMEOUT = (60 * MINUTE)
 EXPORT_TASKS_TIMEOUT = (10 * MINUTE)
+PERIODIC_JOB_KEY = 'pybossa:periodic_job:{0}'
+PERIODIC_JOB_KEY_TTL = 24 * 60 * MINUTE
+BULK_DELETE_KEY = 'pybossa:bulk_delete:{0}:{1}'
+BULK_DELETE_KEY_TTL = 7 * 24 * 60 * MINUTE
 from pybossa.core import uploader
 from pybossa.exporter.json_export import JsonExporter
 
@@ -89,23 +95,74 @@ def enqueue_job(job):
                        timeout=job['timeout'])
     return True
 
+def get_periodic_job_key(job):
+    """Return the key identifying a periodic job: its function and a hash of
+    its arguments."""
+    func = job['name']
+    if not isinstance(func, basestring):
+        func = '{0}.{1}'.format(func.__module__, func.__name__)
+    args = json.dumps([job['args'], job['kwargs']], sort_keys=True,
+                      default=str)
+    return PERIODIC_JOB_KEY.format(hashlib.md5(func + args).hexdigest())
+
+
+def is_periodic_job_pending(key, redis_conn):
+    """Return True if the last job enqueued with key is queued or running."""
+    from rq.job import Job
+    job_id = redis_conn.get(key)
+    if job_id is None:
+        return False
+    # Only the status, rather than fetching the whole pickled job
+    status = redis_conn.hget(Job.key_for(job_id), 'status')
+    return status in ('queued', 'started')
+
+
 def enqueue_periodic_jobs(queue_name):
-    """Enqueue all PYBOSSA periodic jobs."""
+    """Enqueue all PYBOSSA periodic jobs.
+
+    Jobs whose previous instance is still queued or running are skipped,
+    and flagged as coalesced so that their generator can give them back.
+    Once the queue holds PERIODIC_JOBS_MAX_QUEUE_DEPTH[queue_name] jobs, the
+    rest of the jobs are left for the next run.
+    """
     from pybossa.core import sentinel
+    from pybossa import job_metrics
     from rq import Queue
     redis_conn = sentinel.master
 
     jobs_generator = get_periodic_jobs(queue_name)
     n_jobs = 0
+    n_coalesced = 0
+    queue_full = False
     queue = Queue(queue_name, connection=redis_conn)
+    max_depth = (current_app.config.get('PERIODIC_JOBS_MAX_QUEUE_DEPTH') or
+                 {}).get(queue_name)
+    depth = queue.count if max_depth is not None else 0
     for job in jobs_generator:
         if (job['queue'] == queue_name):
+            key = get_periodic_job_key(job)
+            if is_periodic_job_pending(key, redis_conn):
+                job['coalesced'] = True
+                n_coalesced += 1
+                continue
+            if max_depth is not None and depth >= max_depth:
+                queue_full = True
+                # Lets the generators give back the jobs not taken
+                jobs_generator.close()
+                break
+            rq_job = queue.enqueue_call(func=job['name'],
+                                        args=job['args'],
+                                        kwargs=job['kwargs'],
+                                        timeout=job['timeout'])
+            redis_conn.setex(key, PERIODIC_JOB_KEY_TTL, rq_job.id)
             n_jobs += 1
-            queue.enqueue_call(func=job['name'],
-                               args=job['args'],
-                               kwargs=job['kwargs'],
-                               timeout=job['timeout'])
+            depth += 1
+    job_metrics.record_periodic(queue_name, n_jobs, n_coalesced, queue_full)
     msg = "%s jobs in %s have been enqueued" % (n_jobs, queue_name)
+    if n_coalesced:
+        msg += ", %s already pending" % n_coalesced
+    if queue_full:
+        msg += ", the rest deferred as the queue is full"
     return msg
 
 
@@ -124,12 +181,29 @@ def get_periodic_jobs(queue):
         if queue == 'quaterly' else []
     dashboard_jobs = get_dashboard_jobs() if queue == 'low' else []
     leaderboard_jobs = get_leaderboard_jobs() if queue == 'super' else []
+    user_contribution_jobs = get_user_contribution_jobs() \
+        if queue == 'low' else []
+    change_feed_jobs = get_change_feed_jobs() if queue == 'low' else []
+    task_info_tsv_jobs = get_task_info_tsv_jobs() if queue == 'low' else []
     weekly_update_jobs = get_weekly_stats_update_projects() if queue == 'low' else []
     failed_jobs = get_maintenance_jobs() if queue == 'maintenance' else []
     _all = [jobs, project_jobs, autoimport_jobs,
             engage_jobs, non_contrib_jobs, dashboard_jobs,
-            weekly_update_jobs, failed_jobs, leaderboard_jobs]
-    return (job for sublist in _all for job in sublist if job['queue'] == queue)
+            weekly_update_jobs, failed_jobs, leaderboard_jobs,
+            user_contribution_jobs, change_feed_jobs, task_info_tsv_jobs]
+    return _chain_jobs(_all, queue)
+
+
+def _chain_jobs(sublists, queue):
+    try:
+        for sublist in sublists:
+            for job in sublist:
+                if job['queue'] == queue:
+                    yield job
+    finally:
+        for sublist in sublists:
+            if hasattr(sublist, 'close'):
+                sublist.close()
 
 
 def get_default_jobs():  # pragma: no cover
@@ -193,24 +267,41 @@ def project_export(_id):
 
 
 def get_project_jobs(queue):
-    """Return a list of jobs based on user type."""
+    """Return a list of jobs based on user type.
+
+    For the high queue only the projects with new activity since their
+    stats were last computed are returned.
+    """
     from pybossa.core import project_repo
     from pybossa.cache import projects as cached_projects
+    from pybossa.cache import project_stats
     timeout = current_app.config.get('TIMEOUT')
+    undelivered = []
     if queue == 'super':
         projects = cached_projects.get_from_pro_user()
     elif queue == 'high':
-        projects = (p.dictize() for p in project_repo.get_all())
+        batch_size = current_app.config.get('PROJECT_STATS_BATCH_SIZE', 500)
+        project_ids = project_stats.pop_dirty(batch_size)
+        projects = [p.dictize() for p in project_repo.get_projects(project_ids)]
+        undelivered = [project['id'] for project in projects]
     else:
         projects = []
-    for project in projects:
-        project_id = project.get('id')
-        project_short_name = project.get('short_name')
-        job = dict(name=get_project_stats,
-                   args=[project_id, project_short_name], kwargs={},
-                   timeout=timeout,
-                   queue=queue)
-        yield job
+    try:
+        for project in projects:
+            project_id = project.get('id')
+            project_short_name = project.get('short_name')
+            job = dict(name=get_project_stats,
+                       args=[project_id, project_short_name], kwargs={},
+                       timeout=timeout,
+                       queue=queue)
+            yield job
+            # A coalesced job may be running already, so its project stays
+            # dirty for the activity it has not seen
+            if undelivered and not job.get('coalesced'):
+                undelivered.remove(project_id)
+    finally:
+        # Closed before taking every job, e.g. as the queue is full
+        project_stats.restore_dirty(undelivered)
 
 
 def create_dict_jobs(data, function, timeout, queue='low'):
@@ -301,6 +392,64 @@ def get_leaderboard_jobs(queue='super'):  # pragma: no cover
                timeout=timeout, queue=queue)
 
 
+def get_user_contribution_jobs(queue='low'):  # pragma: no cover
+    """Return the job reconciling the contributions of the users."""
+    timeout = current_app.config.get('TIMEOUT')
+    yield dict(name=rebuild_user_contributions, args=[], kwargs={},
+               timeout=timeout, queue=queue)
+
+
+def rebuild_user_contributions():
+    """Recompute the contributions of the users from task_run, one project
+    at a time, to fix any drift of the incremental updates."""
+    from sqlalchemy.sql import text
+    from pybossa.core import db
+    from pybossa.model import user_contribution
+    sql = text('''SELECT id FROM project ORDER BY id;''')
+    project_ids = [row.id for row in db.slave_session.execute(sql)]
+    for project_id in project_ids:
+        user_contribution.rebuild(db.session, project_id)
+    return "User contributions rebuilt for %s projects" % len(project_ids)
+
+
+def get_change_feed_jobs(queue='low'):  # pragma: no cover
+    """Return the job applying the retention of the change feed."""
+    timeout = current_app.config.get('TIMEOUT')
+    yield dict(name=clean_change_feed, args=[], kwargs={},
+               timeout=timeout, queue=queue)
+
+
+def clean_change_feed():
+    """Delete the change events older than CHANGES_RETENTION_DAYS and keep
+    only the last event of every object among the ones older than
+    CHANGES_COMPACTION_DAYS."""
+    from pybossa.core import change_repo
+    retention = current_app.config.get('CHANGES_RETENTION_DAYS', 30)
+    compaction = current_app.config.get('CHANGES_COMPACTION_DAYS', 1)
+    now = datetime.utcnow()
+    deleted = change_repo.delete_older_than(
+        (now - timedelta(days=retention)).isoformat())
+    compacted = change_repo.compact(
+        (now - timedelta(days=compaction)).isoformat())
+    return "Deleted %s and compacted %s change events" % (deleted, compacted)
+
+
+def get_task_info_tsv_jobs(queue='low'):  # pragma: no cover
+    """Return the jobs building the missing task search vectors."""
+    timeout = current_app.config.get('TIMEOUT')
+    for project_id in task_repo.get_projects_without_info_tsv():
+        yield dict(name=index_task_info_tsv, args=[project_id], kwargs={},
+                   timeout=timeout, queue=queue)
+
+
+def index_task_info_tsv(project_id, rebuild=False):
+    """Build the missing task.info search vectors of a project, or all of
+    them with rebuild, e.g. after its text search language changed."""
+    n_tasks = task_repo.update_info_tsv(project_id, rebuild)
+    return ('Search vectors of {} tasks of project {} built'
+            .format(n_tasks, project_id))
+
+
 def get_non_contributors_users_jobs(queue='quaterly'):
     """Return a list of users that have never contributed to a project."""
     from sqlalchemy.sql import text
@@ -377,25 +526,9 @@ def get_project_stats(_id, short_name):  # pragma: no cover
 def warm_up_stats():  # pragma: no cover
     """Background job for warming stats."""
     print "Running on the background warm_up_stats"
-    from pybossa.cache.site_stats import (n_auth_users, n_anon_users,
-                                          n_tasks_site, n_total_tasks_site,
-                                          n_task_runs_site,
-                                          get_top5_projects_24_hours,
-                                          get_top5_users_24_hours)
-    current_app.logger.info('warm_up_stats - n_auth_users')
-    n_auth_users()
-    if not app_settings.config.get('DISABLE_ANONYMOUS_ACCESS'):
-        n_anon_users()
-    current_app.logger.info('warm_up_stats - n_tasks_site')
-    n_tasks_site()
-    current_app.logger.info('warm_up_stats - n_total_tasks_site')
-    n_total_tasks_site()
-    current_app.logger.info('warm_up_stats - n_task_runs_site')
-    n_task_runs_site()
-    current_app.logger.info('warm_up_stats - get_top5_projects_24_hours')
-    get_top5_projects_24_hours()
-    current_app.logger.info('warm_up_stats - get_top5_users_24_hours')
-    get_top5_users_24_hours()
+    from pybossa.cache.site_stats import update_snapshot
+    current_app.logger.info('warm_up_stats - update_snapshot')
+    update_snapshot()
 
     return True
 
@@ -403,8 +536,6 @@ def warm_up_stats():  # pragma: no cover
 @with_cache_disabled
 def warm_cache():  # pragma: no cover
     """Background job to warm cache."""
-    from pybossa.core import create_app
-    app = create_app(run_as_server=False)
     projects_cached = []
     import pybossa.cache.projects as cached_projects
     import pybossa.cache.categories as cached_cat
@@ -414,7 +545,7 @@ def warm_cache():  # pragma: no cover
     from pybossa.core import user_repo
 
     def warm_project(_id, short_name, featured=False):
-        if _id not in projects_cached:
+        if _id not in projects_cached and stats.discard_dirty(_id):
             #cached_projects.get_project(short_name)
             #cached_projects.n_tasks(_id)
             #n_task_runs = cached_projects.n_task_runs(_id)
@@ -437,7 +568,7 @@ def warm_cache():  # pragma: no cover
         warm_project(p['id'], p['short_name'])
 
     # Cache 3 pages
-    to_cache = 3 * app.config['APPS_PER_PAGE']
+    to_cache = 3 * current_app.config['APPS_PER_PAGE']
     projects = rank(cached_projects.get_all_featured('featured'))[:to_cache]
     for p in projects:
         current_app.logger.info(u'warm_project - ranked project. id {} short_name{}'
@@ -454,7 +585,7 @@ def warm_cache():  # pragma: no cover
             warm_project(p['id'], p['short_name'])
     # Users
     current_app.logger.info('warm_project - get_leaderboard')
-    users = cached_users.get_leaderboard(app.config['LEADERBOARD'])
+    users = cached_users.get_leaderboard(current_app.config['LEADERBOARD'])
     for user in users:
         u = user_repo.get_by_name(user['name'])
         current_app.logger.info(u'warm_project - user get_user_summary: name {}'.format(user['name']))
@@ -550,12 +681,25 @@ def send_mail(message_dict, mail_all=False):
         mail.send(message)
 
 
+def get_bulk_delete_key(data):
+    """Return the Redis key of the checkpoint of a bulk deletion."""
+    deletion = json.dumps([data['force_reset'], data.get('filters', {})],
+                         sort_keys=True, default=str)
+    return BULK_DELETE_KEY.format(data['project_id'],
+                                  hashlib.md5(deletion).hexdigest())
+
+
 def delete_bulk_tasks(data):
-    """Delete tasks in bulk from project."""
+    """Delete tasks in bulk from project, a chunk of tasks per transaction.
+
+    The last task id of every chunk is checkpointed in Redis, so a new job
+    with the same data resumes a failed deletion. Between chunks the job
+    waits for the replicas to catch up."""
     from sqlalchemy.sql import text
-    from pybossa.core import db
+    from pybossa.core import db, sentinel
     import pybossa.cache.projects as cached_projects
-    from pybossa.cache.task_browse_helpers import get_task_filters
+    import pybossa.cache.project_stats as cached_project_stats
+    from pybossa.model import user_contribution
 
     project_id = data['project_id']
     project_name = data['project_name']
@@ -563,99 +707,133 @@ def delete_bulk_tasks(data):
     coowners = data['coowners']
     current_user_fullname = data['current_user_fullname']
     force_reset = data['force_reset']
-    params = {}
-
-    # bulkdel db conn is with db user having session_replication_role
-    # when bulkdel is not configured, make explict sql query to set
-    # session replication role to replica
-    sql_session_repl = ''
-    if not 'bulkdel' in current_app.config.get('SQLALCHEMY_BINDS'):
-        sql_session_repl = 'SET session_replication_role TO replica;'
-
-    # lock tasks for given project with SELECT FOR UPDATE
-    # create temp table with all tasks to be deleted
-    # during transaction, disable constraints check with session_replication_role
-    # delete rows from child talbes first and then from parent
+    filters = data.get('filters', {})
+    chunk_size = current_app.config.get('BULK_DELETE_CHUNK_SIZE', 1000)
+    sleep = current_app.config.get('BULK_DELETE_SLEEP', 0.1)
+    max_lag = current_app.config.get('BULK_DELETE_MAX_LAG', 10)
+    progress_interval = current_app.config.get(
+        'BULK_DELETE_PROGRESS_INTERVAL', 10 * MINUTE)
+
+    recipients = [curr_user]
+    for user in coowners:
+        recipients.append(user.email_addr)
+    subject = 'Tasks deletion from %s' % project_name
+
+    key = get_bulk_delete_key(data)
+    redis_conn = sentinel.master
+    checkpoint = redis_conn.hgetall(key)
+    last_id = int(checkpoint.get('last_id', 0))
+    n_deleted = int(checkpoint.get('n_deleted', 0))
+    n_tasks = db.bulkdel_session.execute(text('''
+        SELECT COUNT(*) FROM task WHERE project_id=:project_id
+        AND id > :last_id'''), dict(project_id=project_id,
+                                      last_id=last_id)).scalar()
+    db.bulkdel_session.commit()
+    progress = get_bulk_progress(
+        recipients, subject, n_tasks,
+        'have been deleted so far from project %s' % project_name,
+        progress_interval)
+    n_scanned = 0
+    while True:
+        deleted, chunk_last_id = task_repo.delete_tasks_chunk(
+            project_id, last_id, chunk_size, force_reset, filters)
+        if chunk_last_id is None:
+            break
+        last_id = chunk_last_id
+        n_deleted += deleted
+        n_scanned += chunk_size
+        redis_conn.hmset(key, dict(last_id=last_id, n_deleted=n_deleted))
+        redis_conn.expire(key, BULK_DELETE_KEY_TTL)
+        progress(n_scanned, n_deleted)
+        time.sleep(sleep)
+        while db.replicas.get_max_lag() > max_lag:
+            time.sleep(max(sleep, 1))
+
+    redis_conn.delete(key)
+    user_contribution.rebuild(db.session, project_id)
+    cached_projects.clean_project(project_id)
+    cached_project_stats.mark_dirty(project_id)
     if not force_reset:
-        """Delete only tasks that have no results associated."""
-        sql = text('''
-                BEGIN;
-                SELECT task_id FROM counter WHERE project_id=:project_id FOR UPDATE;
-                SELECT task_id FROM task_run WHERE project_id=:project_id FOR UPDATE;
-                SELECT id FROM task WHERE project_id=:project_id FOR UPDATE;
-
-                {}
-
-                CREATE TEMP TABLE to_delete ON COMMIT DROP AS (
-                    SELECT task.id as id FROM task WHERE project_id=:project_id
-                    AND task.id NOT IN
-                    (SELECT task_id FROM result
-                    WHERE result.project_id=:project_id
-                    GROUP BY result.task_id)
-                );
-
-                DELETE FROM counter WHERE project_id=:project_id
-                        AND task_id IN (SELECT id FROM to_delete);
-                DELETE FROM task_run WHERE project_id=:project_id
-                        AND task_id IN (SELECT id FROM to_delete);
-                DELETE FROM task WHERE project_id=:project_id
-                        AND id IN (SELECT id FROM to_delete);
-
-                COMMIT;
-                '''.format(sql_session_repl))
         msg = ("Tasks and taskruns with no associated results have been "
                "deleted from project {0} by {1}"
                .format(project_name, current_user_fullname))
     else:
-        args = data.get('filters', {})
-        conditions, params = get_task_filters(args)
-        sql = text('''
-                BEGIN;
-                SELECT task_id FROM counter WHERE project_id=:project_id FOR UPDATE;
-                SELECT task_id FROM result WHERE project_id=:project_id FOR UPDATE;
-                SELECT task_id FROM task_run WHERE project_id=:project_id FOR UPDATE;
-                SELECT id FROM task WHERE project_id=:project_id FOR UPDATE;
-
-                {}
-
-                CREATE TEMP TABLE to_delete ON COMMIT DROP AS (
-                    SELECT task.id as id,
-                    coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-                    priority_0, task.created
-                    FROM task LEFT OUTER JOIN
-                    (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-                    MAX(finish_time) as ft FROM task_run
-                    WHERE project_id=:project_id GROUP BY task_id) AS log_counts
-                    ON task.id=log_counts.task_id
-                    WHERE task.project_id=:project_id {}
-                );
-
-                DELETE FROM counter WHERE project_id=:project_id
-                        AND task_id IN (SELECT id FROM to_delete);
-                DELETE FROM result WHERE project_id=:project_id
-                       AND task_id in (SELECT id FROM to_delete);
-                DELETE FROM task_run WHERE project_id=:project_id
-                       AND task_id in (SELECT id FROM to_delete);
-                DELETE FROM task WHERE task.project_id=:project_id
-                       AND id in (SELECT id FROM to_delete);
-
-                COMMIT;
-                '''.format(sql_session_repl, conditions))
         msg = ("Tasks, taskruns and results associated have been "
                "deleted from project {0} as requested by {1}"
                .format(project_name, current_user_fullname))
-    db.bulkdel_session.execute(sql, dict(project_id=project_id, **params))
-    cached_projects.clean_project(project_id)
-    subject = 'Tasks deletion from %s' % project_name
-    body = 'Hello,\n\n' + msg + '\n\nThe %s team.'\
-        % current_app.config.get('BRAND')
+    send_bulk_mail(recipients, subject, msg)
 
-    recipients = [curr_user]
-    for user in coowners:
-        recipients.append(user.email_addr)
 
-    mail_dict = dict(recipients=recipients, subject=subject, body=body)
-    send_mail(mail_dict)
+def send_bulk_mail(recipients, subject, msg):
+    """Email the outcome of a bulk task job."""
+    body = 'Hello,\n\n%s\n\nThe %s team.' % (
+        msg, current_app.config.get('BRAND'))
+    send_mail(dict(recipients=recipients, subject=subject, body=body))
+
+
+def get_bulk_progress(recipients, subject, n_tasks, msg, interval):
+    """Return a progress callback for the bulk task jobs. At most every
+    interval seconds it emails the number of tasks changed so far, followed
+    by msg, and the share of the n_tasks already checked."""
+    reported = [time.time()]
+
+    def progress(n_scanned, n_changed):
+        now = time.time()
+        if now - reported[0] <= interval:
+            return
+        reported[0] = now
+        percent = min(100 * n_scanned // max(n_tasks, 1), 99)
+        send_bulk_mail(recipients, subject,
+                       u'{0} tasks {1}, about {2}% of the tasks have been '
+                       'checked.'.format(n_changed, msg, percent))
+    return progress
+
+
+def _bulk_update_recipients(data):
+    return [data['curr_user']] + [user.email_addr for user in data['coowners']]
+
+
+def update_bulk_tasks_redundancy(data):
+    """Update the redundancy of the tasks of a project a batch at a time."""
+    from pybossa.core import project_repo
+
+    project = project_repo.get(data['project_id'])
+    n_answers = data['n_answers']
+    recipients = _bulk_update_recipients(data)
+    subject = 'Tasks redundancy update of %s' % project.name
+    progress = get_bulk_progress(
+        recipients, subject, task_repo.count_tasks_with(project_id=project.id),
+        'have been updated so far',
+        current_app.config.get('BULK_UPDATE_PROGRESS_INTERVAL', 10 * MINUTE))
+    tasks_not_updated = task_repo.update_tasks_redundancy(
+        project, n_answers, data.get('filters'), progress)
+    msg = (u'The redundancy of the tasks of project {0} has been updated to '
+           '{1} as requested by {2}.'.format(project.name, n_answers,
+                                             data['current_user_fullname']))
+    if tasks_not_updated:
+        msg += ('\n\nRedundancy could not be updated for tasks containing '
+                'files that are either completed or older than {} days.'
+                '\nTask Ids\n{}'.format(task_repo.rdancy_upd_exp,
+                                         tasks_not_updated))
+    send_bulk_mail(recipients, subject, msg)
+
+
+def update_bulk_tasks_priority(data):
+    """Update the priority of the tasks of a project a batch at a time."""
+    project_id = data['project_id']
+    recipients = _bulk_update_recipients(data)
+    subject = 'Tasks priority update of %s' % data['project_name']
+    progress = get_bulk_progress(
+        recipients, subject, task_repo.count_tasks_with(project_id=project_id),
+        'have been updated so far',
+        current_app.config.get('BULK_UPDATE_PROGRESS_INTERVAL', 10 * MINUTE))
+    task_repo.update_priority(project_id, data['priority_0'],
+                              data.get('filters', {}), progress)
+    send_bulk_mail(recipients, subject,
+                   u'The priority of the tasks of project {0} has been '
+                   'updated to {1} as requested by {2}.'
+                   .format(data['project_name'], data['priority_0'],
+                           data['current_user_fullname']))
 
 
 def send_email_notifications():
@@ -1203,3 +1381,22 @@ def delete_file(fname, container):
     """Delete file."""
     from pybossa.core import uploader
     return uploader.delete_file(fname, container)
+
+
+def sync_task_info_indexes(project_id):
+    """Create and drop the task.info field indexes of a project so that
+    they match the fields its owners marked as indexed."""
+    from pybossa.core import project_repo
+    from pybossa.cache.task_browse_helpers import get_indexed_columns
+
+    project = project_repo.get(project_id)
+    wanted = set(get_indexed_columns(project)) if project else set()
+    existing = task_repo.get_info_field_indexes(project_id)
+    for field, index_name in existing.iteritems():
+        if field not in wanted:
+            task_repo.drop_info_field_index(index_name)
+    for field in wanted - set(existing):
+        task_repo.create_info_field_index(project_id, field)
+    return ('Task info indexes of project {}: {} created, {} dropped'
+            .format(project_id, len(wanted - set(existing)),
+                    len(set(existing) - wanted)))
@@ -25,6 +25,7 @@ u = User()
 
 def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
     """Return a list of top_users and if user_id return its position."""
+    session = db.replicas.session()
     materialized_view = "users_rank_%s" % info
     sql = text('''SELECT * from users_rank WHERE rank <= :top_users 
                ORDER BY rank;''')
@@ -32,7 +33,7 @@ def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
         sql = text('''SELECT * from {} WHERE rank <= :top_users 
                     ORDER BY rank;'''.format(materialized_view))
 
-    results = db.session.execute(sql, dict(top_users=top_users))
+    results = session.execute(sql, dict(top_users=top_users))
     top_users = [format_user(user) for user in results]
 
     if user_id:
@@ -40,7 +41,7 @@ def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
         if info:
             sql = text('''SELECT * from {} where
                        id=:user_id;'''.format(materialized_view))
-        results = db.session.execute(sql, dict(user_id=user_id))
+        results = session.execute(sql, dict(user_id=user_id))
         user = None
         for row in results:
             user = format_user(row)
@@ -54,7 +55,7 @@ def get_leaderboard(top_users=20, user_id=None, window=0, info=None):
                            '''.format(materialized_view))
             low = user['rank'] - window
             top = user['rank'] + window
-            results = db.session.execute(sql, dict(user_id=user_id,
+            results = session.execute(sql, dict(user_id=user_id,
                                          top=top,
                                          low=low))
             for row in results:
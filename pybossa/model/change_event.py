@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2017 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import BigInteger, Integer, Text
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.sql import text
+from pybossa.core import db
+from pybossa.model import DomainObject, make_timestamp
+
+
+class ChangeEvent(db.Model, DomainObject):
+    '''A ChangeEvent records an insert, update or delete of a Task, TaskRun
+    or Result of a Project.'''
+
+    __tablename__ = 'change_event'
+
+    #: Project.ID the changed object belongs to.
+    project_id = Column(Integer, ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                        primary_key=True)
+    #: Sequence number of the event in the project.
+    seq = Column(BigInteger, primary_key=True)
+    #: UTC timestamp of the event.
+    created = Column(Text, default=make_timestamp)
+    #: Type of the changed object: task, taskrun or result.
+    object_type = Column(Text, nullable=False)
+    #: ID of the changed object.
+    object_id = Column(Integer, nullable=False)
+    #: insert, update or delete.
+    action = Column(Text, nullable=False)
+
+
+class ChangeSequence(db.Model, DomainObject):
+    '''Last sequence number used for the change events of a Project.'''
+
+    __tablename__ = 'change_sequence'
+
+    #: Project.ID of the sequence.
+    project_id = Column(Integer, ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                        primary_key=True)
+    #: Last sequence number used.
+    seq = Column(BigInteger, nullable=False, default=0)
+
+
+# The sequence row stays locked until the transaction commits, so the events
+# of a project are committed in the order of their sequence numbers and a
+# reader never skips an event committed after a higher one.
+RECORD_SQL = text('''
+    WITH next AS (
+        INSERT INTO change_sequence AS cs (project_id, seq)
+        VALUES (:project_id, 1)
+        ON CONFLICT (project_id) DO UPDATE SET seq = cs.seq + 1
+        RETURNING seq)
+    INSERT INTO change_event (project_id, seq, created, object_type,
+                              object_id, action)
+    SELECT :project_id, seq, :created, :object_type, :object_id, :action
+    FROM next;
+    ''')
+
+RECORD_MANY_SQL = text('''
+    WITH next AS (
+        INSERT INTO change_sequence AS cs (project_id, seq)
+        VALUES (:project_id, :n_events)
+        ON CONFLICT (project_id) DO UPDATE SET seq = cs.seq + EXCLUDED.seq
+        RETURNING seq)
+    INSERT INTO change_event (project_id, seq, created, object_type,
+                              object_id, action)
+    SELECT :project_id, next.seq - :n_events + ids.n, :created, :object_type,
+           ids.object_id, :action
+    FROM next, unnest(CAST(:object_ids AS integer[]))
+    WITH ORDINALITY AS ids (object_id, n);
+    ''')
+
+
+def record(conn, project_id, object_type, object_id, action):
+    """Append a change event to the feed of a project."""
+    conn.execute(RECORD_SQL, dict(project_id=project_id,
+                                  created=make_timestamp(),
+                                  object_type=object_type,
+                                  object_id=object_id, action=action))
+
+
+def record_many(conn, project_id, object_type, object_ids, action):
+    """Append a change event per object to the feed of a project, e.g. for
+    the objects changed by a raw SQL statement."""
+    if not object_ids:
+        return
+    conn.execute(RECORD_MANY_SQL, dict(project_id=project_id,
+                                       n_events=len(object_ids),
+                                       created=make_timestamp(),
+                                       object_type=object_type,
+                                       object_ids=list(object_ids),
+                                       action=action))
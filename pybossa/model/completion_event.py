@@ -1,4 +1,5 @@
 from pybossa.core import db, project_repo
+from pybossa.model import task_completion
 
 
 def mark_if_complete(task_id, project_id):
@@ -7,6 +8,18 @@ def mark_if_complete(task_id, project_id):
         update_task_state(task_id)
 
 
+def mark_tasks_if_complete(task_ids, project_id):
+    project = project_repo.get(project_id)
+    if not project.published or not task_ids:
+        return
+    condition = ("task.id = ANY(:task_ids) \
+                 AND task.n_answers <= (SELECT COUNT(id) FROM task_run \
+                                        WHERE task_run.task_id = task.id)")
+    task_completion.complete_tasks(db.session, condition,
+                                   task_ids=list(task_ids))
+    db.session.commit()
+
+
 def is_task_completed(task_id):
     sql_query = ('select count(id) from task_run \
                  where task_run.task_id=:task_id')
@@ -18,7 +31,6 @@ def is_task_completed(task_id):
 
 
 def update_task_state(task_id):
-    sql_query = ("UPDATE task SET state='completed' \
-                 where id = :task_id")
-    db.session.execute(sql_query, dict(task_id=task_id))
+    task_completion.complete_tasks(db.session, 'task.id = :task_id',
+                                   task_id=task_id)
     db.session.commit()
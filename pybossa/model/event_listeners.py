@@ -19,7 +19,7 @@ from datetime import datetime
 from flask import current_app
 
 from rq import Queue
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 
 from flask import url_for
 
@@ -34,10 +34,13 @@ from pybossa.model.webhook import Webhook
 from pybossa.model.user import User
 from pybossa.model.result import Result
 from pybossa.model.counter import Counter
+from pybossa.model import change_event, task_completion, user_contribution
+from pybossa.model import task_search
 from pybossa.core import result_repo, db
 from pybossa.jobs import webhook, notify_blog_users
 from pybossa.jobs import push_notification
 from pybossa.cache import projects as cached_projects
+from pybossa.cache import project_stats as cached_project_stats
 
 from pybossa.core import sentinel
 from pybossa.sched import Schedulers
@@ -117,6 +120,18 @@ def before_add_task_event(mapper, conn, target):
             redis_conn.hset('updated_project_ids', target.project_id, make_timestamp())
 
 
+@event.listens_for(Task, 'before_insert')
+@event.listens_for(Task, 'before_update')
+def set_task_info_tsv(mapper, conn, target):
+    """Build the search vector of the task info in the same statement."""
+    state = inspect(target)
+    if state.persistent and not state.attrs.info.history.has_changes():
+        return
+    language = current_app.config.get('FULLTEXTSEARCH_LANGUAGE', 'english')
+    target.info_tsv = task_search.info_tsv_clause(target.project_id,
+                                                  target.info, language)
+
+
 @event.listens_for(Task, 'after_insert')
 def add_task_event(mapper, conn, target):
     """Update PYBOSSA feed with new task."""
@@ -174,9 +189,7 @@ def is_task_completed(conn, task_id, project_id):
 
 
 def update_task_state(conn, task_id):
-    sql_query = ("UPDATE task SET state=\'completed\' \
-                 where id=%s") % task_id
-    conn.execute(sql_query)
+    task_completion.complete_tasks(conn, 'task.id=:task_id', task_id=task_id)
 
 
 def push_webhook(project_obj, task_id, result_id):
@@ -208,6 +221,7 @@ def create_result(conn, project_id, task_id):
             sql_query = ("""UPDATE result SET last_version=false \
                            WHERE id=%s;""") % (r.id)
             conn.execute(sql_query)
+            change_event.record(conn, project_id, 'result', r.id, 'update')
 
     sql_query = """INSERT INTO result
                    (created, project_id, task_id, task_run_ids, last_version)
@@ -225,15 +239,18 @@ def create_result(conn, project_id, task_id):
 
     results = conn.execute(sql_query)
     for r in results:
+        change_event.record(conn, project_id, 'result', r.id, 'insert')
         return r.id
 
 
 @event.listens_for(TaskRun, 'after_insert')
 def on_taskrun_submit(mapper, conn, target):
     """Update the task.state when n_answers condition is met."""
-    # Get project details
+    # Get project details. The project row is locked first, as update_project
+    # does for the other objects, so that every write locks it before the
+    # change_sequence row of the project and they never deadlock.
     sql_query = ('select name, short_name, published, webhook, info from project \
-                 where id=%s') % target.project_id
+                 where id=%s for no key update') % target.project_id
     results = conn.execute(sql_query)
     tmp = dict()
     for r in results:
@@ -270,6 +287,17 @@ def update_project(mapper, conn, target):
     update_project_timestamp(mapper, conn, target)
 
 
+@event.listens_for(Task, 'after_insert')
+@event.listens_for(Task, 'after_update')
+@event.listens_for(Task, 'after_delete')
+@event.listens_for(TaskRun, 'after_insert')
+@event.listens_for(TaskRun, 'after_update')
+@event.listens_for(TaskRun, 'after_delete')
+def mark_project_stats_dirty(mapper, conn, target):
+    """Flag the project stats to be refreshed by the periodic job."""
+    cached_project_stats.mark_dirty(target.project_id)
+
+
 @event.listens_for(Webhook, 'after_update')
 def update_timestamp(mapper, conn, target):
     """Update domain object with timestamp."""
@@ -317,3 +345,42 @@ def decrease_task_counter(mapper, conn, target):
                  VALUES (TIMESTAMP '%s', %s, %s, -1)"
                  % (make_timestamp(), target.project_id, target.task_id))
     conn.execute(sql_query)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_user_contribution(mapper, conn, target):
+    user_contribution.add_task_run(conn, target)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_user_contribution(mapper, conn, target):
+    user_contribution.remove_task_run(conn, target)
+
+
+CHANGE_FEED_TYPES = {Task: 'task', TaskRun: 'taskrun', Result: 'result'}
+
+
+def add_change_event(mapper, conn, target, action):
+    change_event.record(conn, target.project_id,
+                        CHANGE_FEED_TYPES[mapper.class_], target.id, action)
+
+
+@event.listens_for(Task, 'after_insert')
+@event.listens_for(TaskRun, 'after_insert')
+@event.listens_for(Result, 'after_insert')
+def add_insert_change_event(mapper, conn, target):
+    add_change_event(mapper, conn, target, 'insert')
+
+
+@event.listens_for(Task, 'after_update')
+@event.listens_for(TaskRun, 'after_update')
+@event.listens_for(Result, 'after_update')
+def add_update_change_event(mapper, conn, target):
+    add_change_event(mapper, conn, target, 'update')
+
+
+@event.listens_for(Task, 'after_delete')
+@event.listens_for(TaskRun, 'after_delete')
+@event.listens_for(Result, 'after_delete')
+def add_delete_change_event(mapper, conn, target):
+    add_change_event(mapper, conn, target, 'delete')
@@ -19,8 +19,8 @@
 from sqlalchemy import Integer, Boolean, Float, UnicodeText, Text
 import sqlalchemy
 from sqlalchemy.schema import Column, ForeignKey, Index
-from sqlalchemy.orm import relationship, backref
-from sqlalchemy.dialects.postgresql import JSONB, ARRAY
+from sqlalchemy.orm import relationship, backref, deferred
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY, TSVECTOR
 from sqlalchemy.ext.mutable import MutableList
 from pybossa.core import db
 from pybossa.model import DomainObject, make_timestamp
@@ -57,9 +57,16 @@ class Task(db.Model, DomainObject):
     exported = Column(Boolean, default=False)
     #: Task.user_pref field in JSONB with user preference data for the task.
     user_pref = Column(JSONB)
+    #: Full text search vector of the Task.info values, see task_search.
+    info_tsv = deferred(Column(TSVECTOR))
 
     task_runs = relationship(TaskRun, cascade='all, delete, delete-orphan', backref='task')
 
+    def dictize(self):
+        """Return the task as a dict, without its search vector."""
+        return dict((col.name, getattr(self, col.name))
+                    for col in self.__table__.c if col.name != 'info_tsv')
+
     def pct_status(self):
         """Returns the percentage of Tasks that are completed"""
         if self.n_answers != 0 and self.n_answers is not None:
@@ -72,3 +79,7 @@ class Task(db.Model, DomainObject):
     )
 
 Index('task_project_id_idx', Task.project_id)
+Index('task_fav_user_ids_idx', Task.fav_user_ids, postgresql_using='gin')
+Index('task_info_tsv_idx', Task.info_tsv, postgresql_using='gin')
+Index('task_info_tsv_missing_idx', Task.project_id,
+      postgresql_where=Task.info_tsv.is_(None))
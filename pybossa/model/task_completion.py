@@ -0,0 +1,108 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2017 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import defaultdict
+
+from sqlalchemy import BigInteger, Integer, Text
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy.sql import text
+from pybossa.core import db
+from pybossa.model import DomainObject, make_timestamp, change_event
+
+
+class TaskCompletion(db.Model, DomainObject):
+    '''A TaskCompletion logs a Task reaching the completed state.'''
+
+    __tablename__ = 'task_completion'
+
+    #: TaskCompletion.ID, increasing in the order of the completions.
+    id = Column(BigInteger, primary_key=True)
+    #: UTC timestamp when the task was completed.
+    created = Column(Text, default=make_timestamp)
+    #: Task.ID of the completed task.
+    task_id = Column(Integer, ForeignKey('task.id', ondelete='CASCADE'),
+                     nullable=False)
+    #: Project.ID of the completed task.
+    project_id = Column(Integer, ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                        nullable=False)
+
+    __table_args__ = (Index('task_completion_project_id_idx',
+                            project_id, id),)
+
+
+# Keys of the advisory locks ordering the ids of the completions. Writers
+# take the global lock and the lock of each of their projects shared before
+# drawing ids, so they don't wait for each other, and a reader takes the one
+# of its scope exclusive to wait for the writers in flight. Once it gets it
+# every id drawn so far in its scope is committed or rolled back, so the ids
+# up to the highest one it sees will never be followed by a lower one.
+# Readers of a project only wait for, and stall, the writers of that project.
+LOCK_KEY = 0x7461736b636f6d70
+PROJECT_LOCK_CLASS = 0x7461736b
+
+COMPLETE_TASKS_SQL = '''
+    WITH completed AS (
+        UPDATE task SET state='completed' {0}
+        WHERE {1} AND task.state != 'completed'
+        RETURNING task.id, task.project_id),
+    locked AS (
+        SELECT pg_advisory_xact_lock_shared(:lock_key),
+               pg_advisory_xact_lock_shared(:lock_class, project_id)
+        FROM (SELECT DISTINCT project_id FROM completed) AS projects)
+    INSERT INTO task_completion (created, task_id, project_id)
+    SELECT :completed_at, completed.id, completed.project_id
+    FROM completed
+    WHERE (SELECT COUNT(*) FROM locked) > 0
+    RETURNING task_id, project_id;
+    '''
+
+def complete_tasks(conn, condition, from_clause='', **params):
+    """Set the tasks matching condition as completed, and log the ones that
+    were not completed yet and their change events. conn can be a connection
+    or a session."""
+    if from_clause:
+        from_clause = 'FROM {}'.format(from_clause)
+    sql = text(COMPLETE_TASKS_SQL.format(from_clause, condition))
+    completed = defaultdict(list)
+    for row in conn.execute(sql, dict(params, completed_at=make_timestamp(),
+                                      lock_key=LOCK_KEY,
+                                      lock_class=PROJECT_LOCK_CLASS)):
+        completed[row.project_id].append(row.task_id)
+    for project_id, task_ids in completed.iteritems():
+        change_event.record_many(conn, project_id, 'task', task_ids,
+                                 'update')
+
+
+def get_horizon(conn, project_id=None):
+    """Return the highest completion id, of the project if given, that can
+    be read without skipping a lower one committed later, or None. conn must
+    be a connection to the primary outside of a transaction."""
+    with conn.begin():
+        if project_id is None:
+            conn.execute(text('SELECT pg_advisory_xact_lock(:lock_key)'),
+                         dict(lock_key=LOCK_KEY))
+            return conn.execute(text('SELECT MAX(id) FROM task_completion'))\
+                       .scalar()
+        conn.execute(text('SELECT pg_advisory_xact_lock(:lock_class, '
+                          ':project_id)'),
+                     dict(lock_class=PROJECT_LOCK_CLASS,
+                          project_id=project_id))
+        return conn.execute(text('''SELECT MAX(id) FROM task_completion
+                                   WHERE project_id=:project_id'''),
+                            dict(project_id=project_id)).scalar()
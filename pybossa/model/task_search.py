@@ -0,0 +1,111 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2017 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+SQL helpers maintaining task.info_tsv, the full text search vector of the
+values of task.info.
+
+It is built with the text search configuration named in the
+text_search_language key of the project info, falling back to the
+FULLTEXTSEARCH_LANGUAGE setting, and it is served by a GIN index. The tasks
+without it are found with a partial index, filled by the ORM on insert
+and update and by the index_task_info_tsv job for the older ones.
+
+"""
+import json
+
+from sqlalchemy.sql import text
+
+
+LANGUAGE_SQL = '''
+    COALESCE((SELECT pg_ts_config.cfgname::text FROM pg_ts_config, project
+              WHERE project.id = {0}
+              AND pg_ts_config.cfgname = project.info->>'text_search_language'),
+             :tsv_language)'''
+
+INFO_TEXT_SQL = '''
+    COALESCE(CASE WHEN jsonb_typeof({0}) = 'object'
+             THEN (SELECT string_agg(value, ' ') FROM jsonb_each_text({0}))
+             ELSE {0} #>> '{{}}' END, '')'''
+
+UPDATE_BATCH_SQL = '''
+    WITH batch AS (
+        SELECT id FROM task WHERE project_id=:project_id
+        AND id > :last_id {0} ORDER BY id LIMIT :batch_size)
+    UPDATE task SET info_tsv = {1}
+    FROM batch WHERE task.id = batch.id RETURNING task.id;
+    '''
+
+
+def _info_tsv_sql(project_id, info):
+    return 'to_tsvector(CAST({0} AS regconfig), {1})'.format(
+        LANGUAGE_SQL.format(project_id), INFO_TEXT_SQL.format(info))
+
+
+def info_tsv_clause(project_id, info, language):
+    """Return the SQL expression of the search vector of a task, to be
+    assigned to Task.info_tsv before a flush."""
+    sql = _info_tsv_sql(':tsv_project_id', 'CAST(:tsv_info AS jsonb)')
+    return text(sql).bindparams(tsv_project_id=project_id,
+                                tsv_info=json.dumps(info),
+                                tsv_language=language)
+
+
+def get_search_settings(conn, project_id, language):
+    """Return the text search configuration of a project and whether the
+    search vectors of all its tasks are built."""
+    sql = text('''SELECT {0} AS language, NOT EXISTS
+               (SELECT 1 FROM task WHERE project_id=:project_id
+                AND info_tsv IS NULL) AS ready;'''
+               .format(LANGUAGE_SQL.format(':project_id')))
+    row = conn.execute(sql, dict(project_id=project_id,
+                                 tsv_language=language)).first()
+    return row.language, row.ready
+
+
+def get_projects_to_index(conn):
+    """Return the ids of the projects with tasks without search vector."""
+    sql = text('''SELECT DISTINCT project_id FROM task
+               WHERE info_tsv IS NULL;''')
+    return [row.project_id for row in conn.execute(sql)]
+
+
+def _update_batch(conn, sql, params):
+    ids = [row.id for row in conn.execute(text(sql), params)]
+    return len(ids), max(ids) if ids else None
+
+
+def update_batch(conn, project_id, last_id, batch_size, language):
+    """Build the missing search vectors among the next batch of tasks of a
+    project after last_id. Return the number of tasks updated and the last
+    id of the batch, None when there are no tasks left."""
+    sql = UPDATE_BATCH_SQL.format(
+        'AND info_tsv IS NULL', _info_tsv_sql('task.project_id', 'task.info'))
+    return _update_batch(conn, sql, dict(project_id=project_id,
+                                         last_id=last_id,
+                                         batch_size=batch_size,
+                                         tsv_language=language))
+
+
+def clear_batch(conn, project_id, last_id, batch_size):
+    """Clear the search vectors of the next batch of tasks of a project, so
+    that they are built again, e.g. with a new language. Return the same as
+    update_batch."""
+    sql = UPDATE_BATCH_SQL.format('AND info_tsv IS NOT NULL', 'NULL')
+    return _update_batch(conn, sql, dict(project_id=project_id,
+                                         last_id=last_id,
+                                         batch_size=batch_size))
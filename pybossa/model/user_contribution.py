@@ -0,0 +1,166 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2017 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+
+from sqlalchemy import Integer, Interval, Text
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy.sql import text
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class UserContribution(db.Model, DomainObject):
+    '''A UserContribution sums up the task runs of a User in a Project.'''
+
+    __tablename__ = 'user_contribution'
+
+    #: User.ID of the contributor.
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'),
+                     primary_key=True)
+    #: Project.ID the task runs belong to.
+    project_id = Column(Integer, ForeignKey('project.id',
+                                            ondelete='CASCADE'),
+                        primary_key=True)
+    #: Number of task runs submitted.
+    n_task_runs = Column(Integer, default=0, nullable=False)
+    #: finish_time of the first task run.
+    first_submission_date = Column(Text)
+    #: finish_time of the last task run.
+    last_submission_date = Column(Text)
+    #: Time spent on the task runs with a valid created and finish_time.
+    total_time = Column(Interval)
+    #: Number of task runs added up in total_time.
+    timed_runs = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index('user_contribution_project_id_idx', project_id),)
+
+
+TASK_RUN_DURATION = """(to_timestamp(finish_time, 'YYYY-MM-DD"T"HH24-MI-SS.US') -
+                        to_timestamp(created, 'YYYY-MM-DD"T"HH24-MI-SS.US'))"""
+
+# Contributions of each user per project, recomputed from task_run
+USER_CONTRIBUTIONS_SQL = """
+    SELECT user_id, project_id, COUNT(*) AS n_task_runs,
+           MIN(finish_time) AS first_submission_date,
+           MAX(finish_time) AS last_submission_date,
+           SUM({duration}) AS total_time,
+           COUNT({duration}) AS timed_runs
+    FROM task_run WHERE user_id IS NOT NULL AND project_id=:project_id
+    GROUP BY user_id, project_id
+    """.format(duration=TASK_RUN_DURATION)
+
+ADD_TASK_RUN_SQL = text('''
+    INSERT INTO user_contribution AS uc (user_id, project_id, n_task_runs,
+        first_submission_date, last_submission_date, total_time, timed_runs)
+    VALUES (:user_id, :project_id, 1, :finish_time, :finish_time,
+            :duration, :timed)
+    ON CONFLICT (user_id, project_id) DO UPDATE SET
+        n_task_runs = uc.n_task_runs + 1,
+        first_submission_date = LEAST(uc.first_submission_date,
+                                      EXCLUDED.first_submission_date),
+        last_submission_date = GREATEST(uc.last_submission_date,
+                                        EXCLUDED.last_submission_date),
+        total_time = COALESCE(uc.total_time + EXCLUDED.total_time,
+                              uc.total_time, EXCLUDED.total_time),
+        timed_runs = uc.timed_runs + EXCLUDED.timed_runs;
+    ''')
+
+REMOVE_TASK_RUN_SQL = text('''
+    UPDATE user_contribution SET n_task_runs = n_task_runs - 1,
+        total_time = total_time - COALESCE(:duration, interval '0s'),
+        timed_runs = timed_runs - :timed
+    WHERE user_id=:user_id AND project_id=:project_id;
+    ''')
+
+# Deletes task runs with a raw statement, so the ORM listeners don't run
+DELETE_TASK_RUNS_SQL = """
+    WITH deleted AS (
+        DELETE FROM task_run WHERE {{}}
+        RETURNING user_id, project_id, created, finish_time),
+    removed AS (
+        SELECT user_id, project_id, COUNT(*) AS n_task_runs,
+               SUM({duration}) AS total_time,
+               COUNT({duration}) AS timed_runs
+        FROM deleted WHERE user_id IS NOT NULL
+        GROUP BY user_id, project_id)
+    UPDATE user_contribution AS uc SET
+        n_task_runs = uc.n_task_runs - removed.n_task_runs,
+        total_time = uc.total_time - COALESCE(removed.total_time,
+                                              interval '0s'),
+        timed_runs = uc.timed_runs - removed.timed_runs
+    FROM removed WHERE uc.user_id = removed.user_id
+    AND uc.project_id = removed.project_id;
+    """.format(duration=TASK_RUN_DURATION)
+
+
+def _parse_timestamp(timestamp):
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(timestamp, fmt)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def _task_run_params(taskrun):
+    created = _parse_timestamp(taskrun.created)
+    finished = _parse_timestamp(taskrun.finish_time)
+    duration = finished - created if created and finished else None
+    return dict(user_id=taskrun.user_id, project_id=taskrun.project_id,
+                finish_time=taskrun.finish_time, duration=duration,
+                timed=int(duration is not None))
+
+
+def add_task_run(conn, taskrun):
+    """Add a new task run to the contributions of its user."""
+    if taskrun.user_id is not None:
+        conn.execute(ADD_TASK_RUN_SQL, _task_run_params(taskrun))
+
+
+def remove_task_run(conn, taskrun):
+    """Remove a deleted task run from the contributions of its user. The
+    first and last submission dates are fixed by the next rebuild."""
+    if taskrun.user_id is not None:
+        conn.execute(REMOVE_TASK_RUN_SQL, _task_run_params(taskrun))
+
+
+def delete_task_runs(conn, condition, **params):
+    """Delete the task runs matching condition and remove them from the
+    contributions of their users, without recomputing the whole project.
+    The first and last submission dates are fixed by the next rebuild."""
+    conn.execute(text(DELETE_TASK_RUNS_SQL.format(condition)), params)
+
+
+def rebuild(session, project_id):
+    """Recompute from task_run the contributions to a project, e.g. after
+    deleting task runs in bulk."""
+    # A task run submitted meanwhile can add a row after the delete
+    session.execute(text('''
+        DELETE FROM user_contribution WHERE project_id=:project_id;
+        INSERT INTO user_contribution AS uc (user_id, project_id,
+            n_task_runs, first_submission_date, last_submission_date,
+            total_time, timed_runs) {}
+        ON CONFLICT (user_id, project_id) DO UPDATE SET
+            n_task_runs = EXCLUDED.n_task_runs,
+            first_submission_date = EXCLUDED.first_submission_date,
+            last_submission_date = EXCLUDED.last_submission_date,
+            total_time = EXCLUDED.total_time,
+            timed_runs = EXCLUDED.timed_runs;
+        '''.format(USER_CONTRIBUTIONS_SQL)), dict(project_id=project_id))
+    session.commit()
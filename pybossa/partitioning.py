@@ -0,0 +1,242 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA list partitioning of task_run by project_id.
+
+The conversion of an existing task_run table is done online, outside of
+alembic, with the cli.py commands that call these functions:
+
+1. prepare() creates task_run_partitioned, partitioned by project_id with a
+   task_run_default partition, and a trigger mirroring the writes of
+   task_run into it.
+2. backfill() copies the existing rows in batches of ids. The source rows
+   are locked FOR SHARE while copied, so the trigger never misses a
+   concurrent update or delete.
+3. swap() renames the tables in a short transaction. The old table is kept
+   as task_run_unpartitioned until it is dropped by hand.
+
+Every project lives in task_run_default until add_project_partition()
+moves it to a partition of its own, e.g. for the large ones. The task runs
+of a project with its own partition are then deleted by truncating or
+dropping it, without a vacuum of the whole table. Truncating only locks the
+partition, but detaching it locks the whole task_run table, stalling every
+submission, so deleting a project truncates its partition and leaves the
+empty table to be detached and dropped off peak.
+
+The primary key becomes (id, project_id) and the unique index on the task
+run contributors gets project_id too, as PostgreSQL requires the partition
+key in them. As the task determines the project, the constraint is the
+same. It requires PostgreSQL 11.
+
+"""
+from sqlalchemy.sql import text
+
+
+TABLE = 'task_run'
+PARTITIONED_TABLE = 'task_run_partitioned'
+OLD_TABLE = 'task_run_unpartitioned'
+DEFAULT_PARTITION = 'task_run_default'
+PARTITION_PREFIX = 'task_run_p'
+BATCH_SIZE = 10000
+
+INDEXES = [
+    ('task_run_task_id_idx', '(task_id)'),
+    ('task_run_user_id_idx', '(user_id)'),
+    ('task_run_project_id_idx', '(project_id)'),
+    ('unique_user_id_task_id_idx',
+     '(project_id, task_id, user_id, user_ip, external_uid)')]
+
+COLUMNS = ('id', 'created', 'project_id', 'task_id', 'user_id', 'user_ip',
+           'finish_time', 'timeout', 'calibration', 'external_uid', 'info')
+
+MIRROR_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION task_run_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {table} WHERE id = OLD.id
+            AND project_id = OLD.project_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {table} ({columns}) VALUES ({new_columns})
+            ON CONFLICT (id, project_id) DO UPDATE SET ({columns}) =
+            ({excluded_columns});
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    '''.format(table=PARTITIONED_TABLE, columns=', '.join(COLUMNS),
+               new_columns=', '.join('NEW.' + c for c in COLUMNS),
+               excluded_columns=', '.join('EXCLUDED.' + c for c in COLUMNS))
+
+
+def _execute(conn, statements):
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def is_partitioned(conn):
+    """Return whether task_run is a partitioned table."""
+    sql = text('''SELECT relkind FROM pg_class
+               WHERE relname=:table AND relkind='p';''')
+    return conn.execute(sql, dict(table=TABLE)).first() is not None
+
+
+def partition_name(project_id):
+    return '{0}{1}'.format(PARTITION_PREFIX, int(project_id))
+
+
+def get_project_partition(conn, project_id):
+    """Return the name of the partition of a project, or None when its
+    task runs are in the default partition."""
+    sql = text('''SELECT child.relname FROM pg_inherits
+               JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+               JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+               WHERE parent.relname=:table AND child.relname=:name;''')
+    row = conn.execute(sql, dict(table=TABLE,
+                                 name=partition_name(project_id))).first()
+    return row.relname if row else None
+
+
+def prepare(conn):
+    """Create the partitioned copy of task_run and start mirroring the
+    writes into it."""
+    statements = [
+        '''CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS
+           INCLUDING CONSTRAINTS) PARTITION BY LIST (project_id)'''
+        .format(PARTITIONED_TABLE, TABLE),
+        'ALTER TABLE {0} ADD PRIMARY KEY (id, project_id)'
+        .format(PARTITIONED_TABLE),
+        '''ALTER TABLE {0} ADD FOREIGN KEY (project_id)
+           REFERENCES project(id)'''.format(PARTITIONED_TABLE),
+        '''ALTER TABLE {0} ADD FOREIGN KEY (task_id)
+           REFERENCES task(id) ON DELETE CASCADE'''.format(PARTITIONED_TABLE),
+        '''ALTER TABLE {0} ADD FOREIGN KEY (user_id)
+           REFERENCES "user"(id)'''.format(PARTITIONED_TABLE),
+        'CREATE TABLE {0} PARTITION OF {1} DEFAULT'
+        .format(DEFAULT_PARTITION, PARTITIONED_TABLE)]
+    # Named after the final ones, renamed by swap
+    for name, columns in INDEXES:
+        statements.append('CREATE {0}INDEX {1}_new ON {2} {3}'.format(
+            'UNIQUE ' if name.startswith('unique') else '', name,
+            PARTITIONED_TABLE, columns))
+    statements += [
+        MIRROR_FUNCTION,
+        '''CREATE TRIGGER task_run_mirror AFTER INSERT OR UPDATE OR DELETE
+           ON {0} FOR EACH ROW EXECUTE PROCEDURE task_run_mirror()'''
+        .format(TABLE)]
+    with conn.begin():
+        _execute(conn, statements)
+
+
+def backfill(conn, start_id=0, batch_size=BATCH_SIZE, progress=None):
+    """Copy the rows of task_run into the partitioned table, one batch of
+    ids per transaction. It can be resumed from start_id."""
+    max_id = conn.execute(text('SELECT MAX(id) FROM {0}'.format(TABLE)))\
+                 .scalar() or 0
+    sql = text('''
+        INSERT INTO {0} ({2})
+        SELECT {2} FROM {1} WHERE id > :start AND id <= :end FOR SHARE
+        ON CONFLICT (id, project_id) DO NOTHING
+        '''.format(PARTITIONED_TABLE, TABLE, ', '.join(COLUMNS)))
+    while start_id < max_id:
+        end_id = start_id + batch_size
+        with conn.begin():
+            conn.execute(sql, dict(start=start_id, end=end_id))
+        start_id = end_id
+        if progress:
+            progress(start_id, max_id)
+    return max_id
+
+
+def swap(conn):
+    """Replace task_run by the partitioned table. The materialized views
+    reading task_run are dropped, to be created again by their jobs."""
+    sql = text('''SELECT DISTINCT view.relname FROM pg_depend
+               JOIN pg_rewrite ON pg_rewrite.oid = pg_depend.objid
+               JOIN pg_class view ON view.oid = pg_rewrite.ev_class
+               WHERE pg_depend.refobjid = CAST(:table AS regclass)
+               AND view.relkind = 'm';''')
+    with conn.begin():
+        conn.execute(text('LOCK TABLE {0} IN ACCESS EXCLUSIVE MODE'
+                          .format(TABLE)))
+        views = [row.relname for row in conn.execute(sql,
+                                                     dict(table=TABLE))]
+        statements = ['DROP MATERIALIZED VIEW {0} CASCADE'.format(view)
+                      for view in views]
+        statements += [
+            'DROP TRIGGER task_run_mirror ON {0}'.format(TABLE),
+            'DROP FUNCTION task_run_mirror()',
+            'ALTER TABLE {0} RENAME TO {1}'.format(TABLE, OLD_TABLE),
+            'ALTER TABLE {0} RENAME TO {1}'.format(PARTITIONED_TABLE, TABLE),
+            'ALTER SEQUENCE task_run_id_seq OWNED BY {0}.id'.format(TABLE)]
+        for name, _ in INDEXES:
+            statements += [
+                'ALTER INDEX {0} RENAME TO {0}_unpartitioned'.format(name),
+                'ALTER INDEX {0}_new RENAME TO {0}'.format(name)]
+        _execute(conn, statements)
+    return views
+
+
+def add_project_partition(conn, project_id):
+    """Move the task runs of a project from the default partition to a
+    partition of its own. The default partition is locked against writes
+    until the move is committed, so no task run is left behind."""
+    name = partition_name(project_id)
+    project_id = int(project_id)
+    columns = ', '.join(COLUMNS)
+    with conn.begin():
+        _execute(conn, [
+            'LOCK TABLE {0} IN SHARE ROW EXCLUSIVE MODE'.format(
+                DEFAULT_PARTITION),
+            '''CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS
+               INCLUDING CONSTRAINTS)'''.format(name, TABLE),
+            # A single statement, so the rows deleted are the rows copied
+            '''WITH moved AS (DELETE FROM {1} WHERE project_id = {2}
+                              RETURNING {3})
+               INSERT INTO {0} ({3}) SELECT {3} FROM moved'''.format(
+                name, DEFAULT_PARTITION, project_id, columns),
+            # Skips the scan of the partition when it is attached
+            '''ALTER TABLE {0} ADD CONSTRAINT {0}_project_id_check
+               CHECK (project_id = {1})'''.format(name, project_id),
+            'ALTER TABLE {0} ATTACH PARTITION {1} FOR VALUES IN ({2})'
+            .format(TABLE, name, project_id)])
+    return name
+
+
+def truncate_project_partition(conn, project_id):
+    """Delete every task run of a project with its own partition. Return
+    False when the project has no partition."""
+    name = get_project_partition(conn, project_id)
+    if name is None:
+        return False
+    conn.execute(text('TRUNCATE {0}'.format(name)))
+    return True
+
+
+def drop_project_partition(conn, project_id, detach_only=False):
+    """Detach the partition of a project and drop it, unless detach_only,
+    e.g. to archive it. Return the name of the partition or None. It takes
+    an ACCESS EXCLUSIVE lock on task_run until the transaction ends."""
+    name = get_project_partition(conn, project_id)
+    if name is None:
+        return None
+    _execute(conn, ['ALTER TABLE {0} DETACH PARTITION {1}'.format(TABLE,
+                                                                    name)])
+    if not detach_only:
+        _execute(conn, ['DROP TABLE {0}'.format(name)])
+    return name
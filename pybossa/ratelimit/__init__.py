@@ -24,9 +24,13 @@ This module exports:
     * ratelimit decorator: for decorating the views
 
 """
+import hashlib
+import threading
 import time
+import uuid
 from functools import update_wrapper, wraps
 from flask import request, g
+from redis.exceptions import NoScriptError
 from werkzeug.exceptions import TooManyRequests
 from pybossa.core import sentinel, anonymizer
 from pybossa.error import ErrorStatus
@@ -36,21 +40,49 @@ from flask import current_app
 error = ErrorStatus()
 
 
+# Sliding window log: the hits of the last window are kept in a sorted set
+# scored by their time in milliseconds. Up to ARGV[4] hits are added if they
+# fit in the limit. Returns the hits in the window, the hits added and the
+# time of the oldest hit.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local hits = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+local granted = math.max(math.min(hits, limit - count), 0)
+for i = 1, granted do
+    redis.call('ZADD', key, now, ARGV[5] .. ':' .. i)
+end
+redis.call('PEXPIRE', key, window)
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')[2] or now
+return {count + granted, granted, tonumber(oldest)}
+"""
+
+SLIDING_WINDOW_SHA = hashlib.sha1(SLIDING_WINDOW_SCRIPT).hexdigest()
+# The clock of the windows and of the local batches
+_now = time.time
+_local_tokens = {}
+_local_lock = threading.Lock()
+MAX_LOCAL_KEYS = 10000
+
+
 class RateLimit(object):
 
     """
     Limit the number of requests.
 
-    It uses a Redis pipe from the master node (configured via Sentinel) to
-    limit the number of requests.
+    It uses a sliding window of per seconds, kept in the master node
+    (configured via Sentinel) by a Lua script. With RATE_LIMIT_LOCAL_BATCH
+    hits are reserved in batches and spent locally by the process, which
+    saves most of the calls to Redis at the cost of a stricter limit.
 
     """
 
-    expiration_window = 10
-
     def __init__(self, key_prefix, limit, per, send_x_headers):
-        self.reset = (int(time.time()) // per) * per + per
-        self.key = key_prefix + str(self.reset)
+        self.key = key_prefix
         self.limit = limit
         self.per = per
         self.send_x_headers = send_x_headers
@@ -58,16 +90,57 @@ class RateLimit(object):
         if not current_user.is_anonymous() and current_user.admin:
             self.limit *= current_app.config.get("ADMIN_RATE_MULTIPLIER", 1)
 
-        p = sentinel.master.pipeline()
-        p.incr(self.key)
-        p.expireat(self.key, self.reset + self.expiration_window)
-
-        self.current = min(p.execute()[0], limit)
+        batch = current_app.config.get('RATE_LIMIT_LOCAL_BATCH', 1)
+        if batch > 1:
+            max_age = current_app.config.get('RATE_LIMIT_LOCAL_MAX_AGE', 1)
+            self.current, self.reset = _hit_local(self.key, self.limit, per,
+                                                  batch, max_age)
+        else:
+            count, _, self.reset = _reserve(self.key, self.limit, per, 1)
+            self.current = min(count, self.limit)
 
     remaining = property(lambda x: x.limit - x.current)
     over_limit = property(lambda x: x.current >= x.limit)
 
 
+def _reserve(key, limit, per, hits):
+    """Add up to hits to the sliding window of key. Returns the hits in the
+    window, the hits added and when the oldest one leaves the window."""
+    window = per * 1000
+    count, granted, oldest = _sliding_window(
+        [key], [int(_now() * 1000), window, limit, hits, uuid.uuid4().hex])
+    return count, granted, int((oldest + window) // 1000)
+
+
+def _sliding_window(keys, args):
+    """Run the sliding window script on the master. It is sent with EVAL
+    the first time a server sees it, so nothing is loaded at import time,
+    before the master is configured."""
+    conn = sentinel.master
+    try:
+        return conn.evalsha(SLIDING_WINDOW_SHA, len(keys), *(keys + args))
+    except NoScriptError:
+        return conn.eval(SLIDING_WINDOW_SCRIPT, len(keys), *(keys + args))
+
+
+def _hit_local(key, limit, per, batch, max_age):
+    with _local_lock:
+        tokens = _local_tokens.get(key)
+        if tokens is None or tokens['left'] == 0 or \
+                tokens['expires'] < _now():
+            count, granted, reset = _reserve(key, limit, per, batch)
+            if not granted:
+                return min(count, limit), reset
+            if len(_local_tokens) >= MAX_LOCAL_KEYS:
+                _local_tokens.clear()
+            tokens = _local_tokens[key] = dict(
+                current=count - granted, left=granted, reset=reset,
+                expires=_now() + min(max_age, per))
+        tokens['current'] += 1
+        tokens['left'] -= 1
+        return tokens['current'], tokens['reset']
+
+
 def get_view_rate_limit():
     """Return the rate limit values."""
     return getattr(g, '_view_rate_limit', None)
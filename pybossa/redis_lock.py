@@ -9,14 +9,17 @@ def get_active_user_key(project_id):
     return ACTIVE_USER_KEY.format(project_id)
 
 
-def get_active_user_count(project_id, conn):
+def get_active_user_count(project_id, conn, read_conn=None):
+    """Return the number of active users in a project, removing the expired
+    ones. The users can be read from a replica with read_conn."""
     now = time()
     key = get_active_user_key(project_id)
-    to_delete = [user for user, expiration in conn.hgetall(key).iteritems()
+    users = (read_conn or conn).hgetall(key)
+    to_delete = [user for user, expiration in users.iteritems()
                  if float(expiration) < now]
     if to_delete:
         conn.hdel(key, *to_delete)
-    return conn.hlen(key)
+    return len(users) - len(to_delete)
 
 
 def register_active_user(project_id, user_id, conn, ttl=2*60*60):
@@ -74,6 +77,21 @@ class LockManager(object):
         now = time()
         return expiration > now
 
+    def has_locks(self, resource_ids, client_id):
+        """
+        Check several locks with a single round trip.
+        :param resource_ids: resources on which locks are being held
+        :param client_id: client id
+        :return: a list with, for each resource, True if client id holds a
+        lock on it, False otherwise
+        """
+        pipeline = self._cache.pipeline(transaction=False)
+        for resource_id in resource_ids:
+            pipeline.hget(resource_id, client_id)
+        now = time()
+        return [time_str is not None and float(time_str) > now
+                for time_str in pipeline.execute()]
+
     def release_lock(self, resource_id, client_id, pipeline=None):
         """
         Release a lock. Note that the lock is not release immediately, rather
@@ -0,0 +1,162 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA routing of pure reads to the database replicas.
+
+Repository methods that only read use ReplicaRouter.session(). It returns a
+replica session while handling GET and HEAD requests, and the primary one
+otherwise, e.g. for POST requests and background jobs. Once a request writes
+to the primary the rest of its reads go to the primary too, so a request
+always reads its own writes.
+
+The replicas are the slave bind plus the binds listed in
+SQLALCHEMY_REPLICA_BINDS. With several of them, or with DB_REPLICA_MAX_LAG
+set, the replication lag of each one is checked every
+DB_REPLICA_LAG_CHECK_INTERVAL seconds and the least lagged replica below
+DB_REPLICA_MAX_LAG seconds is used, falling back to the primary.
+
+"""
+import threading
+import time
+
+from flask import _app_ctx_stack, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.sql import text
+
+
+READ_METHODS = ('GET', 'HEAD')
+# clock_timestamp, as now() is the start of the transaction. A replica that
+# has replayed everything it received is not lagging, even if the primary
+# has been idle since its last commit.
+REPLICA_LAG_SQL = '''SELECT CASE
+                     WHEN {0}() = {1}() THEN 0
+                     ELSE COALESCE(EXTRACT(EPOCH FROM clock_timestamp() -
+                          pg_last_xact_replay_timestamp()), 0) END;'''
+# The xlog functions were renamed in PostgreSQL 10
+WAL_FUNCTIONS = ('pg_last_wal_receive_lsn', 'pg_last_wal_replay_lsn')
+XLOG_FUNCTIONS = ('pg_last_xlog_receive_location',
+                  'pg_last_xlog_replay_location')
+
+
+class ReplicaRouter(object):
+
+    """Choose the session used for pure reads."""
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.replicas = []
+        self.enabled = True
+        self.max_lag = None
+        self.check_interval = 5
+        self._lags = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.enabled = app.config.get('DB_REPLICA_READS', True)
+        self.max_lag = app.config.get('DB_REPLICA_MAX_LAG')
+        self.check_interval = app.config.get('DB_REPLICA_LAG_CHECK_INTERVAL',
+                                             5)
+        self.replicas = []
+        if db.slave_session is not db.session:
+            self.replicas.append(('slave', db.slave_session))
+        extra_sessions = []
+        for bind in app.config.get('SQLALCHEMY_REPLICA_BINDS') or []:
+            engine = db.get_engine(app, bind=bind)
+            # Never flushed, so objects changed before they are saved on
+            # the primary are not written to the replica
+            options = dict(bind=engine, autoflush=False,
+                           scopefunc=_app_ctx_stack.__ident_func__)
+            extra_sessions.append(db.create_scoped_session(options=options))
+            self.replicas.append((bind, extra_sessions[-1]))
+        if not self.replicas:
+            return
+        if len(self.replicas) > 1 and self.max_lag is None:
+            self.max_lag = 10
+        event.listen(db.get_engine(app), 'before_cursor_execute',
+                     _pin_on_write)
+
+        if extra_sessions:
+            @app.teardown_appcontext
+            def _shutdown_replica_sessions(response_or_exc):  # pragma: no cover
+                for session in extra_sessions:
+                    session.remove()
+                return response_or_exc
+
+    def session(self):
+        """Return the session for a pure read."""
+        if not (self.replicas and self.enabled and has_request_context()):
+            return self.db.session
+        if request.method not in READ_METHODS or \
+                getattr(g, '_db_pinned', False):
+            return self.db.session
+        if not hasattr(g, '_db_replica'):
+            # The same replica serves the whole request
+            g._db_replica = self._choose()
+        return g._db_replica or self.db.session
+
+    def _choose(self):
+        if self.max_lag is None:
+            return self.replicas[0][1]
+        lags = self._get_lags()
+        candidates = [(lags[name], session) for name, session in self.replicas
+                      if lags.get(name) is not None and
+                      lags[name] <= self.max_lag]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+
+    def get_max_lag(self):
+        """Return the replication lag in seconds of the most lagged
+        replica, or 0 without replicas. A replica whose lag can't be read is
+        lagging infinitely."""
+        lags = [float('inf') if lag is None else lag
+                for lag in self._get_lags().values()]
+        return max(lags) if lags else 0
+
+    def _get_lags(self):
+        with self._lock:
+            if time.time() - self._checked < self.check_interval:
+                return self._lags
+            self._checked = time.time()
+        lags = {}
+        for name, session in self.replicas:
+            # A connection of its own, closed after the read, so that no
+            # transaction is left open on the replica, e.g. in a job
+            try:
+                with session.get_bind().connect() as conn:
+                    lags[name] = float(conn.execute(_lag_sql(conn)).scalar())
+            except Exception:
+                lags[name] = None
+        self._lags = lags
+        return lags
+
+
+def _lag_sql(conn):
+    version = conn.dialect.server_version_info
+    functions = WAL_FUNCTIONS if version >= (10,) else XLOG_FUNCTIONS
+    return text(REPLICA_LAG_SQL.format(*functions))
+
+
+def _pin_on_write(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and \
+            not statement.lstrip()[:6].upper() == 'SELECT':
+        g._db_pinned = True
@@ -42,10 +42,12 @@ import re
 from pybossa.model.project import Project, TaskRun, Task
 from pybossa.model.announcement import Announcement
 from pybossa.model.project_stats import ProjectStats
+from pybossa.model import task_search
 from sqlalchemy.sql import and_, or_
 from sqlalchemy import cast, Text, func, desc
 from sqlalchemy.types import TIMESTAMP
 from sqlalchemy.orm.base import _entity_descriptor
+from sqlalchemy.orm.session import object_session
 
 class Repository(object):
 
@@ -54,6 +56,20 @@ class Repository(object):
         self.language = language
         self.rdancy_upd_exp = rdancy_upd_exp
 
+    @property
+    def read_session(self):
+        """Session for methods that only read, which may be a replica. See
+        pybossa.replicas."""
+        return self.db.replicas.session()
+
+    def _attach(self, element):
+        """Return element in the primary session, merged into it when it was
+        read from a replica session, e.g. while handling a GET request."""
+        session = object_session(element)
+        if session is None or session is self.db.session():
+            return element
+        return self.db.session.merge(element)
+
     def generate_query_from_keywords(self, model, fulltextsearch=None,
                                      **kwargs):
         clauses = [_entity_descriptor(model, key) == value
@@ -65,44 +81,55 @@ class Repository(object):
         order_by_ranks = []
         or_clauses = []
 
+        project_ids = []
+        if 'project_id' in kwargs.keys():
+            tmp = "%s" % kwargs['project_id']
+            project_ids = re.findall(r'\d+', tmp)
+            for project_id in project_ids:
+                or_clauses.append((_entity_descriptor(model, 'project_id') ==
+                                   project_id))
+
         if 'info' in kwargs.keys():
+            project_id = project_ids[0] if len(project_ids) == 1 else None
             queries, headlines, order_by_ranks = self.handle_info_json(model, kwargs['info'],
-                                                                       fulltextsearch)
+                                                                       fulltextsearch,
+                                                                       project_id)
             clauses = clauses + queries
 
         if 'created' in kwargs.keys():
             like_query = kwargs['created'] + '%'
             clauses.append(_entity_descriptor(model,'created').like(like_query))
-
-        if 'project_id' in kwargs.keys():
-            tmp = "%s" % kwargs['project_id']
-            project_ids = re.findall(r'\d+', tmp)
-            for project_id in project_ids:
-                or_clauses.append((_entity_descriptor(model, 'project_id') ==
-                                   project_id))
         all_clauses = and_(and_(*clauses), or_(*or_clauses))
         return (all_clauses,), queries, headlines, order_by_ranks
 
 
-    def handle_info_json(self, model, info, fulltextsearch=None):
+    def handle_info_json(self, model, info, fulltextsearch=None,
+                         project_id=None):
         """Handle info JSON query filter."""
         clauses = []
         headlines = []
         order_by_ranks = []
 
         if info and '::' in info:
+            language, use_info_tsv = self.get_text_search_settings(
+                model, project_id, fulltextsearch)
             pairs = info.split('|')
             for pair in pairs:
                 if pair != '':
                     k,v = pair.split("::")
                     if fulltextsearch == '1':
                         vector = _entity_descriptor(model, 'info')[k].astext
-                        clause = func.to_tsvector(vector).match(v)
+                        query = func.to_tsquery(language, v)
+                        clause = func.to_tsvector(language, vector).op('@@')(query)
                         clauses.append(clause)
+                        # info_tsv holds the words of every key, so it can
+                        # only narrow down queries without negations
+                        if use_info_tsv and '!' not in v:
+                            clauses.append(model.info_tsv.op('@@')(query))
                         if len(headlines) == 0:
-                            headline = func.ts_headline(self.language, vector, func.to_tsquery(v))
+                            headline = func.ts_headline(language, vector, query)
                             headlines.append(headline)
-                            order = func.ts_rank_cd(func.to_tsvector(vector), func.to_tsquery(v), 4).label('rank')
+                            order = func.ts_rank_cd(func.to_tsvector(language, vector), query, 4).label('rank')
                             order_by_ranks.append(order)
                     else:
                         clauses.append(_entity_descriptor(model,
@@ -122,8 +149,19 @@ class Repository(object):
         return clauses, headlines, order_by_ranks
 
 
+    def get_text_search_settings(self, model, project_id, fulltextsearch):
+        """Return the text search configuration of the info filters and
+        whether the task.info_tsv index can serve them, which needs a
+        single project with all its search vectors built."""
+        if fulltextsearch != '1' or project_id is None:
+            return self.language, False
+        language, ready = task_search.get_search_settings(
+            self.read_session, project_id, self.language)
+        return language, ready and model == Task
+
     def create_context(self, filters, fulltextsearch, model):
         """Return query with context aware query."""
+        session = self.read_session
         owner_id = None
         query = None
         participated = None
@@ -145,34 +183,34 @@ class Repository(object):
                                                                **filters)
 
         if model not in [Announcement, ProjectStats] and owner_id:
-            subquery = self.db.session.query(Project)\
+            subquery = session.query(Project)\
                            .with_entities(Project.id)\
                            .filter_by(owner_id=owner_id).subquery()
             if (model != Project):
-                query = self.db.session.query(model)\
+                query = session.query(model)\
                             .filter(model.project_id.in_(subquery),
                                     *query_args)
             else:
-                query = self.db.session.query(model)\
+                query = session.query(model)\
                             .filter(model.id.in_(subquery),
                                     *query_args)
         else:
-            query = self.db.session.query(model).filter(*query_args)
+            query = session.query(model).filter(*query_args)
 
         if participated and model == Task:
             if participated['user_id']:
-                subquery = self.db.session.query(TaskRun)\
+                subquery = session.query(TaskRun)\
                                .with_entities(TaskRun.task_id)\
                                .filter_by(user_id=participated['user_id']).subquery()
             if participated['external_uid']:
-                subquery = self.db.session.query(TaskRun)\
+                subquery = session.query(TaskRun)\
                                .with_entities(TaskRun.task_id)\
                                .filter_by(external_uid=participated['external_uid']).subquery()
             if participated['user_ip']:
-                subquery = self.db.session.query(TaskRun)\
+                subquery = session.query(TaskRun)\
                                .with_entities(TaskRun.task_id)\
                                .filter_by(user_ip=participated['user_ip']).subquery()
-            query = self.db.session.query(model)\
+            query = session.query(model)\
                         .filter(~model.id.in_(subquery),
                                 *query_args)
         if len(headlines) > 0:
@@ -241,6 +279,7 @@ from auditlog_repository import AuditlogRepository
 from webhook_repository import WebhookRepository
 from result_repository import ResultRepository
 from helping_repository import HelpingMaterialRepository
+from change_repository import ChangeRepository
 
 assert ProjectRepository
 assert ProjectStatsRepository
@@ -252,3 +291,4 @@ assert AuditlogRepository
 assert WebhookRepository
 assert ResultRepository
 assert HelpingMaterialRepository
+assert ChangeRepository
@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2015 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import text
+
+from pybossa.repositories import Repository
+from pybossa.model.change_event import ChangeEvent
+
+
+class ChangeRepository(Repository):
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_changes(self, project_id, after=0, limit=100):
+        """Return the change events of a project after the sequence number
+        after, in order."""
+        return self.db.session.query(ChangeEvent)\
+                   .filter(ChangeEvent.project_id == project_id,
+                           ChangeEvent.seq > after)\
+                   .order_by(ChangeEvent.seq)\
+                   .limit(limit).all()
+
+    def delete_older_than(self, timestamp):
+        """Delete the change events created before timestamp."""
+        sql = text('''DELETE FROM change_event WHERE created < :timestamp;''')
+        deleted = self.db.session.execute(sql, dict(timestamp=timestamp))
+        self.db.session.commit()
+        return deleted.rowcount
+
+    def compact(self, timestamp):
+        """Keep only the last event of every object among the events
+        created before timestamp. Consumers behind those events still get
+        the last state of every changed object."""
+        sql = text('''
+                   DELETE FROM change_event ce USING (
+                       SELECT project_id, object_type, object_id,
+                       MAX(seq) AS last_seq FROM change_event
+                       WHERE created < :timestamp
+                       GROUP BY project_id, object_type, object_id
+                       HAVING COUNT(*) > 1) AS last
+                   WHERE ce.project_id = last.project_id
+                   AND ce.object_type = last.object_type
+                   AND ce.object_id = last.object_id
+                   AND ce.seq < last.last_seq;
+                   ''')
+        deleted = self.db.session.execute(sql, dict(timestamp=timestamp))
+        self.db.session.commit()
+        return deleted.rowcount
@@ -25,6 +25,7 @@ from pybossa.model.project import Project
 from pybossa.model.category import Category
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
+from pybossa import partitioning
 from pybossa.core import uploader
 from werkzeug.exceptions import BadRequest
 
@@ -33,16 +34,21 @@ class ProjectRepository(Repository):
 
     # Methods for Project objects
     def get(self, id):
-        return self.db.session.query(Project).get(id)
+        return self.read_session.query(Project).get(id)
 
     def get_by_shortname(self, short_name):
-        return self.db.session.query(Project).filter_by(short_name=short_name).first()
+        return self.read_session.query(Project).filter_by(short_name=short_name).first()
 
     def get_by(self, **attributes):
-        return self.db.session.query(Project).filter_by(**attributes).first()
+        return self.read_session.query(Project).filter_by(**attributes).first()
 
     def get_all(self):
-        return self.db.session.query(Project).all()
+        return self.read_session.query(Project).all()
+
+    def get_projects(self, ids):
+        if not ids:
+            return []
+        return self.read_session.query(Project).filter(Project.id.in_(ids)).all()
 
     def filter_by(self, limit=None, offset=0, yielded=False, last_id=None,
                   fulltextsearch=None, desc=False, **filters):
@@ -57,7 +63,7 @@ class ProjectRepository(Repository):
         self._creator_is_owner(project)
         self._verify_has_password(project)
         try:
-            self.db.session.add(project)
+            self.db.session.add(self._attach(project))
             self.db.session.commit()
         except IntegrityError as e:
             self.db.session.rollback()
@@ -78,6 +84,10 @@ class ProjectRepository(Repository):
     def delete(self, project):
         self._validate_can_be('deleted', project)
         project = self.db.session.query(Project).filter(Project.id==project.id).first()
+        # Only locks the partition. Detaching it would lock the whole
+        # task_run table, so the empty partition is left to be dropped off
+        # peak, see cli.py drop_project_partition.
+        partitioning.truncate_project_partition(self.db.session, project.id)
         self.db.session.delete(project)
         self.db.session.commit()
         cached_projects.clean(project.id)
@@ -87,14 +97,14 @@ class ProjectRepository(Repository):
     # Methods for Category objects
     def get_category(self, id=None):
         if id is None:
-            return self.db.session.query(Category).first()
-        return self.db.session.query(Category).get(id)
+            return self.read_session.query(Category).first()
+        return self.read_session.query(Category).get(id)
 
     def get_category_by(self, **attributes):
-        return self.db.session.query(Category).filter_by(**attributes).first()
+        return self.read_session.query(Category).filter_by(**attributes).first()
 
     def get_all_categories(self):
-        return self.db.session.query(Category).all()
+        return self.read_session.query(Category).all()
 
     def filter_categories_by(self, limit=None, offset=0, yielded=False,
                              last_id=None, fulltextsearch=None,
@@ -108,7 +118,7 @@ class ProjectRepository(Repository):
     def save_category(self, category):
         self._validate_can_be('saved as a Category', category, klass=Category)
         try:
-            self.db.session.add(category)
+            self.db.session.add(self._attach(category))
             self.db.session.commit()
         except IntegrityError as e:
             self.db.session.rollback()
@@ -22,19 +22,63 @@ from sqlalchemy import cast, Date
 from pybossa.repositories import Repository
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
-from pybossa.model import make_timestamp
+from pybossa.model.task_completion import TaskCompletion
+from pybossa.model import make_timestamp, task_completion, change_event
+from pybossa.model import user_contribution, task_search
 from pybossa.model.user import User
 from pybossa.exc import WrongObjectError, DBIntegrityError
 from pybossa.cache import projects as cached_projects
+from pybossa.cache import project_stats as cached_project_stats
+from pybossa import partitioning
 from pybossa.core import uploader
 from sqlalchemy import text
-from pybossa.cache.task_browse_helpers import get_task_filters
+from pybossa.cache.task_browse_helpers import (get_task_filters,
+                                               is_valid_searchable_column)
 import json
+import hashlib
 from datetime import datetime, timedelta
 from flask import current_app
 from pybossa.data_access import ensure_task_assignment_to_project
 
 
+TASK_BATCH_SQL = '''
+    CREATE TEMP TABLE task_batch ON COMMIT DROP AS (
+        SELECT id FROM task WHERE project_id=:project_id
+        AND id > :last_id ORDER BY id LIMIT :batch_size
+    );'''
+
+# The tasks of task_batch matching the browse filters
+FILTERED_BATCH_SQL = '''
+    SELECT task.id as id,
+    coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
+    priority_0, task.created
+    FROM task LEFT OUTER JOIN
+    (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+    MAX(finish_time) as ft FROM task_run
+    WHERE project_id=:project_id
+    AND task_id IN (SELECT id FROM task_batch)
+    GROUP BY task_id) AS log_counts
+    ON task.id=log_counts.task_id
+    WHERE task.project_id=:project_id
+    AND task.id IN (SELECT id FROM task_batch) {}'''
+
+REDUNDANCY_TASKS_SQL = '''
+    WITH all_tasks_with_orig_filter AS ({}),
+
+    tasks_with_file_urls AS (
+         SELECT t.id as id FROM task t
+         WHERE t.id IN (SELECT id from all_tasks_with_orig_filter)
+         AND jsonb_typeof(t.info) = 'object'
+         AND EXISTS(SELECT TRUE FROM jsonb_object_keys(t.info) AS key
+         WHERE key ILIKE '%\_\_upload\_url%')
+    ),
+
+    tasks_excl_file_urls AS (
+         SELECT id FROM all_tasks_with_orig_filter
+         WHERE id NOT IN (SELECT id FROM tasks_with_file_urls)
+    )'''
+
+
 class TaskRepository(Repository):
     MIN_REDUNDANCY = 1
     MAX_REDUNDANCY = 1000
@@ -43,12 +87,17 @@ class TaskRepository(Repository):
 
     # Methods for queries on Task objects
     def get_task(self, id):
-        return self.db.session.query(Task).get(id)
+        return self.read_session.query(Task).get(id)
 
     def get_task_by(self, **attributes):
         filters, _, _, _ = self.generate_query_from_keywords(Task, **attributes)
-        print self.db.session.query(Task).filter(*filters)
-        return self.db.session.query(Task).filter(*filters).first()
+        print self.read_session.query(Task).filter(*filters)
+        return self.read_session.query(Task).filter(*filters).first()
+
+    def get_tasks_by_ids(self, ids):
+        if not ids:
+            return []
+        return self.read_session.query(Task).filter(Task.id.in_(ids)).all()
 
     def filter_tasks_by(self, limit=None, offset=0, yielded=False,
                         last_id=None, fulltextsearch=None, desc=False,
@@ -65,13 +114,13 @@ class TaskRepository(Repository):
         # it explicitly searchable against Task table
         exp = filters.pop('exported', None)
         if exp is not None:
-            query = self.db.session.query(TaskRun).join(Task).\
+            query = self.read_session.query(TaskRun).join(Task).\
                 filter(TaskRun.task_id == Task.id).\
                 filter(Task.state == u'completed').\
                 filter(Task.exported == exp).\
                 filter_by(**filters)
         else:
-            query = self.db.session.query(TaskRun).join(Task).\
+            query = self.read_session.query(TaskRun).join(Task).\
                 filter(TaskRun.task_id == Task.id).\
                 filter(Task.state == u'completed').\
                 filter_by(**filters)
@@ -83,18 +132,26 @@ class TaskRepository(Repository):
 
     def count_tasks_with(self, **filters):
         query_args, _, _, _  = self.generate_query_from_keywords(Task, **filters)
-        return self.db.session.query(Task).filter(*query_args).count()
+        return self.read_session.query(Task).filter(*query_args).count()
 
     def filter_tasks_by_user_favorites(self, uid, **filters):
-        """Return tasks marked as favorited by user.id."""
-        query = self.db.session.query(Task).filter(Task.fav_user_ids.any(uid))
+        """Return tasks marked as favorited by user.id.
+
+        The @> filter is served by the GIN index on fav_user_ids. When
+        ordering by id, last_id is used as a keyset instead of an offset.
+        """
+        query = self.read_session.query(Task)\
+                    .filter(Task.fav_user_ids.contains([uid]))
         limit = filters.get('limit', 20)
         offset = filters.get('offset', 0)
         last_id = filters.get('last_id', None)
         desc = filters.get('desc', False)
         orderby = filters.get('orderby', 'id')
         if last_id:
-            query = query.filter(Task.id > last_id)
+            if desc and orderby == 'id':
+                query = query.filter(Task.id < last_id)
+            else:
+                query = query.filter(Task.id > last_id)
         query = self._set_orderby_desc(query, Task, limit,
                                        last_id, offset,
                                        desc, orderby)
@@ -102,21 +159,45 @@ class TaskRepository(Repository):
 
     def get_task_favorited(self, uid, task_id):
         """Return task marked as favorited by user.id."""
-        tasks = self.db.session.query(Task)\
-                    .filter(Task.fav_user_ids.any(uid),
-                            Task.id==task_id)\
+        tasks = self.read_session.query(Task)\
+                    .filter(Task.id==task_id,
+                            Task.fav_user_ids.contains([uid]))\
                     .all()
         return tasks
 
+    def get_completions_since(self, since, limit=20, project_id=None):
+        """Return the (completion id, task) pairs of the tasks completed
+        after the completion since, in the order they were completed.
+
+        The ids are drawn before the completions are committed, so only the
+        ones up to the horizon, where no lower id can show up later, are
+        returned. They are read from the primary, as a replica can apply the
+        commits after the horizon is taken. Filtering by project only waits
+        for the completions of that project in flight."""
+        conn = self.db.engine.connect()
+        try:
+            horizon = task_completion.get_horizon(conn, project_id)
+        finally:
+            conn.close()
+        if horizon is None or horizon <= since:
+            return []
+        query = self.db.session.query(TaskCompletion.id, Task)\
+                    .join(Task, Task.id == TaskCompletion.task_id)\
+                    .filter(TaskCompletion.id > since,
+                            TaskCompletion.id <= horizon)
+        if project_id is not None:
+            query = query.filter(TaskCompletion.project_id == project_id)
+        return query.order_by(TaskCompletion.id).limit(limit).all()
+
     # Methods for queries on TaskRun objects
     def get_task_run(self, id):
-        return self.db.session.query(TaskRun).get(id)
+        return self.read_session.query(TaskRun).get(id)
 
     def get_task_run_by(self, fulltextsearch=None, **attributes):
         filters, _, _, _  = self.generate_query_from_keywords(TaskRun,
                                                     fulltextsearch,
                                                     **attributes)
-        return self.db.session.query(TaskRun).filter(*filters).first()
+        return self.read_session.query(TaskRun).filter(*filters).first()
 
     def filter_task_runs_by(self, limit=None, offset=0, last_id=None,
                             yielded=False, fulltextsearch=None,
@@ -124,9 +205,16 @@ class TaskRepository(Repository):
         return self._filter_by(TaskRun, limit, offset, yielded, last_id,
                               fulltextsearch, desc, **filters)
 
+    def get_task_runs_by_task_ids(self, task_ids):
+        if not task_ids:
+            return []
+        return self.read_session.query(TaskRun)\
+                   .filter(TaskRun.task_id.in_(task_ids))\
+                   .order_by(TaskRun.id).all()
+
     def count_task_runs_with(self, **filters):
         query_args, _, _, _ = self.generate_query_from_keywords(TaskRun, **filters)
-        return self.db.session.query(TaskRun).filter(*query_args).count()
+        return self.read_session.query(TaskRun).filter(*query_args).count()
 
     # Filter helpers
     def _filter_query(self, query, obj, limit, offset, last_id, yielded, desc):
@@ -149,13 +237,28 @@ class TaskRepository(Repository):
     def save(self, element):
         self._validate_can_be(self.SAVE_ACTION, element)
         try:
-            self.db.session.add(element)
+            self.db.session.add(self._attach(element))
             self.db.session.commit()
             cached_projects.clean_project(element.project_id)
         except IntegrityError as e:
             self.db.session.rollback()
             raise DBIntegrityError(e)
 
+    def save_all(self, elements):
+        """Save the elements in a single transaction, cleaning the cache of
+        each project once."""
+        for element in elements:
+            self._validate_can_be(self.SAVE_ACTION, element)
+        try:
+            self.db.session.add_all([self._attach(element)
+                                     for element in elements])
+            self.db.session.commit()
+            for project_id in set(e.project_id for e in elements):
+                cached_projects.clean_project(project_id)
+        except IntegrityError as e:
+            self.db.session.rollback()
+            raise DBIntegrityError(e)
+
     def update(self, element):
         self._validate_can_be(self.UPDATE_ACTION, element)
         try:
@@ -178,14 +281,15 @@ class TaskRepository(Repository):
         self.db.session.execute(text('''
                    DELETE FROM result WHERE project_id=:project_id
                                       AND task_id=:task_id;'''), args)
-        self.db.session.execute(text('''
-                   DELETE FROM task_run WHERE project_id=:project_id
-                                        AND task_id=:task_id;'''), args)
+        user_contribution.delete_task_runs(
+            self.db.session, 'project_id=:project_id AND task_id=:task_id',
+            **args)
         self.db.session.execute(text('''
                    DELETE FROM task WHERE project_id=:project_id
                                     AND id=:task_id;'''), args)
         self.db.session.commit()
         cached_projects.clean(project_id)
+        cached_project_stats.mark_dirty(project_id)
 
     def delete_valid_from_project(self, project, force_reset=False, filters=None):
         if not force_reset:
@@ -234,24 +338,99 @@ class TaskRepository(Repository):
                 '''.format(sql_session_repl, conditions))
         self.db.bulkdel_session.execute(sql, dict(project_id=project.id, **params))
         self.db.bulkdel_session.commit()
+        user_contribution.rebuild(self.db.session, project.id)
         cached_projects.clean_project(project.id)
+        cached_project_stats.mark_dirty(project.id)
         self._delete_zip_files_from_store(project)
 
+    def delete_tasks_chunk(self, project_id, last_id, chunk_size,
+                           force_reset=False, filters=None):
+        """
+        Delete, in a single transaction, the tasks of a project among the
+        next chunk_size ones in id order after last_id, with their task
+        runs, results and counters. Without force_reset only the tasks
+        with no results are deleted, otherwise the ones matching filters.
+        Return the number of tasks deleted and the last id of the chunk,
+        None when there are no tasks left.
+        """
+        session = self.db.bulkdel_session
+        params = dict(project_id=project_id, last_id=last_id,
+                      chunk_size=chunk_size)
+        # bulkdel db conn is with db user having session_replication_role
+        statements = []
+        if not 'bulkdel' in current_app.config.get('SQLALCHEMY_BINDS'):
+            statements.append('SET LOCAL session_replication_role TO replica;')
+        statements.append('''
+            CREATE TEMP TABLE chunk ON COMMIT DROP AS (
+                SELECT id FROM task WHERE project_id=:project_id
+                AND id > :last_id ORDER BY id LIMIT :chunk_size
+            );''')
+        if not force_reset:
+            statements.append('''
+                CREATE TEMP TABLE to_delete ON COMMIT DROP AS (
+                    SELECT id FROM chunk WHERE NOT EXISTS
+                    (SELECT 1 FROM result WHERE result.project_id=:project_id
+                     AND result.task_id=chunk.id)
+                );''')
+        else:
+            conditions, filter_params = get_task_filters(filters or {})
+            params.update(filter_params)
+            statements.append('''
+                CREATE TEMP TABLE to_delete ON COMMIT DROP AS (
+                    SELECT task.id as id FROM task LEFT OUTER JOIN
+                    (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
+                    MAX(finish_time) as ft FROM task_run
+                    WHERE project_id=:project_id
+                    AND task_id IN (SELECT id FROM chunk)
+                    GROUP BY task_id) AS log_counts
+                    ON task.id=log_counts.task_id
+                    WHERE task.project_id=:project_id
+                    AND task.id IN (SELECT id FROM chunk) {}
+                );'''.format(conditions))
+            statements.append('''
+                DELETE FROM result WHERE project_id=:project_id
+                       AND task_id IN (SELECT id FROM to_delete);''')
+        for table in ('counter', 'task_completion', 'task_run'):
+            statements.append('''
+                DELETE FROM {} WHERE project_id=:project_id
+                       AND task_id IN (SELECT id FROM to_delete);'''
+                              .format(table))
+        statements.append('''
+            DELETE FROM task WHERE project_id=:project_id
+                   AND id IN (SELECT id FROM to_delete);''')
+        try:
+            for statement in statements:
+                session.execute(text(statement), params)
+            row = session.execute(text('''
+                SELECT (SELECT MAX(id) FROM chunk) AS last_id,
+                       (SELECT COUNT(*) FROM to_delete) AS n_deleted;
+                ''')).first()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return row.n_deleted, row.last_id
+
     def delete_taskruns_from_project(self, project):
         sql = text('''
                    DELETE FROM task_run WHERE project_id=:project_id;
+                   DELETE FROM user_contribution WHERE project_id=:project_id;
                    ''')
+        # A project with its own task_run partition is emptied at once
+        partitioning.truncate_project_partition(self.db.session, project.id)
         self.db.session.execute(sql, dict(project_id=project.id))
         self.db.session.commit()
         cached_projects.clean_project(project.id)
+        cached_project_stats.mark_dirty(project.id)
         self._delete_zip_files_from_store(project)
 
-    def update_tasks_redundancy(self, project, n_answers, filters=None):
+    def update_tasks_redundancy(self, project, n_answers, filters=None,
+                                progress=None):
         """
         Update the n_answer of every task from a project and their state.
-        Use raw SQL for performance. Mark tasks as exported = False for
-        tasks with curr redundancy < new redundancy, with state as completed
-        and were marked as exported = True
+        Use raw SQL for performance, in batches of tasks. Mark tasks as
+        exported = False for tasks with curr redundancy < new redundancy,
+        with state as completed and were marked as exported = True
         """
 
         if n_answers < self.MIN_REDUNDANCY or n_answers > self.MAX_REDUNDANCY:
@@ -263,49 +442,82 @@ class TaskRepository(Repository):
         tasks_not_updated = self._get_redundancy_update_msg(
             project, n_answers, conditions, params, task_expiration)
 
-        self.update_task_exported_status(project.id, n_answers, conditions, params, task_expiration)
-        sql = text('''
-                   WITH all_tasks_with_orig_filter AS (
-                        SELECT task.id as id,
-                        coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-                        priority_0, task.created
-                        FROM task LEFT OUTER JOIN
-                        (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-                        MAX(finish_time) as ft FROM task_run
-                        WHERE project_id=:project_id GROUP BY task_id) AS log_counts
-                        ON task.id=log_counts.task_id
-                        WHERE task.project_id=:project_id {}
-                   ),
-
-                   tasks_with_file_urls AS (
-                        SELECT t.id as id FROM task t
-                        WHERE t.id IN (SELECT id from all_tasks_with_orig_filter)
-                        AND jsonb_typeof(t.info) = 'object'
-                        AND EXISTS(SELECT TRUE FROM jsonb_object_keys(t.info) AS key
-                        WHERE key ILIKE '%\_\_upload\_url%')
-                   ),
-
-                   tasks_excl_file_urls AS (
-                        SELECT id FROM all_tasks_with_orig_filter
-                        WHERE id NOT IN (SELECT id FROM tasks_with_file_urls)
-                   )
+        params.update(n_answers=n_answers, task_expiration=task_expiration)
+
+        def update_batch(batch_params):
+            return self._update_batch_redundancy(conditions,
+                                                 dict(params, **batch_params))
+
+        self._update_in_batches(project.id, update_batch, progress)
+        cached_project_stats.mark_dirty(project.id)
+        return tasks_not_updated
 
+    def _update_in_batches(self, project_id, update_batch, progress=None):
+        """
+        Call update_batch for the tasks of a project in batches of
+        TASK_UPDATE_BATCH_SIZE, in id order, committing each batch. The ids
+        of the batch are in the temp table task_batch. The caches of the
+        project are cleaned after every batch and progress, if given, is
+        called with the number of tasks scanned and updated so far.
+        """
+        batch_size = current_app.config.get('TASK_UPDATE_BATCH_SIZE', 1000)
+        last_id = 0
+        n_scanned = n_updated = 0
+        while True:
+            batch_params = dict(project_id=project_id, last_id=last_id,
+                                batch_size=batch_size)
+            self.db.session.execute(text(TASK_BATCH_SQL), batch_params)
+            row = self.db.session.execute(text('''
+                SELECT MAX(id) AS last_id, COUNT(*) AS n_tasks
+                FROM task_batch;''')).first()
+            if row.last_id is None:
+                self.db.session.rollback()
+                break
+            n_updated += update_batch(batch_params)
+            self.db.session.commit()
+            last_id = row.last_id
+            n_scanned += row.n_tasks
+            cached_projects.clean_project(project_id)
+            if progress:
+                progress(n_scanned, n_updated)
+        return n_updated
+
+    def _update_batch_redundancy(self, conditions, params):
+        exported_conditions = (conditions + " AND task.state='completed'"
+                               " AND task.n_answers < :n_answers")
+        sql = text('''
+                   {}
+                   UPDATE task SET exported=False
+                   WHERE project_id=:project_id AND
+                   ((id IN (SELECT id from tasks_excl_file_urls)) OR
+                   (id IN (SELECT id from tasks_with_file_urls) AND state='ongoing'
+                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL))
+                   RETURNING id;'''
+                   .format(REDUNDANCY_TASKS_SQL.format(
+                       FILTERED_BATCH_SQL.format(exported_conditions))))
+        changed = set(row.id for row in self.db.session.execute(sql, params))
+        sql = text('''
+                   {}
                    UPDATE task SET n_answers=:n_answers,
                    state='ongoing' WHERE project_id=:project_id AND
                    ((id IN (SELECT id from tasks_excl_file_urls)) OR
                    (id IN (SELECT id from tasks_with_file_urls) AND state='ongoing'
-                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL));'''
-                   .format(conditions))
-        self.db.session.execute(sql, dict(n_answers=n_answers,
-                                          project_id=project.id,
-                                          task_expiration=task_expiration,
-                                          **params))
-        self.update_task_state(project.id, n_answers)
-        self.db.session.commit()
-        cached_projects.clean_project(project.id)
-        return tasks_not_updated
-
-    def update_task_state(self, project_id, n_answers):
+                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL))
+                   RETURNING id;'''
+                   .format(REDUNDANCY_TASKS_SQL.format(
+                       FILTERED_BATCH_SQL.format(conditions))))
+        task_ids = [row.id for row in self.db.session.execute(sql, params)]
+        changed.update(task_ids)
+        change_event.record_many(self.db.session, params['project_id'],
+                                 'task', sorted(changed), 'update')
+        if task_ids:
+            self.update_task_state(params['project_id'], params['n_answers'],
+                                   task_ids)
+        return len(task_ids)
+
+    def update_task_state(self, project_id, n_answers, task_ids):
+        """Set as completed the tasks in task_ids with n_answers task runs
+        and create their results."""
         # Create temp tables for completed tasks
         sql = text('''
                    CREATE TEMP TABLE complete_tasks ON COMMIT DROP AS (
@@ -313,18 +525,17 @@ class TaskRepository(Repository):
                    FROM task, task_run
                    WHERE task_run.task_id=task.id
                    AND task.project_id=:project_id
+                   AND task.id = ANY(:task_ids)
                    GROUP BY task.id
                    having COUNT(task_run.id) >=:n_answers);
                    ''')
         self.db.session.execute(sql, dict(n_answers=n_answers,
-                                          project_id=project_id))
+                                          project_id=project_id,
+                                          task_ids=task_ids))
         # Set state to completed
-        sql = text('''
-                   UPDATE task SET state='completed'
-                   FROM complete_tasks
-                   WHERE complete_tasks.id=task.id;
-                   ''')
-        self.db.session.execute(sql)
+        task_completion.complete_tasks(self.db.session,
+                                       'complete_tasks.id=task.id',
+                                       from_clause='complete_tasks')
 
         sql = text('''
                    INSERT INTO result
@@ -339,38 +550,37 @@ class TaskRepository(Repository):
                           AND NOT EXISTS (SELECT 1 FROM result
                                           WHERE result.task_id = task.id)
                           AND task.project_id=:project_id
+                          AND task.id = ANY(:task_ids)
                           GROUP BY task.id
                         ) as completed_no_results
-                   );''')
-        self.db.session.execute(sql, dict(project_id=project_id,
-                                          ts=make_timestamp()))
-
-    def update_priority(self, project_id, priority, filters):
+                   ) RETURNING id;''')
+        results = self.db.session.execute(sql, dict(project_id=project_id,
+                                                    task_ids=task_ids,
+                                                    ts=make_timestamp()))
+        change_event.record_many(self.db.session, project_id, 'result',
+                                 [row.id for row in results], 'insert')
+
+    def update_priority(self, project_id, priority, filters, progress=None):
         priority = min(1.0, priority)
         priority = max(0.0, priority)
         conditions, params = get_task_filters(filters)
         sql = text('''
-                   WITH to_update AS (
-                        SELECT task.id as id,
-                        coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-                        priority_0, task.created
-                        FROM task LEFT OUTER JOIN
-                        (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-                        MAX(finish_time) as ft FROM task_run
-                        WHERE project_id=:project_id GROUP BY task_id) AS log_counts
-                        ON task.id=log_counts.task_id
-                        WHERE task.project_id=:project_id {}
-                   )
+                   WITH to_update AS ({})
                    UPDATE task
                    SET priority_0=:priority
                    WHERE project_id=:project_id AND task.id in (
-                        SELECT id FROM to_update);
-                   '''.format(conditions))
-        self.db.session.execute(sql, dict(priority=priority,
-                                          project_id=project_id,
-                                          **params))
-        self.db.session.commit()
-        cached_projects.clean_project(project_id)
+                        SELECT id FROM to_update)
+                   RETURNING id;
+                   '''.format(FILTERED_BATCH_SQL.format(conditions)))
+
+        def update_batch(batch_params):
+            task_ids = [row.id for row in self.db.session.execute(
+                sql, dict(params, priority=priority, **batch_params))]
+            change_event.record_many(self.db.session, project_id, 'task',
+                                     task_ids, 'update')
+            return len(task_ids)
+
+        self._update_in_batches(project_id, update_batch, progress)
 
     def find_duplicate(self, project_id, info):
         """
@@ -391,6 +601,95 @@ class TaskRepository(Repository):
         if row:
             return row[0]
 
+    def get_projects_without_info_tsv(self):
+        """Return the ids of the projects with tasks without search vector."""
+        return task_search.get_projects_to_index(self.db.session)
+
+    def get_text_search_languages(self):
+        """Return the text search configurations of the database."""
+        sql = text('''SELECT cfgname FROM pg_ts_config ORDER BY cfgname;''')
+        return [row.cfgname for row in self.read_session.execute(sql)]
+
+    def update_info_tsv(self, project_id, rebuild=False):
+        """
+        Build the missing task.info search vectors of a project in batches
+        of TASK_UPDATE_BATCH_SIZE tasks, one transaction each. With rebuild
+        all of them are cleared first. Until every task of the project has
+        its vector, the info filters do not use the info_tsv index. Return
+        the number of vectors built.
+        """
+        batch_size = current_app.config.get('TASK_UPDATE_BATCH_SIZE', 1000)
+        batches = [lambda last_id: task_search.update_batch(
+            self.db.session, project_id, last_id, batch_size, self.language)]
+        if rebuild:
+            batches.insert(0, lambda last_id: task_search.clear_batch(
+                self.db.session, project_id, last_id, batch_size))
+        for update_batch in batches:
+            last_id = 0
+            n_updated = 0
+            while last_id is not None:
+                n_tasks, last_id = update_batch(last_id)
+                self.db.session.commit()
+                n_updated += n_tasks
+        return n_updated
+
+    def get_info_field_indexes(self, project_id):
+        """
+        Return a dict with the task.info fields indexed for a project and
+        the name of their index. The field name is kept as the comment of
+        the index.
+        """
+        sql = text('''
+                   SELECT c.relname AS index_name,
+                   obj_description(c.oid, 'pg_class') AS field
+                   FROM pg_class c
+                   WHERE c.relkind = 'i' AND c.relname LIKE :prefix
+                   ''')
+        prefix = self._info_field_index_prefix(project_id)
+        rows = self.db.session.execute(
+            sql, dict(prefix=prefix.replace('_', '\\_') + '%'))
+        return {row.field: row.index_name for row in rows}
+
+    def create_info_field_index(self, project_id, field):
+        """
+        Create a trigram index on task.info->>field restricted to the tasks
+        of a project. It matches the expression used by the browse tasks
+        filters, see task_browse_helpers.op_to_query, so that contains,
+        starts with and equals filters on the field use it. The index is
+        built concurrently, so it does not block task inserts and updates.
+        """
+        if not is_valid_searchable_column(field):
+            raise ValueError('Invalid field name: {}'.format(field))
+        index_name = '{}{}'.format(
+            self._info_field_index_prefix(project_id),
+            hashlib.md5(field.encode('utf-8')).hexdigest()[:12])
+        statements = [
+            '''CREATE INDEX CONCURRENTLY IF NOT EXISTS {0} ON task
+               USING gin ((COALESCE(info->>'{1}', '')) gin_trgm_ops)
+               WHERE project_id = {2}'''.format(index_name, field,
+                                                 int(project_id)),
+            "COMMENT ON INDEX {} IS '{}'".format(index_name, field)]
+        self._execute_autocommit(statements)
+        return index_name
+
+    def drop_info_field_index(self, index_name):
+        """Drop an index created by create_info_field_index."""
+        self._execute_autocommit(
+            ['DROP INDEX CONCURRENTLY IF EXISTS {}'.format(index_name)])
+
+    def _info_field_index_prefix(self, project_id):
+        return 'task_info_field_{}_'.format(int(project_id))
+
+    def _execute_autocommit(self, statements):
+        # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+        conn = self.db.engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT')
+        try:
+            for statement in statements:
+                conn.execute(text(statement))
+        finally:
+            conn.close()
+
     def _validate_can_be(self, action, element):
         from flask import current_app
         from pybossa.core import project_repo
@@ -423,51 +722,6 @@ class TaskRepository(Repository):
         uploader.delete_file(json_taskruns_filename, container)
         uploader.delete_file(csv_taskruns_filename, container)
 
-    def update_task_exported_status(self, project_id, n_answers, conditions, params, task_expiration):
-        """
-        Update exported=False for completed tasks that were exported
-        and with new redundancy, they'll be marked as ongoing
-        """
-        sql = text('''
-                   WITH all_tasks_with_orig_filter AS (
-                        SELECT task.id as id,
-                        coalesce(ct, 0) as n_task_runs, task.n_answers, ft,
-                        priority_0, task.created
-                        FROM task LEFT OUTER JOIN
-                        (SELECT task_id, CAST(COUNT(id) AS FLOAT) AS ct,
-                        MAX(finish_time) as ft FROM task_run
-                        WHERE project_id=:project_id GROUP BY task_id) AS log_counts
-                        ON task.id=log_counts.task_id
-                        WHERE task.project_id=:project_id
-                        AND task.state='completed'
-                        AND task.n_answers < :n_answers {}
-                   ),
-
-                   tasks_with_file_urls AS (
-                        SELECT t.id as id FROM task t
-                        WHERE t.id IN (SELECT id from all_tasks_with_orig_filter)
-                        AND jsonb_typeof(t.info) = 'object'
-                        AND EXISTS(SELECT TRUE FROM jsonb_object_keys(t.info) AS key
-                        WHERE key ILIKE '%\_\_upload\_url%')
-                   ),
-
-                   tasks_excl_file_urls AS (
-                        SELECT id FROM all_tasks_with_orig_filter
-                        WHERE id NOT IN (SELECT id FROM tasks_with_file_urls)
-                   )
-
-                   UPDATE task SET exported=False
-                   WHERE project_id=:project_id AND
-                   ((id IN (SELECT id from tasks_excl_file_urls)) OR
-                   (id IN (SELECT id from tasks_with_file_urls) AND state='ongoing'
-                   AND TO_DATE(created, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW() - :task_expiration ::INTERVAL));'''
-                   .format(conditions))
-        self.db.session.execute(sql, dict(n_answers=n_answers,
-                                          project_id=project_id,
-                                          task_expiration=task_expiration,
-                                          **params))
-
-
     def _get_redundancy_update_msg(self, project, n_answers, conditions, params, task_expiration):
         sql = text('''
                    WITH all_tasks_with_orig_filter AS (
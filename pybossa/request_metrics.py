@@ -0,0 +1,247 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA instrumentation of requests.
+
+For every request it counts the SQL statements and their time per database
+bind, the Redis commands and their time per connection, and the cache hits
+and misses per memoized function. The results are sent in a Server-Timing
+header, logged for a sample of the requests and kept per endpoint as rolling
+stats for the admin report of slow endpoints. The rolling stats are added up
+in process and written to Redis every REQUEST_METRICS_FLUSH_SECONDS, rather
+than on every request.
+
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import _app_ctx_stack, g, request
+from redis.client import StrictRedis, BasePipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from pybossa import rolling_stats
+from pybossa.sentinel import RetryingStrictRedis
+
+
+KEY_PREFIX = 'pybossa:request_metrics'
+SUM_FIELDS = ('count', 'time', 'sql_count', 'sql_time', 'redis_count',
+              'redis_time', 'cache_hits', 'cache_misses')
+
+_engines = {}
+_redis_pools = {}
+_installed = []
+_buffer = {}
+_buffer_lock = threading.Lock()
+_last_flush = [time.time()]
+
+
+class RequestMetrics(object):
+
+    """Metrics collected while a request is handled."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.sql = defaultdict(lambda: [0, 0.0])
+        self.redis = defaultdict(lambda: [0, 0.0])
+        self.cache = defaultdict(lambda: [0, 0])
+
+    def totals(self):
+        sql = self.sql.values()
+        redis = self.redis.values()
+        cache = self.cache.values()
+        return dict(count=1,
+                    time=time.time() - self.started,
+                    sql_count=sum(n for n, _ in sql),
+                    sql_time=sum(t for _, t in sql),
+                    redis_count=sum(n for n, _ in redis),
+                    redis_time=sum(t for _, t in redis),
+                    cache_hits=sum(hits for hits, _ in cache),
+                    cache_misses=sum(misses for _, misses in cache))
+
+
+def current():
+    """Return the metrics of the current request, or None."""
+    if _app_ctx_stack.top is None:
+        return None
+    return getattr(g, '_request_metrics', None)
+
+
+def count_cache(name, hit):
+    """Count a hit or a miss of a memoized function."""
+    metrics = current()
+    if metrics is not None:
+        metrics.cache[name][0 if hit else 1] += 1
+
+
+def init_app(app):
+    from pybossa.core import db, sentinel
+    _engines[db.engine] = 'master'
+    binds = ['slave', 'bulkdel'] + list(
+        app.config.get('SQLALCHEMY_REPLICA_BINDS') or [])
+    for bind in binds:
+        if bind in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            _engines.setdefault(db.get_engine(app, bind=bind), bind)
+    _redis_pools[sentinel.master.connection_pool] = 'master'
+    _redis_pools.setdefault(sentinel.slave.connection_pool, 'slave')
+    _install()
+
+    @app.before_request
+    def _start_request_metrics():
+        g._request_metrics = RequestMetrics()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        metrics = current()
+        if metrics is None or request.endpoint in (None, 'static'):
+            return response
+        g._request_metrics = None
+        totals = metrics.totals()
+        if app.config.get('SERVER_TIMING_HEADER', True):
+            response.headers['Server-Timing'] = server_timing(metrics,
+                                                              totals)
+        if random.random() < app.config.get('REQUEST_METRICS_LOG_RATE',
+                                            0.01):
+            app.logger.info(log_line(metrics, totals, response))
+        try:
+            add_to_buffer(request.endpoint, totals,
+                          app.config.get('REQUEST_METRICS_FLUSH_SECONDS', 60))
+        except Exception:  # pragma: no cover
+            app.logger.exception('Could not record the request metrics')
+        return response
+
+
+def add_to_buffer(endpoint, totals, flush_seconds):
+    """Add the totals of a request to those of its endpoint, and flush
+    them when the last flush is older than flush_seconds."""
+    with _buffer_lock:
+        stats = _buffer.setdefault(endpoint, dict.fromkeys(SUM_FIELDS, 0))
+        for field in SUM_FIELDS:
+            stats[field] += totals[field]
+        if time.time() - _last_flush[0] < flush_seconds:
+            return
+    flush()
+
+
+def flush(conn=None):
+    """Add the totals buffered in this process to the rolling stats."""
+    with _buffer_lock:
+        values = dict(_buffer)
+        _buffer.clear()
+        _last_flush[0] = time.time()
+    if values:
+        rolling_stats.record_many(KEY_PREFIX, values, conn)
+
+
+def _install():
+    if _installed:
+        return
+    _installed.append(True)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    # RetryingStrictRedis runs its commands without calling the method of
+    # StrictRedis, so it is wrapped too
+    for cls in (StrictRedis, RetryingStrictRedis):
+        cls.execute_command = _time_redis_calls(
+            cls.__dict__['execute_command'])
+    BasePipeline.execute = _time_redis_calls(BasePipeline.execute)
+
+
+# Keyed by cursor and dropped when the statement fails
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('request_metrics_start', {})[cursor] = time.time()
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        context.connection.info.get('request_metrics_start', {}).pop(context.cursor, None)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = conn.info['request_metrics_start'].pop(cursor)
+    metrics = current()
+    if metrics is not None:
+        stats = metrics.sql[_engines.get(conn.engine, 'other')]
+        stats[0] += 1
+        stats[1] += time.time() - start
+
+
+def _time_redis_calls(func):
+    def wrapper(self, *args, **kwargs):
+        metrics = current()
+        if metrics is None:
+            return func(self, *args, **kwargs)
+        start = time.time()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            stats = metrics.redis[_redis_pools.get(self.connection_pool,
+                                                   'other')]
+            stats[0] += 1
+            stats[1] += time.time() - start
+    return wrapper
+
+
+def server_timing(metrics, totals):
+    """Format the metrics as a Server-Timing header value."""
+    entries = []
+    for bind, (count, duration) in sorted(metrics.sql.iteritems()):
+        entries.append('sql-{0};dur={1:.1f};desc="{2} statements"'
+                       .format(bind, duration * 1000, count))
+    for conn, (count, duration) in sorted(metrics.redis.iteritems()):
+        entries.append('redis-{0};dur={1:.1f};desc="{2} commands"'
+                       .format(conn, duration * 1000, count))
+    if metrics.cache:
+        entries.append('cache;desc="{0} hits {1} misses"'
+                       .format(totals['cache_hits'], totals['cache_misses']))
+    entries.append('total;dur={0:.1f}'.format(totals['time'] * 1000))
+    return ', '.join(entries)
+
+
+def log_line(metrics, totals, response):
+    """Return a JSON log line with the metrics of the request."""
+    data = dict(totals,
+                endpoint=request.endpoint,
+                method=request.method,
+                status=response.status_code,
+                sql=dict(metrics.sql),
+                redis=dict(metrics.redis),
+                cache=dict(metrics.cache))
+    return 'request_metrics ' + json.dumps(data, sort_keys=True)
+
+
+def get_slow_endpoints(limit=20, conn=None):
+    """Return the endpoints with the highest average time over the last
+    rolling_stats.N_BUCKETS hours."""
+    summary = rolling_stats.get_summary(KEY_PREFIX, SUM_FIELDS, conn=conn)
+    endpoints = []
+    for endpoint, stats in summary.iteritems():
+        count = stats['count'] or 1
+        stats['endpoint'] = endpoint
+        for field in ('time', 'sql_count', 'sql_time', 'redis_count',
+                      'redis_time'):
+            stats['avg_' + field] = stats[field] / count
+        endpoints.append(stats)
+    endpoints.sort(key=lambda stats: stats['avg_time'], reverse=True)
+    return endpoints[:limit]
@@ -0,0 +1,99 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA rolling stats stored in Redis.
+
+Values are added up per name in hourly buckets that expire after a day, so
+a summary always covers the last N_BUCKETS hours.
+
+"""
+import time
+
+from pybossa.core import sentinel
+
+
+BUCKET_SECONDS = 60 * 60
+N_BUCKETS = 24
+
+
+def _bucket_keys(prefix):
+    now = int(time.time()) // BUCKET_SECONDS * BUCKET_SECONDS
+    return ['{0}:{1}'.format(prefix, now - i * BUCKET_SECONDS)
+            for i in range(N_BUCKETS)]
+
+
+def record(prefix, name, values, max_values=None, conn=None):
+    """Add values to the current bucket of name. For max_values only the
+    highest value is kept."""
+    conn = conn or sentinel.master
+    bucket_key = _bucket_keys(prefix)[0]
+    key = '{0}:{1}'.format(bucket_key, name)
+    ttl = BUCKET_SECONDS * (N_BUCKETS + 1)
+    max_values = max_values or {}
+    previous = conn.hmget(key, max_values.keys()) if max_values else []
+    pipeline = conn.pipeline(transaction=False)
+    for field, value in values.iteritems():
+        pipeline.hincrbyfloat(key, field, value)
+    for (field, value), old in zip(max_values.iteritems(), previous):
+        if old is None or float(old) < value:
+            pipeline.hset(key, field, value)
+    pipeline.sadd(bucket_key, name)
+    pipeline.expire(key, ttl)
+    pipeline.expire(bucket_key, ttl)
+    pipeline.execute()
+
+
+def record_many(prefix, values_by_name, conn=None):
+    """Add the values of several names to their current buckets with a
+    single round trip."""
+    conn = conn or sentinel.master
+    bucket_key = _bucket_keys(prefix)[0]
+    ttl = BUCKET_SECONDS * (N_BUCKETS + 1)
+    pipeline = conn.pipeline(transaction=False)
+    for name, values in values_by_name.iteritems():
+        key = '{0}:{1}'.format(bucket_key, name)
+        for field, value in values.iteritems():
+            pipeline.hincrbyfloat(key, field, value)
+        pipeline.sadd(bucket_key, name)
+        pipeline.expire(key, ttl)
+    pipeline.expire(bucket_key, ttl)
+    pipeline.execute()
+
+
+def get_summary(prefix, sum_fields, max_fields=(), conn=None):
+    """Return a dict with the values of every name over the last
+    N_BUCKETS hours."""
+    conn = conn or sentinel.slave
+    bucket_keys = _bucket_keys(prefix)
+    pipeline = conn.pipeline(transaction=False)
+    for bucket_key in bucket_keys:
+        pipeline.smembers(bucket_key)
+    keys = [('{0}:{1}'.format(bucket_key, name), name)
+            for bucket_key, names in zip(bucket_keys, pipeline.execute())
+            for name in names]
+    for key, _ in keys:
+        pipeline.hgetall(key)
+    summary = {}
+    for (_, name), values in zip(keys, pipeline.execute()):
+        stats = summary.setdefault(name, dict.fromkeys(
+            list(sum_fields) + list(max_fields), 0.0))
+        for field in sum_fields:
+            stats[field] += float(values.get(field, 0))
+        for field in max_fields:
+            stats[field] = max(stats[field], float(values.get(field, 0)))
+    return summary
@@ -76,6 +76,17 @@ def can_post(project_id, task_id, user_id):
         return True
 
 
+def can_post_tasks(project_id, task_ids, user_id):
+    """Return, for each task id, whether the user can post a task run."""
+    scheduler, timeout = get_project_scheduler_and_timeout(project_id)
+    if scheduler == Schedulers.locked or scheduler == Schedulers.user_pref:
+        lock_manager = LockManager(sentinel.master, timeout)
+        task_users_keys = [get_task_users_key(task_id)
+                           for task_id in task_ids]
+        return lock_manager.has_locks(task_users_keys, user_id)
+    return [True] * len(task_ids)
+
+
 def can_read_task(task, user):
     project_id = task.project_id
     scheduler, timeout = get_project_scheduler_and_timeout(project_id)
@@ -92,6 +103,16 @@ def after_save(project_id, task_id, user_id):
         release_lock(task_id, user_id, timeout)
 
 
+def after_save_tasks(project_id, task_ids, user_id):
+    scheduler, timeout = get_project_scheduler_and_timeout(project_id)
+    if scheduler == Schedulers.locked or scheduler == Schedulers.user_pref:
+        pipeline = sentinel.master.pipeline(transaction=True)
+        for task_id in task_ids:
+            release_lock(task_id, user_id, timeout, pipeline=pipeline,
+                         execute=False)
+        pipeline.execute()
+
+
 def get_breadth_first_task(project_id, user_id=None, user_ip=None,
                            external_uid=None, offset=0, limit=1, orderby='id',
                            desc=False, **kwargs):
@@ -213,7 +234,8 @@ def locked_scheduler(query_factory):
             task = session.query(Task).get(task_id)
             if task:
                 return [task]
-        user_count = get_active_user_count(project_id, sentinel.master)
+        user_count = get_active_user_count(project_id, sentinel.master,
+                                           sentinel.replica)
         current_app.logger.info(
             "Project {} - number of current users: {}"
             .format(project_id, user_count))
@@ -367,7 +389,9 @@ def save_task_id_project_id(task_id, project_id, timeout):
 def get_task_ids_project_id(task_ids):
     keys = [get_task_id_project_id_key(t) for t in task_ids]
     if keys:
-        return sentinel.master.mget(keys)
+        # Missing project ids are read from the database again, so a stale
+        # replica is fine
+        return sentinel.replica.mget(keys)
     return []
 
 
@@ -16,7 +16,64 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
-from redis import sentinel, StrictRedis
+import time
+
+from redis import sentinel, StrictRedis, BlockingConnectionPool
+from redis.exceptions import ConnectionError, ResponseError
+
+
+# Commands that can be sent again when the connection fails, as running them
+# twice has no side effects
+IDEMPOTENT_COMMANDS = frozenset([
+    'DBSIZE', 'EXISTS', 'GET', 'HEXISTS', 'HGET', 'HGETALL', 'HKEYS', 'HLEN',
+    'HMGET', 'HSCAN', 'HVALS', 'INFO', 'KEYS', 'LINDEX', 'LLEN', 'LRANGE',
+    'MGET', 'PING', 'PTTL', 'SCAN', 'SCARD', 'SISMEMBER', 'SMEMBERS', 'SSCAN',
+    'STRLEN', 'TTL', 'TYPE', 'ZCARD', 'ZCOUNT', 'ZRANGE', 'ZRANGEBYSCORE',
+    'ZRANK', 'ZREVRANGE', 'ZREVRANGEBYSCORE', 'ZREVRANK', 'ZSCAN', 'ZSCORE'])
+
+
+class RetryingStrictRedis(StrictRedis):
+
+    """StrictRedis client that retries a command with an exponential backoff
+    during a failover.
+
+    A command rejected with READONLY, because the server has been demoted to
+    a replica, was not run and is always retried. When the connection fails
+    the command may have run already, so only idempotent reads are retried.
+    Only the failed connection is dropped, so that it connects to the master
+    again, and the connections in use by other threads are left alone.
+    Failing to get a connection from an exhausted pool is not retried.
+    Commands sent through pipelines are not retried."""
+
+    retry_attempts = 3
+    retry_backoff = 0.05
+
+    def execute_command(self, *args, **options):
+        pool = self.connection_pool
+        command_name = args[0]
+        attempt = 0
+        while True:
+            connection = pool.get_connection(command_name, **options)
+            try:
+                connection.send_command(*args)
+                return self.parse_response(connection, command_name,
+                                           **options)
+            except (ConnectionError, ResponseError) as e:
+                readonly = isinstance(e, ResponseError) and \
+                    str(e).startswith('READONLY')
+                if isinstance(e, ResponseError) and not readonly:
+                    raise
+                connection.disconnect()
+                if attempt >= self.retry_attempts:
+                    raise
+                if not readonly and \
+                        command_name.upper() not in IDEMPOTENT_COMMANDS:
+                    raise
+            finally:
+                pool.release(connection)
+            time.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+
 
 class Sentinel(object):
 
@@ -24,27 +81,70 @@ class Sentinel(object):
         self.app = app
         self.master = StrictRedis()
         self.slave = self.master
+        self.replica = self.master
         if app is not None:  # pragma: no cover
             self.init_app(app)
 
     def init_app(self, app):
+        config = app.config
         conn_kwargs = {
-            'db': app.config.get('REDIS_DB') or 0,
-            'password': app.config.get('REDIS_PWD')
+            'db': config.get('REDIS_DB') or 0,
+            'password': config.get('REDIS_PWD'),
+            'socket_timeout': config.get('REDIS_SOCKET_TIMEOUT')
         }
-        if app.config.get('REDIS_MASTER_DNS') and \
-            app.config.get('REDIS_SLAVE_DNS') and \
-            app.config.get('REDIS_PORT'):
-            self.master = StrictRedis(host=app.config['REDIS_MASTER_DNS'],
-                port=app.config['REDIS_PORT'], **conn_kwargs)
-            self.slave = StrictRedis(host=app.config['REDIS_SLAVE_DNS'],
-                port=app.config['REDIS_PORT'], **conn_kwargs)
+        max_connections = config.get('REDIS_MAX_CONNECTIONS', 50)
+        if config.get('REDIS_MASTER_DNS') and \
+            config.get('REDIS_SLAVE_DNS') and \
+            config.get('REDIS_PORT'):
+            pool_kwargs = dict(conn_kwargs, port=config['REDIS_PORT'],
+                               max_connections=max_connections,
+                               timeout=config.get('REDIS_POOL_TIMEOUT', 1))
+            self.master = RetryingStrictRedis(
+                connection_pool=BlockingConnectionPool(
+                    host=config['REDIS_MASTER_DNS'], **pool_kwargs))
+            self.slave = RetryingStrictRedis(
+                connection_pool=BlockingConnectionPool(
+                    host=config['REDIS_SLAVE_DNS'], **pool_kwargs))
+        else:
+            self.connection = sentinel.Sentinel(
+                config['REDIS_SENTINEL'],
+                socket_timeout=config.get('REDIS_SENTINEL_SOCKET_TIMEOUT',
+                                          0.1))
+            redis_master = config.get('REDIS_MASTER') or 'mymaster'
+            self.master = self.connection.master_for(
+                redis_master, redis_class=RetryingStrictRedis,
+                max_connections=max_connections, **conn_kwargs)
+            self.slave = self.connection.slave_for(
+                redis_master, redis_class=RetryingStrictRedis,
+                max_connections=max_connections, **conn_kwargs)
+        for client in (self.master, self.slave):
+            client.retry_attempts = config.get('REDIS_RETRY_ATTEMPTS', 3)
+            client.retry_backoff = config.get('REDIS_RETRY_BACKOFF', 0.05)
+        # Reads that can be slightly stale, e.g. counters and lock listings,
+        # go to the replicas unless REDIS_REPLICA_READS is disabled
+        if config.get('REDIS_REPLICA_READS', True):
+            self.replica = self.slave
         else:
-            self.connection = sentinel.Sentinel(app.config['REDIS_SENTINEL'],
-                                                socket_timeout=0.1)
-            redis_master = app.config.get('REDIS_MASTER') or 'mymaster'
-            self.master = self.connection.master_for(redis_master, **conn_kwargs)
-            self.slave = self.connection.slave_for(redis_master, **conn_kwargs)
+            self.replica = self.master
+
+    def pool_stats(self):
+        """Return the size and the connections in use of the connection
+        pools of this process."""
+        stats = {'master': _pool_usage(self.master.connection_pool)}
+        if self.slave.connection_pool is not self.master.connection_pool:
+            stats['slave'] = _pool_usage(self.slave.connection_pool)
+        return stats
+
+
+def _pool_usage(pool):
+    if isinstance(pool, BlockingConnectionPool):
+        idle = len([c for c in pool.pool.queue if c is not None])
+        created = len(pool._connections)
+    else:
+        idle = len(pool._available_connections)
+        created = pool._created_connections
+    return dict(max_connections=pool.max_connections,
+                created=created, in_use=created - idle)
 
 
 def scan_iter(conn, match, count=None):
@@ -135,6 +135,18 @@ def handle_content_type(data):
         else:
             return render_template(template, **data)
 
+def make_conditional(response, etag, private=False):
+    """Set the ETag of a response and return 304 Not Modified when it
+    matches the If-None-Match header of the request. Clients revalidate
+    the response on every use. Responses that depend on the user must be
+    private and have the user in the etag."""
+    response = make_response(response)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = '%s, no-cache' % (
+        'private' if private else 'public')
+    return response.make_conditional(request)
+
+
 def is_own_url(url):
     from urlparse import urlparse
     if not url:
@@ -27,6 +27,7 @@ from flask import redirect
 from flask import url_for
 from flask import current_app
 from flask import Response
+from flask import stream_with_context
 from flask import Markup
 from flask.ext.login import login_required, current_user
 from flask.ext.babel import gettext
@@ -52,6 +53,8 @@ from pybossa.core import announcement_repo, project_repo, user_repo, sentinel
 from pybossa.feed import get_update_feed
 import pybossa.dashboard.data as dashb
 from pybossa.jobs import get_dashboard_jobs
+from pybossa import job_metrics
+from pybossa import request_metrics
 import json
 from StringIO import StringIO
 
@@ -65,7 +68,7 @@ from pybossa.cache.users import get_users_for_report
 from collections import OrderedDict
 import app_settings
 
-blueprint = Blueprint('admin', __name__)
+blueprint = Blueprint('admin', __name__, template_folder='templates')
 
 DASHBOARD_QUEUE = Queue('super', connection=sentinel.master)
 
@@ -188,14 +191,16 @@ def export_users():
 
     def respond_json():
         tmp = 'attachment; filename=all_users.json'
-        res = Response(gen_json(), mimetype='application/json')
+        res = Response(stream_with_context(gen_json()),
+                       mimetype='application/json')
         res.headers['Content-Disposition'] = tmp
         return res
 
     def gen_json():
-        users = get_users_for_report()
-        jdata = json.dumps(users)
-        return jdata
+        yield '['
+        for index, user in enumerate(get_users_for_report()):
+            yield (',' if index else '') + json.dumps(user)
+        yield ']'
 
     def dictize_with_exportable_attributes(user):
         dict_user = {}
@@ -207,16 +212,25 @@ def export_users():
         out = StringIO()
         writer = UnicodeWriter(out)
         tmp = 'attachment; filename=all_users.csv'
-        res = Response(gen_csv(out, writer, write_user), mimetype='text/csv')
+        res = Response(stream_with_context(gen_csv(out, writer, write_user)),
+                       mimetype='text/csv')
         res.headers['Content-Disposition'] = tmp
         return res
 
+    def flush(out):
+        data = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return data
+
     def gen_csv(out, writer, write_user):
         add_headers(writer)
-        users = get_users_for_report()
-        for user in users:
+        yield flush(out)
+        for index, user in enumerate(get_users_for_report(), 1):
             write_user(writer, user)
-        yield out.getvalue()
+            if index % 1000 == 0:
+                yield flush(out)
+        yield flush(out)
 
     def write_user(writer, user):
         values = [user[attr] for attr in exportable_attributes]
@@ -592,6 +606,37 @@ def dashboard():
         return abort(500)
 
 
+@blueprint.route('/jobs/metrics')
+@login_required
+@admin_required
+def jobs_metrics():
+    """Show the metrics of the background jobs over the last day, next to
+    the RQ dashboard, or return them as JSON."""
+    summary = job_metrics.get_summary()
+    response = dict(metrics=OrderedDict(sorted(summary.items())),
+                    hours=job_metrics.N_BUCKETS)
+    if request.accept_mimetypes.best == 'text/html' and \
+            request.args.get('response_format') != 'json':
+        periodic = job_metrics.get_periodic_summary()
+        return render_template('admin/jobs_metrics.html',
+                               title=gettext('Job metrics'),
+                               periodic=OrderedDict(sorted(periodic.items())),
+                               **response)
+    return Response(json.dumps(response), mimetype='application/json')
+
+
+@blueprint.route('/endpoints/slow')
+@login_required
+@admin_required
+def slow_endpoints():
+    """Return the endpoints with the highest average time over the last
+    day."""
+    limit = request.args.get('limit', 20, type=int)
+    response = dict(endpoints=request_metrics.get_slow_endpoints(limit),
+                    hours=job_metrics.N_BUCKETS)
+    return Response(json.dumps(response), mimetype='application/json')
+
+
 @blueprint.route('/management_dashboard/')
 @login_required
 @admin_required
@@ -18,9 +18,11 @@
 """Healthcheck for PYBOSSA."""
 import json
 
-from flask import Blueprint, Response, current_app
+from flask import Blueprint, Response, abort, current_app, request
+from flask.ext.login import current_user
 
 from pybossa.core import sentinel, db, talisman
+from pybossa import job_metrics
 
 
 blueprint = Blueprint('diagnostics', __name__)
@@ -72,3 +74,34 @@ def healthcheck():
     status = 200 if healthy else 500
     return Response(json.dumps(response), status=status,
                     mimetype='application/json')
+
+
+@blueprint.route('/metrics')
+@talisman(force_https=False)
+def metrics():
+    """Background job metrics for a local Prometheus scraper. Only the
+    addresses in DIAGNOSTICS_METRICS_ALLOWED_IPS and the admins can read
+    them."""
+    allowed_ips = current_app.config.get('DIAGNOSTICS_METRICS_ALLOWED_IPS',
+                                         ['127.0.0.1'])
+    if request.remote_addr not in allowed_ips and \
+            not (current_user.is_authenticated() and current_user.admin):
+        abort(403)
+    summary = job_metrics.get_summary()
+    periodic_summary = job_metrics.get_periodic_summary()
+    text = (job_metrics.format_prometheus(summary, periodic_summary) +
+            format_redis_pools(sentinel.pool_stats()))
+    return Response(text, mimetype='text/plain')
+
+
+def format_redis_pools(pool_stats):
+    """Format the Redis connection pool usage of this process."""
+    lines = []
+    for field in ('max_connections', 'created', 'in_use'):
+        metric = 'pybossa_redis_pool_{0}'.format(field)
+        lines.append('# TYPE {0} gauge'.format(metric))
+        for pool in sorted(pool_stats):
+            lines.append('{0}{{pool="{1}"}} {2}'
+                         .format(metric, pool, pool_stats[pool][field]))
+    return '\n'.join(lines) + '\n'
+
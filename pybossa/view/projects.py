@@ -58,6 +58,7 @@ from pybossa.cache import categories as cached_cat
 from pybossa.cache import project_stats as stats
 from pybossa.cache.helpers import add_custom_contrib_button_to, has_no_presenter
 from pybossa.cache.task_browse_helpers import (get_searchable_columns,
+                                               get_indexed_columns,
                                                parse_tasks_browse_args)
 from pybossa.ckan import Ckan
 from pybossa.extensions import misaka
@@ -66,8 +67,11 @@ from pybossa.password_manager import ProjectPasswdManager
 from pybossa.jobs import (webhook, send_mail,
                           import_tasks, IMPORT_TASKS_TIMEOUT,
                           delete_bulk_tasks, TASK_DELETE_TIMEOUT,
+                          update_bulk_tasks_redundancy,
+                          update_bulk_tasks_priority,
                           export_tasks, EXPORT_TASKS_TIMEOUT,
-                          mail_project_report)
+                          mail_project_report, sync_task_info_indexes,
+                          index_task_info_tsv)
 from pybossa.forms.projects_view_forms import *
 from pybossa.forms.admin_view_forms import SearchForm
 from pybossa.importers import BulkImportException
@@ -99,6 +103,7 @@ blueprint_projectid = Blueprint('projectid', __name__)
 
 MAX_NUM_SYNCHRONOUS_TASKS_IMPORT = 200
 MAX_NUM_SYNCHRONOUS_TASKS_DELETE = 1000
+MAX_NUM_SYNCHRONOUS_TASKS_UPDATE = 1000
 DEFAULT_TASK_TIMEOUT = ContributionsGuard.STAMP_TTL
 
 auditlogger = AuditLogger(auditlog_repo, caller='web')
@@ -1028,10 +1033,8 @@ def task_presenter(short_name, task_id):
 
     guard = ContributionsGuard(sentinel.master,
                                timeout=project.info.get('timeout'))
-    guard.stamp(task, get_user_id_or_ip())
-
-    if not guard.check_task_presented_timestamp(task, get_user_id_or_ip()):
-        guard.stamp_presented_time(task, get_user_id_or_ip())
+    # Unlike newtask, the presenter never extended the presented time
+    guard.stamp_many([task], get_user_id_or_ip(), extend_presented=False)
 
     if has_no_presenter(project):
         flash(gettext("Sorry, but this project is still a draft and does "
@@ -1283,6 +1286,8 @@ def tasks_browse(short_name, page=1, records_per_page=10):
         args["order_by"] = args.pop("order_by_dict", dict())
         args.pop("records_per_page", None)
         args.pop("offset", None)
+        args.pop("order_by_fields", None)
+        args.pop("cursor", None)
 
         if disp_info_columns:
             for task in page_tasks:
@@ -1404,7 +1409,13 @@ def bulk_priority_update(short_name):
             })
         else:
             args = parse_tasks_browse_args(request.json.get('filters'))
-            task_repo.update_priority(project.id, priority_0, args)
+            count = cached_projects.task_count(project.id, args)
+            if count > MAX_NUM_SYNCHRONOUS_TASKS_UPDATE:
+                data = _bulk_update_data(project, priority_0=priority_0,
+                                         filters=args)
+                task_queue.enqueue(update_bulk_tasks_priority, data)
+            else:
+                task_repo.update_priority(project.id, priority_0, args)
             new_value = json.dumps({
                 'filters': args,
                 'priority_0': priority_0
@@ -1441,10 +1452,16 @@ def bulk_redundancy_update(short_name):
 
         else:
             args = parse_tasks_browse_args(request.json.get('filters'))
-            tasks_not_updated = task_repo.update_tasks_redundancy(project, n_answers, args)
-            notify_redundancy_updates(tasks_not_updated)
-            if tasks_not_updated:
-                flash('Redundancy of some of the tasks could not be updated. An email has been sent with details')
+            count = cached_projects.task_count(project.id, args)
+            if count > MAX_NUM_SYNCHRONOUS_TASKS_UPDATE:
+                data = _bulk_update_data(project, n_answers=n_answers,
+                                         filters=args)
+                task_queue.enqueue(update_bulk_tasks_redundancy, data)
+            else:
+                tasks_not_updated = task_repo.update_tasks_redundancy(project, n_answers, args)
+                notify_redundancy_updates(tasks_not_updated)
+                if tasks_not_updated:
+                    flash('Redundancy of some of the tasks could not be updated. An email has been sent with details')
 
             new_value = json.dumps({
                 'filters': args,
@@ -1458,6 +1475,80 @@ def bulk_redundancy_update(short_name):
         return ErrorStatus().format_exception(e, 'redundancyupdate', 'POST')
 
 
+@crossdomain(origin='*', headers=cors_headers)
+@blueprint.route('/<short_name>/tasks/indexedfields', methods=['GET', 'POST'])
+@login_required
+@admin_or_subadmin_required
+def indexed_fields(short_name):
+    """Return or set the task.info fields indexed for browse filtering."""
+    try:
+        project, owner, ps = project_by_shortname(short_name)
+        ensure_authorized_to('read', project)
+        columns = get_searchable_columns(project.id)
+        if request.method == 'POST':
+            ensure_authorized_to('update', project)
+            fields = request.json.get('indexed_fields') or []
+            invalid = [field for field in fields if field not in columns]
+            if invalid:
+                raise ValueError('Invalid fields: {}'.format(invalid))
+            old_value = json.dumps(get_indexed_columns(project))
+            project.info['indexed_fields'] = fields
+            project_repo.save(project)
+            task_queue.enqueue(sync_task_info_indexes, project.id)
+            auditlogger.log_event(project, current_user, 'update',
+                                  'project.indexed_fields', old_value,
+                                  json.dumps(fields))
+        response = dict(searchable_fields=columns,
+                        indexed_fields=get_indexed_columns(project))
+        return Response(json.dumps(response), 200,
+                        mimetype='application/json')
+    except Exception as e:
+        return ErrorStatus().format_exception(e, 'indexedfields',
+                                              request.method)
+
+
+@crossdomain(origin='*', headers=cors_headers)
+@blueprint.route('/<short_name>/tasks/searchlanguage', methods=['GET', 'POST'])
+@login_required
+@admin_or_subadmin_required
+def search_language(short_name):
+    """Return or set the text search language of the task.info filters."""
+    try:
+        project, owner, ps = project_by_shortname(short_name)
+        ensure_authorized_to('read', project)
+        languages = task_repo.get_text_search_languages()
+        if request.method == 'POST':
+            ensure_authorized_to('update', project)
+            language = request.json.get('text_search_language')
+            if language not in languages:
+                raise ValueError('Invalid language: {}'.format(language))
+            old_value = project.info.get('text_search_language')
+            if language != old_value:
+                project.info['text_search_language'] = language
+                project_repo.save(project)
+                task_queue.enqueue(index_task_info_tsv, project.id, True)
+                auditlogger.log_event(project, current_user, 'update',
+                                      'project.text_search_language',
+                                      old_value, language)
+        language = (project.info.get('text_search_language') or
+                    current_app.config.get('FULLTEXTSEARCH_LANGUAGE'))
+        response = dict(languages=languages, text_search_language=language)
+        return Response(json.dumps(response), 200,
+                        mimetype='application/json')
+    except Exception as e:
+        return ErrorStatus().format_exception(e, 'searchlanguage',
+                                              request.method)
+
+
+def _bulk_update_data(project, **data):
+    """Return the data of a bulk update job of the tasks of project."""
+    data.update(project_id=project.id, project_name=project.name,
+                curr_user=current_user.email_addr,
+                coowners=user_repo.get_users(project.owners_ids),
+                current_user_fullname=current_user.fullname)
+    return data
+
+
 def _update_task_redundancy(project_id, task_ids, n_answers):
     """
     Update the redundancy for a list of tasks in a given project. Mark tasks
@@ -1928,6 +2019,13 @@ def task_n_answers(short_name):
                       'N/A', default_form.default_n_answers.data)
             msg = gettext('Redundancy updated!')
             flash(msg, 'success')
+        elif form.validate() and ps.n_tasks > MAX_NUM_SYNCHRONOUS_TASKS_UPDATE:
+            data = _bulk_update_data(project, n_answers=form.n_answers.data)
+            task_queue.enqueue(update_bulk_tasks_redundancy, data)
+            flash(gettext("You're trying to update a large amount of tasks, so please be patient.\
+                    You will receive an email when the redundancy update is complete."))
+            auditlogger.log_event(project, current_user, 'update', 'task.n_answers',
+                                  'N/A', form.n_answers.data)
         elif form.validate():
             tasks_not_updated = task_repo.update_tasks_redundancy(project, form.n_answers.data)
             if tasks_not_updated:
@@ -17,12 +17,12 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 """Stats view on PYBOSSA."""
 import json
-from flask import Blueprint
+from flask import Blueprint, request
+from flask.ext.babel import get_locale
 
 from pybossa.cache import site_stats
-from pybossa.cache import projects as cached_projects
-from pybossa.util import handle_content_type
-from flask.ext.login import login_required
+from pybossa.util import handle_content_type, make_conditional
+from flask.ext.login import current_user, login_required
 
 blueprint = Blueprint('stats', __name__)
 
@@ -33,23 +33,26 @@ def index():
     """Return Global Statistics for the site."""
     title = "Global Statistics"
 
-    n_auth = site_stats.n_auth_users()
+    snapshot = site_stats.get_snapshot()
+    site = snapshot['stats']
 
-    n_anon = site_stats.n_anon_users()
+    n_auth = site['n_auth_users']
+
+    n_anon = site['n_anon_users']
 
     n_total_users = n_anon + n_auth
 
-    n_published_projects = cached_projects.n_published()
-    n_draft_projects = cached_projects.n_count('draft')
+    n_published_projects = site['n_published']
+    n_draft_projects = site['n_draft']
     n_total_projects = n_published_projects + n_draft_projects
 
-    n_tasks = site_stats.n_tasks_site()
+    n_tasks = site['n_tasks']
 
-    n_task_runs = site_stats.n_task_runs_site()
+    n_task_runs = site['n_task_runs']
 
-    top5_projects_24_hours = site_stats.get_top5_projects_24_hours()
+    top5_projects_24_hours = site['top5_projects_24_hours']
 
-    top5_users_24_hours = site_stats.get_top5_users_24_hours()
+    top5_users_24_hours = site['top5_users_24_hours']
 
     stats = dict(n_total_users=n_total_users, n_auth=n_auth, n_anon=n_anon,
                  n_published_projects=n_published_projects,
@@ -82,4 +85,8 @@ def index():
                     top5_users_24_hours=top5_users_24_hours,
                     top5_projects_24_hours=top5_projects_24_hours,
                     stats=stats)
-    return handle_content_type(response)
+    # The page shows the current user and is rendered in their language
+    etag = '%s-%s-%s-%s' % (snapshot['etag'], current_user.id, get_locale(),
+                            request.args.get('response_format', ''))
+    return make_conditional(handle_content_type(response), etag,
+                            private=True)
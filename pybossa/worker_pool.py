@@ -0,0 +1,198 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+PYBOSSA pool of prewarmed RQ workers.
+
+The app is created once and every worker performs its jobs in place, instead
+of forking a child per job. The concurrency of each queue is configured with
+RQ_WORKER_CONCURRENCY, e.g. {'email': 8, 'high': 8, 'low': 2}. Those queues
+are served by threads, except the ones listed in RQ_WORKER_PROCESS_QUEUES,
+which get long lived processes for CPU bound jobs. The rest of the queues are
+served by a single process, like a regular worker.
+
+"""
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing import Process
+
+from rq import Queue, Worker
+from rq.exceptions import DequeueTimeout
+
+from pybossa import job_metrics
+
+
+class InstrumentedWorker(Worker):
+
+    """Worker recording the metrics of every job it performs."""
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedWorker, self).__init__(*args, **kwargs)
+        job_metrics.install()
+
+    def perform_job(self, job):
+        metrics = job_metrics.start(job)
+        success = super(InstrumentedWorker, self).perform_job(job)
+        try:
+            job_metrics.finish(metrics, failed=success is False)
+        except Exception:
+            self.log.exception('Could not record the metrics of the job')
+        return success
+
+
+class PrewarmedWorker(InstrumentedWorker):
+
+    """Worker that performs the jobs in its own thread or process.
+
+    rq 0.4 forks a work horse per job in execute_job, which is overridden to
+    perform the job in place instead.
+    """
+
+    def execute_job(self, job):
+        self.perform_job(job)
+
+
+class NoDeathPenalty(object):
+
+    """Job timeouts rely on SIGALRM, which only the main thread can handle,
+    so they are not enforced for jobs run in threads."""
+
+    def __init__(self, timeout):
+        self._timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+
+class ThreadWorker(PrewarmedWorker):
+
+    """Worker running in a thread. It stops after the current job once
+    stop_event is set."""
+
+    death_penalty_class = NoDeathPenalty
+    dequeue_timeout = 5
+
+    def __init__(self, queues, stop_event, **kwargs):
+        super(ThreadWorker, self).__init__(queues, **kwargs)
+        self.stop_event = stop_event
+
+    def work(self, burst=False):
+        self.register_birth()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    result = Queue.dequeue_any(self.queues,
+                                               self.dequeue_timeout,
+                                               connection=self.connection)
+                except DequeueTimeout:
+                    self.heartbeat()
+                    continue
+                if result is None:
+                    if burst:
+                        break
+                    continue
+                job, queue = result
+                self.execute_job(job)
+        finally:
+            self.register_death()
+
+
+def worker_name(queue_name, index):
+    return '{0}.{1}.{2}.{3}'.format(socket.gethostname(), os.getpid(),
+                                    queue_name, index)
+
+
+def work_in_thread(app, queue_names, name, stop_event):
+    from pybossa.core import sentinel
+    connection = sentinel.master
+    queues = [Queue(queue_name, connection=connection)
+              for queue_name in queue_names]
+    with app.app_context():
+        worker = ThreadWorker(queues, stop_event, name=name,
+                              connection=connection)
+        worker.work()
+
+
+def work_in_process(app, queue_names, name):
+    from pybossa.core import db, sentinel
+    # Database connections can not be shared with the parent process
+    db.engine.dispose()
+    connection = sentinel.master
+    queues = [Queue(queue_name, connection=connection)
+              for queue_name in queue_names]
+    with app.app_context():
+        worker = PrewarmedWorker(queues, name=name, connection=connection)
+        worker.work()
+
+
+def run_pool(app, queue_names):
+    """Serve the queues with the configured concurrency until SIGTERM or
+    SIGINT. Running jobs are allowed to finish before exiting."""
+    concurrency = app.config.get('RQ_WORKER_CONCURRENCY') or {}
+    process_queues = app.config.get('RQ_WORKER_PROCESS_QUEUES') or []
+    stop_event = threading.Event()
+    threads = []
+    processes = []
+    for queue_name in queue_names:
+        for index in range(concurrency.get(queue_name, 0)):
+            name = worker_name(queue_name, index)
+            if queue_name in process_queues:
+                processes.append(Process(target=work_in_process,
+                                         args=(app, [queue_name], name)))
+            else:
+                threads.append(threading.Thread(
+                    target=work_in_thread,
+                    args=(app, [queue_name], name, stop_event)))
+    default_queues = [queue_name for queue_name in queue_names
+                      if not concurrency.get(queue_name)]
+    if default_queues:
+        processes.append(Process(target=work_in_process,
+                                 args=(app, default_queues,
+                                       worker_name('default', 0))))
+
+    def shutdown(signum=None, frame=None):
+        stop_event.set()
+        for process in processes:
+            if process.is_alive():
+                # rq workers do a warm shutdown on SIGTERM
+                os.kill(process.pid, signal.SIGTERM)
+
+    # Processes are forked before the handlers are installed, so they keep
+    # the ones of rq
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for thread in threads:
+        thread.start()
+
+    workers = threads + processes
+    # Sleep instead of join, so that signals are handled
+    while not stop_event.is_set():
+        if not all(worker.is_alive() for worker in workers):
+            app.logger.error('A worker died, shutting down the pool')
+            shutdown()
+            break
+        time.sleep(1)
+    for worker in workers:
+        worker.join()
@@ -489,6 +489,8 @@ def mock_contributions_guard(stamped=True, timestamp='2015-11-18T16:29:25.496327
     fake_guard_instance = MagicMock()
     fake_guard_instance.check_task_stamped.return_value = stamped
     fake_guard_instance.retrieve_timestamp.return_value = timestamp
+    fake_guard_instance.retrieve_stamps.return_value = (
+        timestamp if stamped else None, None)
     return fake_guard_instance
 
 
@@ -496,4 +498,6 @@ def mock_contributions_guard_presented_time(stamped=True, timestamp='2015-11-18T
     fake_guard_instance = MagicMock()
     fake_guard_instance.check_task_presented_timestamp.return_value = stamped
     fake_guard_instance.retrieve_presented_timestamp.return_value = timestamp
+    fake_guard_instance.retrieve_stamps.return_value = (
+        timestamp, timestamp if stamped else None)
     return fake_guard_instance
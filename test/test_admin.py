@@ -1151,6 +1151,50 @@ class TestAdmin(web.Helper):
         assert "Sign in" in res.data, err_msg
 
 
+    @with_context
+    def test_admin_slow_endpoints_json(self):
+        """Test ADMIN JSON slow endpoints reports the request metrics once
+        they are flushed"""
+        from pybossa import request_metrics
+        request_metrics.flush()
+        self.redis_flushall()
+        self.register()
+        self.signin()
+        res = self.app.get('/about')
+        assert 'total;dur=' in res.headers['Server-Timing'], res.headers
+
+        res = self.app_get_json('/admin/endpoints/slow')
+        data = json.loads(res.data)
+        endpoints = [e['endpoint'] for e in data['endpoints']]
+        assert 'home.about' not in endpoints, endpoints
+
+        request_metrics.flush()
+        res = self.app_get_json('/admin/endpoints/slow')
+        data = json.loads(res.data)
+        endpoints = [e['endpoint'] for e in data['endpoints']]
+        assert 'home.about' in endpoints, endpoints
+
+    @with_context
+    def test_admin_jobs_metrics(self):
+        """Test ADMIN jobs metrics returns the job metrics as JSON"""
+        from pybossa import job_metrics
+        values = dict(count=1, failed=0, wait_time=2.0, run_time=4.0,
+                      sql_count=10, sql_time=0.5, redis_calls=3)
+        job_metrics.record('pybossa.jobs.warm_cache', values, 1024)
+        self.register()
+        self.signin()
+
+        res = self.app.get('/admin/jobs/metrics')
+        assert res.status_code == 200, res.status_code
+        data = json.loads(res.data)
+        assert data['metrics']['pybossa.jobs.warm_cache']['count'] == 1, data
+
+        res = self.app.get('/admin/jobs/metrics',
+                           headers={'Accept': 'text/html'})
+        assert res.status_code == 200, res.status_code
+        assert 'text/html' in res.headers['Content-Type'], res.headers
+        assert 'pybossa.jobs.warm_cache' in res.data, res.data
+
     @with_context
     def test_admin_dashboard_auth_user(self):
         """Test ADMIN dashboard requires admin"""
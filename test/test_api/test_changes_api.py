@@ -0,0 +1,101 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2017 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+import json
+from default import db, with_context
+from test_api import TestAPI
+
+from factories import ProjectFactory, TaskFactory, TaskRunFactory, UserFactory
+
+from pybossa.repositories import ChangeRepository, TaskRepository
+
+change_repo = ChangeRepository(db)
+task_repo = TaskRepository(db)
+
+
+class TestChangesAPI(TestAPI):
+
+    url = '/api/changes?project_id=%s&api_key=%s'
+
+    @with_context
+    def test_changes_returns_events_after_cursor(self):
+        """Test API changes returns the events after the cursor in order"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=2)
+        taskrun = TaskRunFactory.create(task=task)
+        task_repo.delete(taskrun)
+
+        url = self.url % (project.id, project.owner.api_key)
+        res = self.app.get(url)
+        data = json.loads(res.data)
+        assert res.status_code == 200, res.data
+        events = [(e['object_type'], e['object_id'], e['action'])
+                  for e in data['changes']]
+        assert ('task', task.id, 'insert') in events, events
+        assert events[-2:] == [('taskrun', taskrun.id, 'insert'),
+                               ('taskrun', taskrun.id, 'delete')], events
+        seqs = [e['seq'] for e in data['changes']]
+        assert seqs == sorted(seqs), seqs
+        assert data['cursor'] == seqs[-1], data
+
+        res = self.app.get(url + '&after=%s' % data['cursor'])
+        data = json.loads(res.data)
+        assert data['changes'] == [], data
+        assert data['cursor'] == seqs[-1], data
+
+    @with_context
+    def test_changes_include_tasks_updated_with_raw_sql(self):
+        """Test API changes has an update event for the tasks completed or
+        updated in bulk"""
+        project = ProjectFactory.create()
+        task, other = TaskFactory.create_batch(2, project=project,
+                                               n_answers=1)
+        TaskRunFactory.create(task=task)
+        task_repo.update_priority(project.id, 0.5, {})
+
+        url = self.url % (project.id, project.owner.api_key)
+        data = json.loads(self.app.get(url).data)
+        updates = [e['object_id'] for e in data['changes']
+                   if e['object_type'] == 'task' and e['action'] == 'update']
+        assert updates == [task.id, task.id, other.id], data
+
+    @with_context
+    def test_changes_only_for_owners(self):
+        """Test API changes is only allowed to the project owners"""
+        project = ProjectFactory.create()
+        user = UserFactory.create()
+
+        res = self.app.get('/api/changes?project_id=%s' % project.id)
+        assert res.status_code == 401, res.status_code
+        res = self.app.get(self.url % (project.id, user.api_key))
+        assert res.status_code == 401, res.status_code
+        res = self.app.get(self.url % (9999, user.api_key))
+        assert res.status_code == 404, res.status_code
+
+    @with_context
+    def test_compact_keeps_last_event_of_each_object(self):
+        """Test CHANGE REPOSITORY compact keeps the last event per object"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+        task.priority_0 = 0.5
+        task_repo.update(task)
+
+        assert change_repo.compact('9999-01-01') == 1
+        changes = change_repo.get_changes(project.id)
+        assert [(c.object_id, c.action) for c in changes] == \
+            [(task.id, 'update')], changes
+        assert change_repo.delete_older_than('9999-01-01') == 1
@@ -74,3 +74,42 @@ class TestCompletedTaskAPI(TestAPI):
         data = json.loads(res.data)
         assert len(data) == 2, data
         
+
+    @with_context
+    def test_completedtask_since_cursor(self):
+        """Test API completedtask tails the completions with since"""
+        project = ProjectFactory.create()
+        other = ProjectFactory.create()
+        admin = project.owner
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        other_task = TaskFactory.create(project=other, n_answers=1)
+        TaskRunFactory.create(task=tasks[1])
+        TaskRunFactory.create(task=other_task)
+        TaskRunFactory.create(task=tasks[0])
+
+        url = '/api/completedtask?since=0&limit=1&project_id=%s&api_key=%s'
+        res = self.app.get(url % (project.id, admin.api_key))
+        data = json.loads(res.data)
+        assert [task['id'] for task in data] == [tasks[1].id], data
+        cursor = res.headers['X-Completion-Cursor']
+
+        url = '/api/completedtask?since=%s&project_id=%s&api_key=%s'
+        res = self.app.get(url % (cursor, project.id, admin.api_key))
+        data = json.loads(res.data)
+        assert [task['id'] for task in data] == [tasks[0].id], data
+        cursor = res.headers['X-Completion-Cursor']
+
+        res = self.app.get(url % (cursor, project.id, admin.api_key))
+        assert json.loads(res.data) == [], res.data
+        assert res.headers['X-Completion-Cursor'] == cursor
+
+        url = '/api/completedtask?since=0&state=ongoing&api_key=%s'
+        res = self.app.get(url % admin.api_key)
+        assert res.status_code == 415, res.status_code
+
+        url = '/api/completedtask?since=abc&api_key=%s'
+        res = self.app.get(url % admin.api_key)
+        assert res.status_code == 400, res.status_code
+        error = json.loads(res.data)
+        assert error['exception_msg'] == \
+            'since must be an integer completion cursor', error
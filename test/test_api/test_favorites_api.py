@@ -113,6 +113,13 @@ class TestFavoritesAPI(TestAPI):
         assert data[0]['fav_user_ids'] == [user.id], data
         assert len(data[0]['fav_user_ids']) == 1, data
 
+        # last_id & desc
+        res = self.app.get(self.url + '?limit=2&desc=1&last_id=%s&api_key=%s' %
+                           (tasks[-1].id, user.api_key))
+        data = json.loads(res.data)
+        assert res.status_code == 200, res.status_code
+        assert [t['id'] for t in data] == [tasks[-2].id, tasks[-3].id], data
+
 
 
     @with_context
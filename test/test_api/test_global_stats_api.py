@@ -19,6 +19,7 @@ import json
 from default import with_context
 from test_api import TestAPI
 from factories import ProjectFactory
+import pybossa.cache.site_stats as stats
 
 
 
@@ -42,3 +43,20 @@ class TestGlobalStatsAPI(TestAPI):
         """Test Global Stats Post works."""
         res = self.app.post('api/globalstats')
         assert res.status_code == 405, res.status_code
+
+    @with_context
+    def test_global_stats_conditional_get(self):
+        """Test Global Stats returns 304 when the stats did not change."""
+        ProjectFactory()
+        res = self.app.get('api/globalstats')
+        etag = res.headers['ETag']
+
+        res = self.app.get('api/globalstats',
+                           headers={'If-None-Match': etag})
+        assert res.status_code == 304, res.status_code
+
+        ProjectFactory()
+        stats.update_snapshot()
+        res = self.app.get('api/globalstats',
+                           headers={'If-None-Match': etag})
+        assert res.status_code == 200, res.status_code
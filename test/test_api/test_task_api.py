@@ -438,6 +438,53 @@ class TestTaskAPI(TestAPI):
         assert len(task['task_runs']) == len(taskruns), task
         assert task['result'] == None, task
 
+    @with_context
+    @patch('pybossa.api.api_base.result_repo.get_last_versions_by_task_ids')
+    @patch('pybossa.api.api_base.task_repo.get_task_runs_by_task_ids')
+    def test_task_query_related_batch(self, get_task_runs, get_results):
+        """ Test API Task query with related loads task runs and results
+        once for the whole listing"""
+        get_task_runs.side_effect = task_repo.get_task_runs_by_task_ids
+        get_results.side_effect = result_repo.get_last_versions_by_task_ids
+        user = UserFactory.create(admin=True)
+        project = ProjectFactory.create(owner=user)
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=2)
+        for task in tasks:
+            TaskRunFactory.create_batch(2, project=project, task=task)
+
+        res = self.app.get('/api/task?related=True&all=1&api_key=' + user.api_key)
+        data = json.loads(res.data)
+
+        assert len(data) == 3, data
+        for task in data:
+            assert len(task['task_runs']) == 2, task
+            assert task['result'] is not None, task
+        assert get_task_runs.call_count == 1, get_task_runs.call_count
+        assert get_results.call_count == 1, get_results.call_count
+
+    @with_context
+    def test_task_stream(self):
+        """ Test API Task stream returns NDJSON and resumes from last_id"""
+        user = UserFactory.create()
+        project = ProjectFactory.create(owner=user)
+        tasks = TaskFactory.create_batch(5, project=project)
+        TaskFactory.create_batch(3)
+
+        res = self.app.get('/api/task/stream')
+        assert res.status_code == 401, res.status_code
+
+        with patch.dict(self.flask_app.config, {'API_STREAM_BATCH_SIZE': 2}):
+            res = self.app.get('/api/task/stream?api_key=' + user.api_key)
+            assert res.mimetype == 'application/x-ndjson', res.mimetype
+            data = [json.loads(line) for line in res.data.splitlines()]
+            assert [t['id'] for t in data] == [t.id for t in tasks], data
+
+            url = '/api/task/stream?last_id=%s&api_key=%s' % (tasks[2].id,
+                                                             user.api_key)
+            res = self.app.get(url)
+            data = [json.loads(line) for line in res.data.splitlines()]
+            assert [t['id'] for t in data] == [t.id for t in tasks[3:]], data
+
     @with_context
     def test_task_query_without_params_with_context(self):
         """ Test API Task query with context"""
@@ -583,6 +583,103 @@ class TestTaskrunAPI(TestAPI):
         tmp = self.app.post(url, data=datajson, headers=headers)
         assert tmp.status_code == 403, tmp.data
 
+    @with_context
+    @patch('pybossa.api.task_run.can_post_tasks')
+    @patch('pybossa.api.task_run.ContributionsGuard')
+    def test_taskrun_bulk_post(self, guard, can_post_tasks):
+        """Test API TaskRun bulk creation reports a status per item"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        guard.return_value.retrieve_timestamps.return_value = [
+            ('now', None)] * 3
+        can_post_tasks.side_effect = lambda p, task_ids, u: [True] * len(task_ids)
+        data = [dict(project_id=project.id, task_id=tasks[0].id, info='a'),
+                dict(project_id=project.id, task_id=tasks[1].id, info='b'),
+                dict(project_id=project.id, task_id=tasks[1].id, info='c'),
+                dict(project_id=project.id, task_id=10000000, info='d')]
+        url = '/api/taskrun/bulk?api_key=%s' % project.owner.api_key
+
+        res = self.app.post(url, data=json.dumps(data))
+        statuses = json.loads(res.data)
+
+        assert res.status_code == 200, res.data
+        assert [s['status'] for s in statuses] == ['ok', 'ok', 'failed',
+                                                   'failed'], statuses
+        assert statuses[2]['exception_cls'] == 'Conflict', statuses
+        assert statuses[3]['exception_msg'] == 'Invalid task_id', statuses
+        taskruns = task_repo.filter_task_runs_by(project_id=project.id)
+        assert sorted(tr.id for tr in taskruns) == sorted(
+            [statuses[0]['id'], statuses[1]['id']]), taskruns
+        for task in tasks:
+            assert task_repo.get_task(task.id).state == 'completed'
+
+        res = self.app.post('/api/taskrun/bulk', data=json.dumps(data))
+        assert res.status_code == 403, res.data
+
+    @with_context
+    @patch('pybossa.api.task_run.can_post_tasks')
+    @patch('pybossa.api.task_run.ContributionsGuard')
+    def test_taskrun_bulk_post_invalid_ids(self, guard, can_post_tasks):
+        """Test API TaskRun bulk creation rejects the items with ids that
+        are not integers"""
+        project = ProjectFactory.create()
+        task = TaskFactory.create(project=project, n_answers=1)
+        guard.return_value.retrieve_timestamps.return_value = [('now', None)]
+        can_post_tasks.side_effect = lambda p, task_ids, u: [True] * len(task_ids)
+        data = [dict(project_id=project.id, task_id=task.id, info='a'),
+                dict(project_id='abc', task_id=task.id, info='b'),
+                dict(project_id=project.id, task_id=[task.id], info='c')]
+        url = '/api/taskrun/bulk?api_key=%s' % project.owner.api_key
+
+        res = self.app.post(url, data=json.dumps(data))
+        statuses = json.loads(res.data)
+
+        assert res.status_code == 200, res.data
+        assert [s['status'] for s in statuses] == ['ok', 'failed',
+                                                   'failed'], statuses
+        for status in statuses[1:]:
+            assert status['status_code'] == 400, status
+            assert status['exception_msg'] == \
+                'task_id and project_id must be integers', status
+
+    @with_context
+    @patch('pybossa.api.task_run.can_post_tasks')
+    @patch('pybossa.api.task_run.ContributionsGuard')
+    def test_taskrun_bulk_post_integrity_error(self, guard, can_post_tasks):
+        """Test API TaskRun bulk creation stores the task runs one by one
+        when the batch breaks a constraint"""
+        from pybossa.core import task_repo as core_task_repo
+        from pybossa.exc import DBIntegrityError
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project, n_answers=1)
+        guard.return_value.retrieve_timestamps.return_value = [
+            ('now', None)] * 2
+        can_post_tasks.side_effect = lambda p, task_ids, u: [True] * len(task_ids)
+        data = [dict(project_id=project.id, task_id=task.id, info='a')
+                for task in tasks]
+        url = '/api/taskrun/bulk?api_key=%s' % project.owner.api_key
+        save = core_task_repo.save
+
+        def save_or_fail(taskrun):
+            if taskrun.task_id == tasks[1].id:
+                raise DBIntegrityError('duplicate key')
+            save(taskrun)
+
+        with patch.object(core_task_repo, 'save_all',
+                          side_effect=DBIntegrityError('duplicate key')):
+            with patch.object(core_task_repo, 'save',
+                              side_effect=save_or_fail):
+                res = self.app.post(url, data=json.dumps(data))
+        statuses = json.loads(res.data)
+
+        assert res.status_code == 200, res.data
+        assert [s['status'] for s in statuses] == ['ok', 'failed'], statuses
+        assert statuses[1]['exception_cls'] == 'DBIntegrityError', statuses
+        taskruns = task_repo.filter_task_runs_by(project_id=project.id)
+        assert [tr.id for tr in taskruns] == [statuses[0]['id']], taskruns
+        assert task_repo.get_task(tasks[0].id).state == 'completed'
+        assert task_repo.get_task(tasks[1].id).state == 'ongoing'
+
     @with_context
     def test_taskrun_post_requires_newtask_first_anonymous(self):
         """Test API TaskRun post fails if task was not previously requested for
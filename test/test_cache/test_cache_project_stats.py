@@ -146,3 +146,20 @@ class TestProjectsStatsCache(Test):
         assert max_hours == 1
         assert max_hours_anon is None
         assert max_hours_auth == 1
+
+    @with_context
+    def test_pop_dirty(self):
+        """Test CACHE PROJECT STATS pop_dirty returns projects with new
+        activity once per interval."""
+        project = ProjectFactory.create()
+        idle_project = ProjectFactory.create()
+        task = TaskFactory.create(project=project)
+
+        assert pop_dirty(10) == [project.id]
+        assert pop_dirty(10) == []
+
+        TaskRunFactory.create(task=task)
+        assert pop_dirty(10) == [], 'refreshed too recently'
+        sentinel.master.delete(REFRESHED_KEY_PREFIX.format(project.id))
+        assert pop_dirty(10) == [project.id]
+        assert not discard_dirty(idle_project.id)
@@ -26,7 +26,8 @@ from pybossa.core import result_repo
 from pybossa.model.project import Project
 from pybossa.cache.project_stats import update_stats
 from nose.tools import nottest
-from pybossa.cache.task_browse_helpers import get_task_filters
+from pybossa.cache.task_browse_helpers import get_task_filters, \
+    parse_tasks_browse_args, get_browse_filters_key, decode_cursor
 
 class TestProjectsCache(Test):
 
@@ -432,6 +433,130 @@ class TestProjectsCache(Test):
         assert cached_tasks[0].get('pct_status') == 1.0, cached_tasks[0].get('pct_status')
 
 
+    @with_context
+    def test_browse_tasks_keyset_pagination(self):
+        """Test CACHE PROJECTS browse_tasks returns the next page after
+        the cursor of the last task"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(5, project=project)
+        args = parse_tasks_browse_args({'order_by': 'task_id desc'})
+        args['records_per_page'] = 2
+
+        count, first_page = cached_projects.browse_tasks(project.id, args)
+        assert count == 5, count
+        assert [t['id'] for t in first_page] == [tasks[4].id, tasks[3].id]
+
+        args = parse_tasks_browse_args({'order_by': 'task_id desc',
+                                        'cursor': first_page[-1]['cursor']})
+        args['records_per_page'] = 2
+        count, second_page = cached_projects.browse_tasks(project.id, args)
+        assert count == 5, count
+        assert [t['id'] for t in second_page] == [tasks[2].id, tasks[1].id]
+
+
+    @with_context
+    def test_browse_tasks_keyset_pagination_ties(self):
+        """Test CACHE PROJECTS browse_tasks keyset pagination breaks ties
+        in the sort fields by task id"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(4, project=project, priority_0=0.5)
+        args = parse_tasks_browse_args({'order_by': 'priority desc'})
+        args['records_per_page'] = 3
+
+        count, first_page = cached_projects.browse_tasks(project.id, args)
+        args['cursor'] = decode_cursor(first_page[-1]['cursor'])
+        count, second_page = cached_projects.browse_tasks(project.id, args)
+
+        ids = [t['id'] for t in first_page + second_page]
+        assert ids == [t.id for t in tasks], ids
+
+
+    @with_context
+    def test_browse_tasks_keyset_pagination_finish_time_nulls(self):
+        """Test CACHE PROJECTS browse_tasks keyset pagination by finish time
+        keeps the tasks without task runs last in ascending order and first
+        in descending order"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(4, project=project)
+        TaskRunFactory.create(task=tasks[1], finish_time='2018-01-02T00:00:00')
+        TaskRunFactory.create(task=tasks[3], finish_time='2018-01-01T00:00:00')
+
+        def browse(order_by):
+            args = parse_tasks_browse_args({'order_by': order_by})
+            args['records_per_page'] = 1
+            ids = []
+            for _ in range(len(tasks)):
+                count, page = cached_projects.browse_tasks(project.id, args)
+                ids += [t['id'] for t in page]
+                args['cursor'] = decode_cursor(page[-1]['cursor'])
+            return ids
+
+        ids = browse('finish_time asc')
+        assert ids == [tasks[3].id, tasks[1].id, tasks[0].id, tasks[2].id], ids
+        ids = browse('finish_time desc')
+        assert ids == [tasks[0].id, tasks[2].id, tasks[1].id, tasks[3].id], ids
+
+
+    @with_context
+    def test_browse_tasks_counts_the_task_runs_of_the_page(self):
+        """Test CACHE PROJECTS browse_tasks counts the task runs of the tasks
+        of a page picked without them"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=2)
+        TaskRunFactory.create_batch(2, task=tasks[0])
+        TaskRunFactory.create(task=tasks[2])
+        args = parse_tasks_browse_args({'order_by': 'task_id desc'})
+        args['records_per_page'] = 2
+        args['offset'] = 1
+
+        count, page = cached_projects.browse_tasks(project.id, args)
+
+        assert [(t['id'], t['n_task_runs']) for t in page] == \
+            [(tasks[1].id, 0), (tasks[0].id, 2)], page
+        assert page[1]['pct_status'] == 1.0, page
+
+
+    @with_context
+    def test_browse_tasks_remembers_the_cursor_of_the_next_page(self):
+        """Test CACHE PROJECTS browse_tasks by offset remembers the cursor of
+        the next page, until the cache of the project is cleaned"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(5, project=project)
+        args = parse_tasks_browse_args({'order_by': 'task_id desc'})
+        args['records_per_page'] = 2
+        args['offset'] = 0
+
+        count, first_page = cached_projects.browse_tasks(project.id, args)
+        cursor = cached_projects.get_page_cursor(project.id, args, 2)
+        assert cursor == decode_cursor(first_page[-1]['cursor']), cursor
+
+        args['offset'] = 2
+        count, second_page = cached_projects.browse_tasks(project.id, args)
+        assert [t['id'] for t in second_page] == [tasks[2].id, tasks[1].id]
+        assert cached_projects.get_page_cursor(project.id, args, 4)
+
+        cached_projects.delete_browse_tasks(project.id)
+        assert cached_projects.get_page_cursor(project.id, args, 2) is None
+
+
+    @with_context
+    def test_n_browse_tasks_counts_filtered_tasks(self):
+        """Test CACHE PROJECTS n_browse_tasks counts only the tasks matching
+        the filters"""
+
+        project = self.create_project_with_tasks(2, 3)
+        filters_key = get_browse_filters_key({'state': 'completed',
+                                              'offset': 10})
+
+        assert cached_projects.n_browse_tasks(project.id, filters_key) == 2
+        assert cached_projects.n_browse_tasks(project.id, '{}') == 5
+
+
     @with_context
     def test_n_featured_returns_nothing(self):
         """Test CACHE PROJECTS _n_featured 0 if there are no featured projects"""
@@ -710,3 +835,15 @@ class TestProjectsCache(Test):
         filters, params = get_task_filters(filters)
         assert filters == expected_filter_query, filters
         assert params == expected_params, params
+
+
+    @with_context
+    def test_task_browse_get_task_filters_equals(self):
+        """Test equals filters use the same expression as the task.info
+        field indexes"""
+        filters = dict(filter_by_field=[(u'CompanyName', u'equals', u'a_b')])
+        expected_filter_query = ' AND (COALESCE(task.info->>\'CompanyName\', \'\') ilike :filter_by_field_0 escape \'\\\')'
+
+        filters, params = get_task_filters(filters)
+        assert filters == expected_filter_query, filters
+        assert params == {'filter_by_field_0': 'a\\_b'}, params
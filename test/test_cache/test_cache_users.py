@@ -524,3 +524,48 @@ class TestUsersCache(Test):
         for field in fields:
             assert field in users[0].keys(), field
         assert len(users[0].keys()) == len(fields)
+
+    @with_context
+    def test_get_users_for_report_reads_user_contributions(self):
+        """Test CACHE USERS get_users_for_report reads the contributions
+        updated as task runs are submitted"""
+        user, other = UserFactory.create_batch(2)
+        project, project2 = ProjectFactory.create_batch(2)
+        TaskRunFactory.create_batch(2, user=user, project=project,
+                                    task=TaskFactory.create(project=project))
+        TaskRunFactory.create(user=user, project=project2,
+                              task=TaskFactory.create(project=project2))
+
+        report = dict((row['id'], row)
+                      for row in cached_users.get_users_for_report())
+
+        assert report[user.id]['completed_tasks'] == 3, report[user.id]
+        assert report[user.id]['total_projects_contributed'] == 2, report
+        assert report[other.id]['completed_tasks'] == 0, report[other.id]
+        assert report[other.id]['first_submission_date'] is None, report
+
+    @with_context
+    def test_user_contributions_follow_deleted_task_runs(self):
+        """Test CACHE USERS contributions are updated when task runs are
+        deleted and rebuilt by the reconciliation job"""
+        from pybossa.core import db, task_repo
+        from pybossa.jobs import rebuild_user_contributions
+        user = UserFactory.create()
+        project = ProjectFactory.create()
+        taskruns = TaskRunFactory.create_batch(
+            2, user=user, project=project,
+            task=TaskFactory.create(project=project))
+
+        task_repo.delete(taskruns[0])
+
+        assert cached_users.n_projects_contributed(user.id) == 1
+        assert cached_users.get_user_summary(user.name)['n_answers'] == 1
+
+        db.session.execute('UPDATE user_contribution SET n_task_runs=7')
+        db.session.commit()
+        rebuild_user_contributions()
+
+        userdata = cached_users.get_project_report_userdata(project.id)
+        assert len(userdata) == 1, userdata
+        assert userdata[0][0] == user.id, userdata
+        assert userdata[0][14] == 1, userdata
@@ -411,3 +411,37 @@ class TestSiteStatsCache(Test):
         assert tasks['series'][0][24] == expected_tasks, "{} tasks created in last 24 months".format(expected_tasks)
         taskruns = stats.submission_chart()
         assert taskruns['series'][0][24] == expected_taskruns, "{} taskruns created in last 24 months".format(expected_taskruns)
+
+    @with_context
+    def test_snapshot_counts_site_stats(self):
+        """Test CACHE SITE STATS snapshot counts the stats in one pass"""
+        category = CategoryFactory.create()
+        project = ProjectFactory.create(category=category, featured=True)
+        ProjectFactory.create(category=category, published=False)
+        task = TaskFactory.create(project=project, n_answers=3)
+        TaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=task)
+
+        site = stats.get_snapshot()['stats']
+
+        assert site['n_auth_users'] == stats.n_auth_users(), site
+        assert site['n_anon_users'] == 1, site
+        assert site['n_tasks'] == 1, site
+        assert site['n_total_tasks'] == 3, site
+        assert site['n_task_runs'] == 2, site
+        assert site['n_published'] == 1, site
+        assert site['n_draft'] == 1, site
+        assert site['n_featured'] == 1, site
+        assert site['categories'] == [[category.short_name, 1]], site
+
+    @with_context
+    def test_snapshot_etag_only_changes_with_the_stats(self):
+        """Test CACHE SITE STATS snapshot etag changes with the stats"""
+        ProjectFactory.create()
+        etag = stats.update_snapshot()['etag']
+
+        assert stats.update_snapshot()['etag'] == etag
+        assert stats.get_snapshot()['etag'] == etag
+
+        ProjectFactory.create()
+        assert stats.update_snapshot()['etag'] != etag
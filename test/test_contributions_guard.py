@@ -157,3 +157,48 @@ class TestContributionsGuard(object):
         self.guard.stamp_presented_time(self.task, self.auth_user)
 
         assert self.guard.retrieve_presented_timestamp(self.task, self.auth_user) == 'now'
+
+    @patch('pybossa.contributions_guard.make_timestamp')
+    def test_stamp_many_stamps_requested_and_presented_times(self, make_timestamp):
+        make_timestamp.return_value = "now"
+        tasks = [Task(id=22), Task(id=23)]
+
+        self.guard.stamp_many(tasks, self.auth_user)
+
+        for task in tasks:
+            stamps = self.guard.retrieve_stamps(task, self.auth_user)
+            assert stamps == ('now', 'now'), stamps
+
+    @patch('pybossa.contributions_guard.make_timestamp')
+    def test_stamp_many_keeps_presented_time_and_extends_expiry(self, make_timestamp):
+        make_timestamp.return_value = "before"
+        key = 'pybossa:task_presented:user:33:task:22'
+        self.guard.stamp_presented_time(self.task, self.auth_user)
+        self.connection.expire(key, 10)
+        make_timestamp.return_value = "now"
+
+        self.guard.stamp_many([self.task], self.auth_user)
+
+        stamps = self.guard.retrieve_stamps(self.task, self.auth_user)
+        assert stamps == ('now', 'before'), stamps
+        assert self.connection.ttl(key) > 10, self.connection.ttl(key)
+
+    @patch('pybossa.contributions_guard.make_timestamp')
+    def test_stamp_many_keeps_presented_time_and_expiry(self, make_timestamp):
+        make_timestamp.return_value = "before"
+        key = 'pybossa:task_presented:user:33:task:22'
+        self.guard.stamp_presented_time(self.task, self.auth_user)
+        self.connection.expire(key, 10)
+        make_timestamp.return_value = "now"
+
+        self.guard.stamp_many([self.task], self.auth_user,
+                              extend_presented=False)
+
+        stamps = self.guard.retrieve_stamps(self.task, self.auth_user)
+        assert stamps == ('now', 'before'), stamps
+        assert self.connection.ttl(key) <= 10, self.connection.ttl(key)
+
+    def test_retrieve_stamps_returns_None_for_non_stamped_task(self):
+        stamps = self.guard.retrieve_stamps(self.task, self.anon_user)
+
+        assert stamps == (None, None), stamps
@@ -164,3 +164,15 @@ class TestImporterPublicMethods(Test):
         assert 'flickr' in importer.get_autoimporter_names()
         assert 'twitter' in importer.get_autoimporter_names()
         assert 'dropbox' not in importer.get_autoimporter_names()
+
+    @with_context
+    def test_deferred_setup_runs_once_on_first_use(self, create):
+        importer = Importer()
+        setup = Mock(side_effect=importer.register_dropbox_importer)
+        importer.defer_setup(setup)
+
+        assert not setup.called
+        assert 'dropbox' in importer.get_all_importer_names()
+        importer.get_autoimporter_names()
+
+        setup.assert_called_once_with()
@@ -0,0 +1,45 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+from mock import MagicMock
+from nose.tools import assert_raises
+from sqlalchemy.exc import ProgrammingError
+
+from default import Test, db, with_context
+from pybossa import job_metrics
+
+
+class TestJobMetrics(Test):
+
+    @with_context
+    def test_failed_statements_leave_no_start_time(self):
+        """Test JOB METRICS the start time of a failed statement is dropped
+        from the connection"""
+        job_metrics.install()
+        metrics = job_metrics.start(MagicMock())
+        conn = db.engine.connect()
+        try:
+            conn.execute('SELECT 1')
+            assert_raises(ProgrammingError, conn.execute,
+                          'SELECT * FROM no_such_table')
+            start_times = conn.info['job_metrics_start']
+        finally:
+            job_metrics._local.metrics = None
+            conn.close()
+
+        assert start_times == {}, start_times
+        assert metrics.sql_count == 1, metrics.sql_count
@@ -71,8 +71,28 @@ class TestJobs(Test):
         get_periodic_jobs.return_value = jobs()
         queue_name = 'low'
         res = enqueue_periodic_jobs(queue_name)
-        expected_jobs = [job for job in jobs() if job['queue'] == queue_name]
-        msg = "%s jobs in %s have been enqueued" % (len(expected_jobs), queue_name)
+        # The two low jobs are the same, so only one is enqueued
+        msg = "1 jobs in low have been enqueued, 1 already pending"
+        assert res == msg, res
+
+        get_periodic_jobs.return_value = jobs()
+        res = enqueue_periodic_jobs(queue_name)
+        msg = "0 jobs in low have been enqueued, 2 already pending"
+        assert res == msg, res
+
+    @with_context
+    @patch('pybossa.jobs.get_periodic_jobs')
+    def test_enqueue_periodic_jobs_full_queue(self, get_periodic_jobs):
+        """Test JOB enqueue_periodic_jobs stops when the queue is full."""
+        get_periodic_jobs.return_value = (
+            dict(name='name', args=[i], kwargs={}, timeout=10, queue='low')
+            for i in range(3))
+        depth = {'low': 2}
+        with patch.dict(self.flask_app.config,
+                        {'PERIODIC_JOBS_MAX_QUEUE_DEPTH': depth}):
+            res = enqueue_periodic_jobs('low')
+        msg = ("2 jobs in low have been enqueued, the rest deferred as the "
+               "queue is full")
         assert res == msg, res
 
     @with_context
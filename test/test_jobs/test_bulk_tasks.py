@@ -0,0 +1,131 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, with_context
+from factories import ProjectFactory, TaskFactory, TaskRunFactory
+from pybossa.jobs import (delete_bulk_tasks, get_bulk_delete_key,
+                          update_bulk_tasks_redundancy,
+                          update_bulk_tasks_priority, get_bulk_progress)
+from pybossa.core import sentinel, task_repo
+from mock import patch
+
+
+@patch('pybossa.jobs.send_mail')
+class TestBulkTasks(Test):
+
+    def _data(self, project, **data):
+        return dict(data, project_id=project.id, project_name=project.name,
+                    curr_user='owner@example.com', coowners=[],
+                    current_user_fullname='Owner', filters={})
+
+    @with_context
+    def test_deletes_tasks_in_chunks(self, send_mail):
+        """Test JOB delete_bulk_tasks deletes every task a chunk at a time"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project)
+        TaskRunFactory.create(task=tasks[0])
+        data = self._data(project, force_reset=True)
+
+        with patch.dict(self.flask_app.config, {'BULK_DELETE_CHUNK_SIZE': 2,
+                                                'BULK_DELETE_SLEEP': 0}):
+            with patch('pybossa.jobs.task_repo.delete_tasks_chunk',
+                       wraps=task_repo.delete_tasks_chunk) as delete_chunk:
+                delete_bulk_tasks(data)
+
+        assert delete_chunk.call_count == 3, delete_chunk.call_count
+        assert task_repo.filter_tasks_by(project_id=data['project_id']) == []
+        assert task_repo.filter_task_runs_by(
+            project_id=data['project_id']) == []
+        assert not sentinel.master.exists(get_bulk_delete_key(data))
+        assert send_mail.call_count == 1, send_mail.call_count
+        assert 'deleted from project' in send_mail.call_args[0][0]['body']
+
+    @with_context
+    def test_resumes_from_checkpoint(self, send_mail):
+        """Test JOB delete_bulk_tasks resumes after the checkpointed task"""
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project)
+        kept_id = tasks[0].id
+        data = self._data(project, force_reset=True)
+        sentinel.master.hmset(get_bulk_delete_key(data),
+                              dict(last_id=kept_id, n_deleted=0))
+
+        with patch.dict(self.flask_app.config, {'BULK_DELETE_SLEEP': 0}):
+            delete_bulk_tasks(data)
+
+        remaining = task_repo.filter_tasks_by(project_id=data['project_id'])
+        assert [task.id for task in remaining] == [kept_id], remaining
+
+    @with_context
+    def test_waits_for_lagging_replicas(self, send_mail):
+        """Test JOB delete_bulk_tasks waits while the replicas lag"""
+        project = ProjectFactory.create()
+        TaskFactory.create(project=project)
+        data = self._data(project, force_reset=True)
+
+        with patch.dict(self.flask_app.config, {'BULK_DELETE_MAX_LAG': 10}):
+            with patch('pybossa.jobs.time.sleep') as sleep:
+                with patch('pybossa.core.db.replicas.get_max_lag',
+                           side_effect=[30, 5]):
+                    delete_bulk_tasks(data)
+
+        assert sleep.call_count == 2, sleep.call_count
+
+    @with_context
+    def test_update_redundancy(self, send_mail):
+        """Test JOB update_bulk_tasks_redundancy updates every task"""
+        project = ProjectFactory.create()
+        TaskFactory.create_batch(3, project=project, n_answers=1)
+        data = self._data(project, n_answers=3)
+
+        with patch.dict(self.flask_app.config, {'TASK_UPDATE_BATCH_SIZE': 2}):
+            update_bulk_tasks_redundancy(data)
+
+        tasks = task_repo.filter_tasks_by(project_id=data['project_id'])
+        assert [task.n_answers for task in tasks] == [3, 3, 3], tasks
+        assert send_mail.call_count == 1, send_mail.call_count
+        assert 'updated to 3' in send_mail.call_args[0][0]['body']
+
+    @with_context
+    def test_update_priority(self, send_mail):
+        """Test JOB update_bulk_tasks_priority updates every task"""
+        project = ProjectFactory.create()
+        TaskFactory.create_batch(2, project=project, priority_0=0)
+        data = self._data(project, priority_0=0.8)
+
+        update_bulk_tasks_priority(data)
+
+        tasks = task_repo.filter_tasks_by(project_id=data['project_id'])
+        assert [task.priority_0 for task in tasks] == [0.8, 0.8], tasks
+        assert send_mail.call_count == 1, send_mail.call_count
+
+    @with_context
+    @patch('pybossa.jobs.time.time')
+    def test_progress_is_throttled(self, time, send_mail):
+        """Test JOB bulk progress is emailed at most every interval"""
+        time.side_effect = [0, 5, 20, 30]
+        progress = get_bulk_progress(['owner@example.com'], 'Update', 100,
+                                     'have been updated so far', 10)
+
+        progress(10, 10)
+        progress(50, 40)
+        progress(60, 50)
+
+        assert send_mail.call_count == 1, send_mail.call_count
+        body = send_mail.call_args[0][0]['body']
+        assert '40 tasks have been updated so far, about 50%' in body, body
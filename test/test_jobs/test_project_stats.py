@@ -18,6 +18,7 @@
 
 from pybossa.jobs import get_project_jobs, create_dict_jobs, get_project_stats
 from pybossa.jobs import warm_cache
+from pybossa.cache.project_stats import pop_dirty
 from default import Test, with_context
 from factories import ProjectFactory
 from factories import UserFactory
@@ -75,7 +76,9 @@ class TestProjectsStats(Test):
     def test_get_project_jobs_for_non_pro_users(self):
         """Test JOB get project jobs works for non pro users."""
         owner = UserFactory.create(pro=False)
+        project = ProjectFactory.create(owner=owner)
         ProjectFactory.create(owner=owner)
+        TaskFactory.create(project=project)
         jobs_generator = get_project_jobs('high')
         jobs = []
         for job in jobs_generator:
@@ -83,6 +86,42 @@ class TestProjectsStats(Test):
 
         err_msg = "There should be only 1 jobs"
         assert len(jobs) == 1, err_msg
+        assert jobs[0]['args'] == [project.id, project.short_name], jobs
+
+        err_msg = "Idle projects should not be refreshed"
+        assert list(get_project_jobs('high')) == [], err_msg
+
+    @with_context
+    def test_get_project_jobs_restores_undelivered_projects(self):
+        """Test JOB get project jobs puts back the projects whose jobs were
+        not taken."""
+        projects = ProjectFactory.create_batch(2)
+        for project in projects:
+            TaskFactory.create(project=project)
+        project_ids = sorted(project.id for project in projects)
+
+        jobs_generator = get_project_jobs('high')
+        next(jobs_generator)
+        jobs_generator.close()
+
+        assert sorted(pop_dirty(10)) == project_ids
+
+    @with_context
+    def test_get_project_jobs_restores_coalesced_projects(self):
+        """Test JOB get project jobs puts back the projects whose job was
+        coalesced with a pending one."""
+        projects = ProjectFactory.create_batch(2)
+        for project in projects:
+            TaskFactory.create(project=project)
+
+        jobs = []
+        for job in get_project_jobs('high'):
+            if job['args'][0] == projects[0].id:
+                job['coalesced'] = True
+            jobs.append(job)
+
+        assert len(jobs) == 2, jobs
+        assert pop_dirty(10) == [projects[0].id]
 
     @with_context
     def test_warm_project(self):
@@ -0,0 +1,53 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, with_context
+from factories import ProjectFactory
+from pybossa.jobs import sync_task_info_indexes
+from mock import patch
+
+
+class TestSyncTaskInfoIndexes(Test):
+
+    @with_context
+    @patch('pybossa.jobs.task_repo')
+    def test_creates_missing_indexes(self, task_repo):
+        """Test JOB sync_task_info_indexes creates the indexes of the
+        fields marked as indexed"""
+        project = ProjectFactory.create(info={'indexed_fields': ['a', 'b']})
+        task_repo.get_info_field_indexes.return_value = {'a': 'idx_a'}
+
+        sync_task_info_indexes(project.id)
+
+        task_repo.create_info_field_index.assert_called_once_with(
+            project.id, 'b')
+        assert not task_repo.drop_info_field_index.called
+
+    @with_context
+    @patch('pybossa.jobs.task_repo')
+    def test_drops_stale_indexes(self, task_repo):
+        """Test JOB sync_task_info_indexes drops the indexes of the fields
+        no longer marked as indexed"""
+        project = ProjectFactory.create(info={'indexed_fields': ['a']})
+        task_repo.get_info_field_indexes.return_value = {'a': 'idx_a',
+                                                         'c': 'idx_c'}
+
+        sync_task_info_indexes(project.id)
+
+        task_repo.drop_info_field_index.assert_called_once_with('idx_c')
+        assert not task_repo.create_info_field_index.called
@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading
+import time
 from default import Test, with_context
 from factories import TaskFactory, TaskRunFactory
 from mock import patch, MagicMock
@@ -24,6 +26,7 @@ from pybossa.model.counter import Counter
 from pybossa.model.event_listeners import *
 from pybossa.jobs import notify_blog_users
 from sqlalchemy import func
+from sqlalchemy.sql import text
 
 
 """Tests for model event listeners."""
@@ -282,3 +285,59 @@ class TestModelEventListeners(Test):
         assert len(counters) == 1, counters
         counter = counters[0]
         assert counter[2] == 0, counter
+
+    @with_context
+    def test_taskrun_submit_locks_the_project_before_the_sequence(self):
+        """Test a task run insert locks the project row before the change
+        sequence of the project, like the other writes do"""
+        from sqlalchemy.exc import OperationalError
+        from sqlalchemy.orm import Session
+        from pybossa.model.task_run import TaskRun
+        task = TaskFactory.create(n_answers=1)
+        project_id, task_id = task.project_id, task.id
+        db.session.commit()
+        holder = db.engine.connect()
+        checker = db.engine.connect()
+        errors = []
+
+        def submit():
+            with self.flask_app.app_context():
+                session = Session(bind=db.engine)
+                try:
+                    session.add(TaskRun(project_id=project_id, task_id=task_id,
+                                        user_ip='127.0.0.1', info='yes'))
+                    session.commit()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    session.close()
+
+        try:
+            holder_transaction = holder.begin()
+            holder.execute(text('''SELECT seq FROM change_sequence
+                                WHERE project_id=:project_id FOR UPDATE'''),
+                           project_id=project_id)
+            writer = threading.Thread(target=submit)
+            writer.start()
+            for _ in range(100):
+                if checker.scalar('SELECT COUNT(*) FROM pg_locks '
+                                  'WHERE NOT granted'):
+                    break
+                time.sleep(0.1)
+            project_locked = False
+            try:
+                with checker.begin():
+                    checker.execute(text('''SELECT id FROM project
+                                         WHERE id=:project_id
+                                         FOR NO KEY UPDATE NOWAIT'''),
+                                    project_id=project_id)
+            except OperationalError:
+                project_locked = True
+            holder_transaction.rollback()
+            writer.join(10)
+        finally:
+            holder.close()
+            checker.close()
+
+        assert project_locked
+        assert errors == [], errors
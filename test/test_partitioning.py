@@ -0,0 +1,130 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+from mock import MagicMock, patch
+from nose.plugins.skip import SkipTest
+from sqlalchemy.sql import text
+
+from default import Test, db, with_context
+from factories import ProjectFactory, TaskFactory, TaskRunFactory
+from pybossa import partitioning
+
+
+class TestPartitioning(Test):
+
+    @with_context
+    def test_unpartitioned_task_run(self):
+        """Test PARTITIONING an unpartitioned task_run has no partitions"""
+        taskrun = TaskRunFactory.create()
+
+        assert partitioning.is_partitioned(db.session) is False
+        assert partitioning.get_project_partition(
+            db.session, taskrun.project_id) is None
+        assert partitioning.truncate_project_partition(
+            db.session, taskrun.project_id) is False
+        assert partitioning.drop_project_partition(
+            db.session, taskrun.project_id) is None
+
+    def count(self, conn, table, project_id):
+        sql = text('SELECT COUNT(*) FROM {0} WHERE project_id=:project_id'
+                   .format(table))
+        return conn.execute(sql, dict(project_id=project_id)).scalar()
+
+    @with_context
+    def test_partition_task_runs_and_move_a_project(self):
+        """Test PARTITIONING converts task_run online and moves the task runs
+        of a project to a partition of its own"""
+        version = db.session.execute('SHOW server_version_num').scalar()
+        if int(version) < 110000:
+            raise SkipTest('Partitioning task_run requires PostgreSQL 11')
+        task = TaskFactory.create()
+        other_task = TaskFactory.create()
+        project_id = task.project_id
+        other_id = other_task.project_id
+        TaskRunFactory.create_batch(3, task=task)
+        TaskRunFactory.create(task=other_task)
+        db.session.commit()
+        conn = db.engine.connect()
+        try:
+            partitioning.prepare(conn)
+            # Mirrored by the trigger while the backfill runs
+            TaskRunFactory.create(task=task)
+            db.session.commit()
+            partitioning.backfill(conn, batch_size=2)
+            partitioning.swap(conn)
+
+            assert partitioning.is_partitioned(conn) is True
+            assert self.count(conn, 'task_run', project_id) == 4
+            assert self.count(conn, 'task_run', other_id) == 1
+
+            name = partitioning.add_project_partition(conn, project_id)
+
+            assert partitioning.get_project_partition(
+                conn, project_id) == name
+            assert self.count(conn, name, project_id) == 4
+            assert self.count(conn, partitioning.DEFAULT_PARTITION,
+                              project_id) == 0
+            TaskRunFactory.create(task=task)
+            db.session.commit()
+            assert self.count(conn, name, project_id) == 5
+
+            with conn.begin():
+                partitioning.truncate_project_partition(conn, project_id)
+            assert self.count(conn, 'task_run', project_id) == 0
+            assert self.count(conn, 'task_run', other_id) == 1
+        finally:
+            conn.execute(text('DROP TABLE IF EXISTS {0} CASCADE'
+                              .format(partitioning.OLD_TABLE)))
+            conn.close()
+
+    @patch('pybossa.partitioning.get_project_partition')
+    def test_drop_project_partition(self, get_partition):
+        """Test PARTITIONING detaches and drops the partition of a project"""
+        get_partition.return_value = 'task_run_p7'
+        conn = MagicMock()
+
+        assert partitioning.drop_project_partition(conn, 7) == 'task_run_p7'
+        statements = [str(call[0][0]) for call in conn.execute.call_args_list]
+        assert statements == [
+            'ALTER TABLE task_run DETACH PARTITION task_run_p7',
+            'DROP TABLE task_run_p7'], statements
+
+    @patch('pybossa.partitioning.get_project_partition')
+    def test_detach_project_partition(self, get_partition):
+        """Test PARTITIONING can detach a partition without dropping it"""
+        get_partition.return_value = 'task_run_p7'
+        conn = MagicMock()
+
+        partitioning.drop_project_partition(conn, 7, detach_only=True)
+        statements = [str(call[0][0]) for call in conn.execute.call_args_list]
+        assert statements == [
+            'ALTER TABLE task_run DETACH PARTITION task_run_p7'], statements
+
+    @with_context
+    def test_delete_project_truncates_its_partition(self):
+        """Test PARTITIONING deleting a project truncates its partition,
+        without detaching it"""
+        from pybossa.core import project_repo
+        project = ProjectFactory.create()
+        project_id = project.id
+
+        with patch('pybossa.repositories.project_repository.partitioning') \
+                as partitioning_mock:
+            project_repo.delete(project)
+        partitioning_mock.truncate_project_partition.assert_called_once_with(
+            db.session, project_id)
+        assert not partitioning_mock.drop_project_partition.called
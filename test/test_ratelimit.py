@@ -27,6 +27,7 @@ import json
 from default import flask_app, sentinel, with_context, rebuild_db
 from factories import ProjectFactory, UserFactory
 from mock import patch
+from pybossa.ratelimit import _local_tokens, _reserve
 
 
 class TestAPI(object):
@@ -35,6 +36,7 @@ class TestAPI(object):
 
     def setUp(self):
         sentinel.master.flushall()
+        _local_tokens.clear()
 
     limit = flask_app.config.get('LIMIT')
 
@@ -154,3 +156,42 @@ class TestAPI(object):
             for user in users:
                 _url = url % user.api_key
                 self.check_limit(_url, action, 'project')
+
+    @patch('pybossa.api.api_base.APIBase._db_query')
+    def test_07_project_get_local_batch(self, mock):
+        """Test API.project GET rate limit with hits reserved in batches."""
+        mock.return_value = {}
+        url = '/api/project'
+        config = {'RATE_LIMIT_LOCAL_BATCH': 5,
+                  'RATE_LIMIT_LOCAL_MAX_AGE': 60}
+        with patch.dict(flask_app.config, config):
+            with patch('pybossa.ratelimit._reserve',
+                       wraps=_reserve) as reserve:
+                self.check_limit(url, 'get', 'project')
+        assert reserve.call_count == self.limit / 5, reserve.call_count
+
+    @patch('pybossa.api.api_base.APIBase._db_query')
+    def test_08_sliding_window(self, mock):
+        """Test API.project GET rate limit frees hits as they leave the
+        window."""
+        mock.return_value = {}
+        url = '/api/project'
+        with patch('pybossa.ratelimit._now') as now:
+            now.return_value = 1000.0
+            res = self.app.get(url)
+            assert res.headers['X-RateLimit-Remaining'] == str(self.limit - 1)
+            now.return_value = 1000.0 + flask_app.config.get('PER') / 2
+            res = self.app.get(url)
+            assert res.headers['X-RateLimit-Remaining'] == str(self.limit - 2)
+            now.return_value = 1001.0 + flask_app.config.get('PER')
+            res = self.app.get(url)
+            assert res.headers['X-RateLimit-Remaining'] == str(self.limit - 2)
+
+    def test_09_sliding_window_script_is_loaded_on_demand(self):
+        """Test rate limit sends its script when the master does not know
+        it, e.g. after a restart or a failover."""
+        sentinel.master.script_flush()
+        count, granted, _ = _reserve('pybossa:test:ratelimit', 10, 60, 3)
+        assert (count, granted) == (3, 3), (count, granted)
+        count, granted, _ = _reserve('pybossa:test:ratelimit', 10, 60, 3)
+        assert (count, granted) == (6, 3), (count, granted)
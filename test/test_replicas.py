@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+from mock import MagicMock
+
+from default import Test, db, flask_app, with_context
+from pybossa.replicas import ReplicaRouter, _pin_on_write
+
+
+def set_lag(replica, lag, server_version=(11, 2)):
+    conn = replica.get_bind.return_value.connect.return_value.__enter__\
+        .return_value
+    conn.dialect.server_version_info = server_version
+    conn.execute.return_value.scalar.return_value = lag
+    return conn
+
+
+class TestReplicaRouter(Test):
+
+    def setUp(self):
+        super(TestReplicaRouter, self).setUp()
+        self.replica = MagicMock()
+        self.router = ReplicaRouter(db=db)
+        self.router.replicas = [('slave', self.replica)]
+
+    @with_context
+    def test_reads_from_replica_in_get_requests(self):
+        """Test REPLICAS GET requests read from the replica"""
+        with flask_app.test_request_context('/', method='GET'):
+            assert self.router.session() is self.replica
+
+    @with_context
+    def test_reads_from_primary_in_other_requests(self):
+        """Test REPLICAS POST requests and jobs read from the primary"""
+        with flask_app.test_request_context('/', method='POST'):
+            assert self.router.session() is db.session
+        assert self.router.session() is db.session
+
+    @with_context
+    def test_reads_from_primary_after_a_write(self):
+        """Test REPLICAS requests read their own writes"""
+        with flask_app.test_request_context('/', method='GET'):
+            _pin_on_write(None, None, 'SELECT 1', {}, None, False)
+            assert self.router.session() is self.replica
+            _pin_on_write(None, None, 'UPDATE task SET priority_0=1', {},
+                          None, False)
+            assert self.router.session() is db.session
+
+    @with_context
+    def test_chooses_least_lagged_replica(self):
+        """Test REPLICAS the least lagged replica below the max lag is used"""
+        other = MagicMock()
+        self.router.replicas.append(('replica2', other))
+        self.router.max_lag = 10
+        set_lag(self.replica, 5)
+        set_lag(other, 1)
+        with flask_app.test_request_context('/', method='GET'):
+            assert self.router.session() is other
+
+        self.router._checked = 0
+        other.get_bind.side_effect = Exception('down')
+        with flask_app.test_request_context('/', method='GET'):
+            assert self.router.session() is self.replica
+
+        self.router._checked = 0
+        set_lag(self.replica, 60)
+        with flask_app.test_request_context('/', method='GET'):
+            assert self.router.session() is db.session
+
+    @with_context
+    def test_max_lag_is_read_on_a_connection_closed_after(self):
+        """Test REPLICAS the lag is read on a connection of its own, so that
+        no transaction is left open on the replica"""
+        set_lag(self.replica, 3)
+
+        assert self.router.get_max_lag() == 3
+        connection = self.replica.get_bind.return_value.connect.return_value
+        assert connection.__exit__.called
+        assert not self.replica.execute.called
+
+    @with_context
+    def test_max_lag_of_a_replica_that_cant_be_read(self):
+        """Test REPLICAS a replica whose lag can't be read counts as lagging,
+        so that bulk jobs wait for it"""
+        self.replica.get_bind.side_effect = Exception('down')
+
+        assert self.router.get_max_lag() == float('inf')
+
+    @with_context
+    def test_lag_is_read_before_postgresql_10(self):
+        """Test REPLICAS the lag is read with the xlog functions before
+        PostgreSQL 10"""
+        conn = set_lag(self.replica, 2, server_version=(9, 5, 14))
+
+        assert self.router.get_max_lag() == 2
+        sql = str(conn.execute.call_args[0][0])
+        assert 'pg_last_xlog_receive_location' in sql, sql
+        assert 'pg_last_wal_receive_lsn' not in sql, sql
@@ -17,13 +17,18 @@
 # along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
 # Cache global variables for timeouts
 
+import threading
+
 from default import Test, db, with_context
 from mock import patch
 from nose.tools import assert_raises
 from factories import TaskFactory, TaskRunFactory, ProjectFactory
 from pybossa.repositories import TaskRepository, ProjectRepository
 from pybossa.exc import WrongObjectError, DBIntegrityError
+from pybossa.model import task_completion
 from pybossa.model.task import Task
+from pybossa.model.result import Result
+from sqlalchemy import text
 
 project_repo = ProjectRepository(db)
 
@@ -152,6 +157,55 @@ class TestTaskRepositoryForTaskQueries(Test):
         assert res[0][0].info['bar'] == text, res[0]
 
 
+    @with_context
+    def test_handle_info_json_fulltextsearch_uses_info_tsv(self):
+        """Test handle info fulltextsearch uses the info_tsv of a project"""
+        task = TaskFactory.create(info={'foo': 'bar word', 'extra': 'agent'})
+        TaskFactory.create(project=task.project, info={'foo': 'agent'})
+        project_id = task.project_id
+
+        assert self.task_repo.get_text_search_settings(
+            Task, project_id, '1') == ('english', True)
+        tsv = db.session.query(Task.info_tsv).filter_by(id=task.id).scalar()
+        assert "'agent'" in tsv and "'word'" in tsv, tsv
+
+        res = self.task_repo.filter_tasks_by(info='foo::agent',
+                                             fulltextsearch='1',
+                                             project_id=project_id)
+        assert [row[0].info['foo'] for row in res] == ['agent'], res
+        res = self.task_repo.filter_tasks_by(info='foo::!agent',
+                                             fulltextsearch='1',
+                                             project_id=project_id)
+        assert [row[0].info['foo'] for row in res] == ['bar word'], res
+
+    @with_context
+    def test_update_info_tsv_builds_missing_vectors(self):
+        """Test update_info_tsv builds the search vectors of a project"""
+        task = TaskFactory.create(info={'foo': 'agent'})
+        project_id = task.project_id
+        db.session.execute(text('''UPDATE task SET info_tsv = NULL'''))
+        db.session.commit()
+
+        assert self.task_repo.get_projects_without_info_tsv() == [project_id]
+        assert self.task_repo.get_text_search_settings(
+            Task, project_id, '1') == ('english', False)
+        assert self.task_repo.update_info_tsv(project_id) == 1
+        assert self.task_repo.get_projects_without_info_tsv() == []
+        assert self.task_repo.update_info_tsv(project_id, rebuild=True) == 1
+
+    @with_context
+    def test_text_search_language_of_project(self):
+        """Test the info_tsv of a project uses its text search language"""
+        project = ProjectFactory.create(
+            info={'text_search_language': 'simple'})
+        task = TaskFactory.create(project=project, info={'foo': 'The cats'})
+
+        assert self.task_repo.get_text_search_settings(
+            Task, project.id, '1') == ('simple', True)
+        tsv = db.session.query(Task.info_tsv).filter_by(id=task.id).scalar()
+        assert tsv == "'cats':2 'the':1", tsv
+
+
     @with_context
     def test_handle_info_json_multiple_keys_404(self):
         """Test handle info in JSON with multiple keys not found works."""
@@ -346,6 +400,66 @@ class TestTaskRepositoryForTaskQueries(Test):
         assert count == 1, count
 
 
+    @with_context
+    def test_get_completions_since_waits_for_lower_ids(self):
+        """Test get_completions_since does not return a completion while one
+        with a lower id is still being committed"""
+        task_ids = [task.id for task in TaskFactory.create_batch(2)]
+        db.session.commit()
+        first = db.engine.connect()
+        second = db.engine.connect()
+        results = []
+
+        def tail():
+            with self.flask_app.app_context():
+                results.extend(task.id for _, task in
+                               self.task_repo.get_completions_since(0))
+
+        try:
+            first_transaction = first.begin()
+            task_completion.complete_tasks(first, 'task.id=:task_id',
+                                           task_id=task_ids[0])
+            with second.begin():
+                task_completion.complete_tasks(second, 'task.id=:task_id',
+                                               task_id=task_ids[1])
+            reader = threading.Thread(target=tail)
+            reader.start()
+            reader.join(1)
+            assert reader.is_alive()
+            first_transaction.commit()
+            reader.join(10)
+        finally:
+            first.close()
+            second.close()
+
+        assert results == task_ids, results
+
+    @with_context
+    def test_get_completions_since_of_a_project_only_waits_for_it(self):
+        """Test get_completions_since of a project does not wait for the
+        completions of other projects in flight"""
+        task = TaskFactory.create()
+        other = TaskFactory.create()
+        project_id = task.project_id
+        db.session.commit()
+        conn = db.engine.connect()
+
+        try:
+            with conn.begin():
+                task_completion.complete_tasks(conn, 'task.id=:task_id',
+                                               task_id=task.id)
+            transaction = conn.begin()
+            task_completion.complete_tasks(conn, 'task.id=:task_id',
+                                           task_id=other.id)
+            completions = self.task_repo.get_completions_since(
+                0, project_id=project_id)
+            transaction.rollback()
+        finally:
+            conn.close()
+
+        assert [t.id for _, t in completions] == [task.id], completions
+
+
 
 class TestTaskRepositoryForTaskrunQueries(Test):
 
@@ -761,6 +875,86 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
         assert non_deleted[0].id == taskrun.id, err_msg
 
 
+    @with_context
+    def test_delete_tasks_chunk_deletes_in_id_order(self):
+        """Test delete_tasks_chunk deletes a chunk of tasks per call"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project)
+        TaskRunFactory.create(task=tasks[0])
+        project_id = project.id
+        task_ids = [task.id for task in tasks]
+
+        assert self.task_repo.delete_tasks_chunk(
+            project_id, 0, 2, force_reset=True) == (2, task_ids[1])
+        remaining = self.task_repo.filter_tasks_by(project_id=project_id)
+        assert [task.id for task in remaining] == [task_ids[2]], remaining
+        assert self.task_repo.filter_task_runs_by(project_id=project_id) == []
+
+        assert self.task_repo.delete_tasks_chunk(
+            project_id, task_ids[1], 2, force_reset=True) == (1, task_ids[2])
+        assert self.task_repo.delete_tasks_chunk(
+            project_id, task_ids[2], 2, force_reset=True) == (0, None)
+
+
+    @with_context
+    def test_delete_tasks_chunk_keeps_tasks_with_results(self):
+        """Test delete_tasks_chunk without force_reset keeps tasks with results"""
+
+        task = TaskFactory.create(n_answers=1)
+        project_id = task.project_id
+        task_id = task.id
+        TaskRunFactory.create(task=task)
+        task2 = TaskFactory.create(project=task.project)
+
+        assert self.task_repo.delete_tasks_chunk(
+            project_id, 0, 10) == (1, task2.id)
+        remaining = self.task_repo.filter_tasks_by(project_id=project_id)
+        assert [task.id for task in remaining] == [task_id], remaining
+
+
+    @with_context
+    def test_delete_task_by_id_removes_its_contributions(self):
+        """Test delete_task_by_id takes its task runs off the contributions of
+        their users, without recomputing the whole project"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(2, project=project)
+        taskrun = TaskRunFactory.create(task=tasks[0])
+        TaskRunFactory.create(task=tasks[1], user=taskrun.user)
+        user_id = taskrun.user_id
+        sql = text('''SELECT n_task_runs FROM user_contribution
+                   WHERE user_id=:user_id AND project_id=:project_id''')
+
+        with patch('pybossa.repositories.task_repository.user_contribution'
+                   '.rebuild') as rebuild:
+            self.task_repo.delete_task_by_id(project.id, tasks[0].id)
+
+        assert not rebuild.called
+        n_task_runs = db.session.execute(
+            sql, dict(user_id=user_id, project_id=project.id)).scalar()
+        assert n_task_runs == 1, n_task_runs
+
+
+    @with_context
+    def test_delete_tasks_chunk_rolls_back_on_error(self):
+        """Test delete_tasks_chunk rolls back a failed chunk, so the next one
+        can run on the same session"""
+
+        task = TaskFactory.create()
+        project_id = task.project_id
+        task_id = task.id
+
+        with patch.object(db.bulkdel_session, 'commit',
+                          side_effect=Exception('failed')):
+            assert_raises(Exception, self.task_repo.delete_tasks_chunk,
+                          project_id, 0, 10, force_reset=True)
+        assert self.task_repo.get_task(task_id) is not None
+
+        assert self.task_repo.delete_tasks_chunk(
+            project_id, 0, 10, force_reset=True) == (1, task_id)
+
+
     @with_context
     def test_delete_taskruns_from_project_deletes_taskruns(self):
         task = TaskFactory.create()
@@ -829,3 +1023,46 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
 
         for task in tasks:
             assert task.state == 'completed', task.state
+
+
+    @with_context
+    def test_update_tasks_redundancy_in_batches(self):
+        """Test update_tasks_redundancy updates and completes the tasks a
+        batch at a time"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, n_answers=2)
+        TaskRunFactory.create(task=tasks[2])
+        progress = []
+
+        with patch.dict(self.flask_app.config, {'TASK_UPDATE_BATCH_SIZE': 2}):
+            self.task_repo.update_tasks_redundancy(
+                project, 1, progress=lambda *args: progress.append(args))
+        tasks = sorted(self.task_repo.filter_tasks_by(project_id=project.id),
+                       key=lambda task: task.id)
+
+        assert progress == [(2, 2), (3, 3)], progress
+        assert [task.n_answers for task in tasks] == [1, 1, 1]
+        assert [task.state for task in tasks] == ['ongoing', 'ongoing',
+                                                  'completed']
+        results = db.session.query(Result).filter_by(project_id=project.id)
+        assert [result.task_id for result in results] == [tasks[2].id]
+
+
+    @with_context
+    def test_update_priority_in_batches(self):
+        """Test update_priority updates the filtered tasks a batch at a time"""
+
+        project = ProjectFactory.create()
+        tasks = TaskFactory.create_batch(3, project=project, priority_0=0)
+        progress = []
+
+        with patch.dict(self.flask_app.config, {'TASK_UPDATE_BATCH_SIZE': 2}):
+            self.task_repo.update_priority(
+                project.id, 0.5, dict(task_id=tasks[2].id),
+                progress=lambda *args: progress.append(args))
+        tasks = sorted(self.task_repo.filter_tasks_by(project_id=project.id),
+                       key=lambda task: task.id)
+
+        assert progress == [(2, 0), (3, 1)], progress
+        assert [task.priority_0 for task in tasks] == [0, 0, 0.5]
@@ -18,6 +18,8 @@
 # Cache global variables for timeouts
 
 from default import Test, db, with_context
+from mock import patch
+from sqlalchemy.orm.session import object_session
 from nose.tools import assert_raises
 from factories import UserFactory, TaskRunFactory
 from pybossa.repositories import UserRepository, TaskRepository
@@ -33,6 +35,29 @@ class TestUserRepository(Test):
         self.task_repo = TaskRepository(db)
 
 
+    @with_context
+    def test_save_and_delete_users_read_from_a_replica(self):
+        """Test save and delete write the users read from a replica session
+        to the primary one"""
+        user, other = UserFactory.create_batch(2)
+        replica = db.create_scoped_session(options=dict(bind=db.engine,
+                                                        autoflush=False))
+        try:
+            with patch.object(db.replicas, 'replicas', [('slave', replica)]):
+                with self.flask_app.test_request_context('/', method='GET'):
+                    read = self.user_repo.get(user.id)
+                    assert object_session(read) is replica(), read
+                    read.info = dict(twitter_token='token')
+                    self.user_repo.save(read)
+                    self.user_repo.delete(self.user_repo.get(other.id))
+        finally:
+            replica.remove()
+
+        db.session.expire_all()
+        assert self.user_repo.get(user.id).info == dict(
+            twitter_token='token')
+        assert self.user_repo.get(other.id) is None
+
     @with_context
     def test_get_return_none_if_no_user(self):
         """Test get method returns None if there is no user with the
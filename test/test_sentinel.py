@@ -0,0 +1,107 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+from mock import patch, MagicMock
+from nose.tools import assert_raises
+from redis.exceptions import ConnectionError, ResponseError
+
+from pybossa import job_metrics
+from pybossa.sentinel import RetryingStrictRedis
+
+
+class TestRetryingStrictRedis(object):
+
+    def setUp(self):
+        self.pool = MagicMock()
+        self.connection = self.pool.get_connection.return_value
+        self.conn = RetryingStrictRedis(connection_pool=self.pool)
+        self.conn.retry_backoff = 0
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_retries_reads_on_connection_error(self, parse_response):
+        """Test SENTINEL reads are retried when the connection fails, on a
+        fresh connection and without dropping the rest of the pool"""
+        parse_response.side_effect = [ConnectionError(), 'PONG']
+
+        assert self.conn.ping() == 'PONG'
+        assert self.connection.send_command.call_count == 2
+        self.connection.disconnect.assert_called_once_with()
+        assert not self.pool.disconnect.called
+        assert self.pool.release.call_count == 2
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_does_not_resend_writes_on_connection_error(self,
+                                                        parse_response):
+        """Test SENTINEL writes are not sent again when the connection
+        fails, as they may have run already"""
+        parse_response.side_effect = ConnectionError()
+
+        assert_raises(ConnectionError, self.conn.incr, 'key')
+        assert self.connection.send_command.call_count == 1
+        self.connection.disconnect.assert_called_once_with()
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_retries_on_demoted_master(self, parse_response):
+        """Test SENTINEL commands are retried when the master is demoted"""
+        parse_response.side_effect = [
+            ResponseError("READONLY You can't write against a read only "
+                          "slave."), 1]
+
+        assert self.conn.incr('key') == 1
+        assert self.connection.send_command.call_count == 2
+        self.connection.disconnect.assert_called_once_with()
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_gives_up_after_retry_attempts(self, parse_response):
+        """Test SENTINEL commands fail after the configured attempts"""
+        parse_response.side_effect = ConnectionError()
+        self.conn.retry_attempts = 2
+
+        assert_raises(ConnectionError, self.conn.ping)
+        assert self.connection.send_command.call_count == 3
+
+    def test_does_not_retry_exhausted_pool(self):
+        """Test SENTINEL commands are not retried when the pool has no
+        connection available"""
+        self.pool.get_connection.side_effect = ConnectionError(
+            'No connection available.')
+
+        assert_raises(ConnectionError, self.conn.get, 'key')
+        assert self.pool.get_connection.call_count == 1
+        assert not self.pool.disconnect.called
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_does_not_retry_other_errors(self, parse_response):
+        """Test SENTINEL commands are not retried on other errors"""
+        parse_response.side_effect = ResponseError('WRONGTYPE')
+
+        assert_raises(ResponseError, self.conn.get, 'key')
+        assert self.connection.send_command.call_count == 1
+        assert not self.connection.disconnect.called
+
+    @patch.object(RetryingStrictRedis, 'parse_response')
+    def test_commands_are_counted_by_job_metrics(self, parse_response):
+        """Test SENTINEL commands are counted in the metrics of a job"""
+        parse_response.return_value = 'PONG'
+        job_metrics.install()
+        metrics = job_metrics.start(MagicMock())
+        try:
+            self.conn.ping()
+        finally:
+            job_metrics._local.metrics = None
+
+        assert metrics.redis_calls == 1, metrics.redis_calls
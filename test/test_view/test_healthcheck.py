@@ -41,3 +41,39 @@ class TestHealthcheckView(web.Helper):
         json_res = json.loads(res.data)
         assert not json_res['redis_slave']
         assert json_res['redis_master']
+
+    @with_context
+    def test_job_metrics(self):
+        """Test job metrics are summarized in the Prometheus format"""
+        from pybossa import job_metrics
+        values = dict(count=1, failed=0, wait_time=2.0, run_time=4.0,
+                      sql_count=10, sql_time=0.5, redis_calls=3)
+        job_metrics.record('pybossa.jobs.warm_cache', values, 1024)
+        job_metrics.record('pybossa.jobs.warm_cache', values, 512)
+
+        summary = job_metrics.get_summary()
+        job = summary['pybossa.jobs.warm_cache']
+        assert job['count'] == 2, job
+        assert job['avg_run_time'] == 4.0, job
+        assert job['max_rss'] == 1024, job
+
+        res = self.app.get('/diagnostics/metrics')
+        assert res.status_code == 200, res.status_code
+        assert res.mimetype == 'text/plain', res.mimetype
+        line = 'pybossa_job_runs{job="pybossa.jobs.warm_cache"} 2.0'
+        assert line in res.data.splitlines(), res.data
+        assert 'pybossa_redis_pool_in_use{pool="master"}' in res.data, res.data
+
+    @with_context
+    def test_job_metrics_restricted(self):
+        """Test job metrics are only served to the allowed addresses and to
+        the admins"""
+        url = '/diagnostics/metrics'
+        environ = dict(REMOTE_ADDR='10.0.0.1')
+        res = self.app.get(url, environ_base=environ)
+        assert res.status_code == 403, res.status_code
+
+        self.register()
+        self.signin()
+        res = self.app.get(url, environ_base=environ)
+        assert res.status_code == 200, res.status_code
@@ -3164,7 +3164,9 @@ class TestWeb(web.Helper):
         res = self.app.get('project/%s/task/%s' % (project.short_name, task.id),
                            follow_redirects=True)
 
-        assert fake_guard_instance.stamp.called
+        assert fake_guard_instance.stamp_many.called
+        _, kwargs = fake_guard_instance.stamp_many.call_args
+        assert kwargs == dict(extend_presented=False), kwargs
 
     @with_context
     @patch('pybossa.view.projects.ContributionsGuard')
@@ -3180,7 +3182,7 @@ class TestWeb(web.Helper):
         res = self.app_get_json('project/%s/task/%s' % (project.short_name, task.id))
         print res.data
 
-        assert fake_guard_instance.stamp.called
+        assert fake_guard_instance.stamp_many.called
 
 
     @with_context
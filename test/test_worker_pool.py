@@ -0,0 +1,70 @@
+# -*- coding: utf8 -*-
+# This file is part of PYBOSSA.
+#
+# Copyright (C) 2018 Scifabric LTD.
+#
+# PYBOSSA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PYBOSSA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PYBOSSA.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+
+from mock import patch, MagicMock
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+
+from default import Test, with_context
+from pybossa.core import sentinel
+from pybossa.worker_pool import PrewarmedWorker, ThreadWorker
+
+
+class TestThreadWorker(Test):
+
+    @with_context
+    @patch('pybossa.worker_pool.Queue.dequeue_any')
+    def test_performs_jobs_until_stopped(self, dequeue_any):
+        """Test WORKER POOL thread worker performs jobs in place and stops
+        once the stop event is set."""
+        stop_event = threading.Event()
+        queue = Queue('email', connection=sentinel.master)
+        job = MagicMock()
+        worker = ThreadWorker([queue], stop_event, name='test',
+                              connection=sentinel.master)
+
+        def stop(*args, **kwargs):
+            stop_event.set()
+            raise DequeueTimeout(5)
+
+        dequeue_any.side_effect = [(job, queue), stop]
+        with patch.object(worker, 'perform_job') as perform_job:
+            worker.work()
+
+        perform_job.assert_called_once_with(job)
+        assert dequeue_any.call_count == 2, dequeue_any.call_count
+
+
+class TestPrewarmedWorker(Test):
+
+    @with_context
+    @patch('pybossa.worker_pool.os.fork')
+    def test_work_performs_jobs_without_forking(self, fork):
+        """Test WORKER POOL process worker performs the jobs of a real
+        work loop in place, without forking a work horse."""
+        queue = Queue('test_worker_pool', connection=sentinel.master)
+        job = queue.enqueue(len, 'abc')
+        worker = PrewarmedWorker([queue], name='test',
+                                 connection=sentinel.master)
+
+        assert worker.work(burst=True) is True
+
+        assert not fork.called
+        assert job.result == 3, job.result
+        assert queue.count == 0, queue.count